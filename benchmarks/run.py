@@ -0,0 +1,247 @@
+"""
+Benchmark suite of VectorAttributes on synthetic scenes, see benchmarks/synthetic.py
+
+    python -m benchmarks.run                       # full suite, results in benchmarks/results
+    python -m benchmarks.run --quick               # small scenes only
+    python -m benchmarks.run compare old.jsonl new.jsonl
+
+Each run writes one json lines file: a 'meta' record with the commit, library versions and machine, then one record per
+benchmark and scene with the latency per feature (mean, median, p95, min, max in seconds), the throughput in features
+per second and for DSMCalc the time of each stage.  compare matches the records of two files by benchmark and scene
+and prints the ratio of their times
+"""
+from benchmarks.synthetic import CRS, write_scene
+from collections import defaultdict
+from vectorattributes.dsmcalc import ArrayDSMCalc, DSMCalc
+from vectorattributes.dsmfootprint import DSMFootprint
+from vectorattributes.footprint import Footprint
+from vectorattributes.batch import DSMFootprintBatch
+from shapely.geometry import shape as get_shape
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import rasterio
+import shapely
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# (raster size in pixels, number of buildings) of the scenes, every scene is run with each outline
+SCENES = [(1000, 10), (1000, 100), (2000, 100), (2000, 1000), (4000, 1000), (4000, 4000)]
+QUICK_SCENES = [(500, 10), (1000, 100)]
+# (building size in metres, vertices of the outline)
+OUTLINES = [(20, 4), (20, 64)]
+
+DSMCALC_STAGES = ('read_dsm', 'rasterize_footprint', 'mask_dsm', 'null_data_error', 'mask_low_elevations',
+                  'comparison_factor', 'clip_max_heights', 'calculate_stats')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def meta():
+    return {'type': 'meta', 'commit': git_commit(), 'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'shapely': shapely.__version__,
+            'rasterio': rasterio.__version__, 'gdal': rasterio.__gdal_version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'system': platform.system(), 'cpus': os.cpu_count()}
+
+
+def summarize(latencies):
+    """
+    :param latencies: seconds per feature
+    :return: dict of the latency statistics and throughput
+    """
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = float(latencies.sum())
+    return {'count': int(latencies.size), 'total': total, 'mean': float(latencies.mean()),
+            'median': float(np.median(latencies)), 'p95': float(np.percentile(latencies, 95)),
+            'min': float(latencies.min()), 'max': float(latencies.max()),
+            'throughput': latencies.size / total if total else None}
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def stage_timer(cls, stages, timings):
+    """
+    :return: subclass of cls whose stage methods add their wall time to timings[stage]
+    """
+    def wrap(name, method):
+        def timed_method(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+        return timed_method
+    return type('Timed' + cls.__name__, (cls,), {name: wrap(name, getattr(cls, name)) for name in stages})
+
+
+def bench_footprint(features, rasters, repeat):
+    latencies = []
+    for feature in features:
+        latencies.append(min(timed(Footprint, copy.deepcopy(feature), CRS)[0] for _ in range(repeat)))
+    return summarize(latencies), None
+
+
+def bench_dsmcalc(features, rasters, repeat, cls=DSMCalc):
+    timings = defaultdict(float)
+    timed_cls = stage_timer(cls, DSMCALC_STAGES, timings)
+    latencies = []
+    geometries = [get_shape(feature['geometry']) for feature in features]
+    for _ in range(repeat):
+        run = []
+        for geometry in geometries:
+            seconds, _ = timed(lambda: DSMFootprint.full_dsm_operations(timed_cls(rasters['dsm'], geometry),
+                                                                        test_dist=True))
+            run.append(seconds)
+        latencies = run if not latencies else np.minimum(latencies, run)
+    return summarize(latencies), {stage: timings[stage] / repeat for stage in DSMCALC_STAGES}
+
+
+def bench_array_dsmcalc(features, rasters, repeat):
+    return bench_dsmcalc(features, rasters, repeat, cls=ArrayDSMCalc)
+
+
+def dsm_footprint(feature, rasters):
+    return DSMFootprint(copy.deepcopy(feature), CRS, rasters['dsm'], CRS, tree_dsm=rasters['tree_dsm'],
+                        tree_dsm_crs=CRS, dem=rasters['dtm'], dem_crs=CRS).output_geojson()
+
+
+def bench_dsmfootprint(features, rasters, repeat):
+    latencies = []
+    for feature in features:
+        latencies.append(min(timed(dsm_footprint, feature, rasters)[0] for _ in range(repeat)))
+    return summarize(latencies), None
+
+
+def bench_zonal_batch(features, rasters, repeat):
+    """
+    The zonal batch mode has no per feature latency, its total time is spread evenly over the features
+    """
+    def run():
+        batch = DSMFootprintBatch(copy.deepcopy(features), CRS, rasters['dsm'], CRS, tree_dsm=rasters['tree_dsm'],
+                                  tree_dsm_crs=CRS, dem=rasters['dtm'], dem_crs=CRS, zonal=True)
+        return batch.output_geojson()
+    seconds = min(timed(run)[0] for _ in range(repeat))
+    return summarize([seconds / len(features)] * len(features)), None
+
+
+BENCHMARKS = {
+    'footprint': bench_footprint,
+    'dsmcalc': bench_dsmcalc,
+    'array_dsmcalc': bench_array_dsmcalc,
+    'dsmfootprint': bench_dsmfootprint,
+    'zonal_batch': bench_zonal_batch
+}
+
+
+def run_suite(scenes, outlines, benchmarks, data_directory, output, repeat=3, max_features=None, log=sys.stderr):
+    """
+    Run every benchmark on every scene and write the records as json lines
+    :param max_features: time at most this many features of a scene with the per feature benchmarks
+    :return: list of the records written
+    """
+    records = [meta()]
+    output.write(json.dumps(records[0]) + '\n')
+    for raster_size, count in scenes:
+        for size, vertices in outlines:
+            paths = write_scene(data_directory, raster_size, count, size=size, vertices=vertices)
+            with open(paths['footprints']) as src:
+                features = json.load(src)['features'][:max_features]
+            with rasterio.open(paths['dsm']) as dsm, rasterio.open(paths['tree_dsm']) as tree_dsm, \
+                    rasterio.open(paths['dtm']) as dtm:
+                rasters = {'dsm': dsm, 'tree_dsm': tree_dsm, 'dtm': dtm}
+                for name in benchmarks:
+                    latency, stages = BENCHMARKS[name](features, rasters, repeat)
+                    record = {'type': 'benchmark', 'benchmark': name, 'raster_size': raster_size, 'buildings': count,
+                              'building_size': size, 'vertices': vertices, 'repeat': repeat, 'latency': latency}
+                    if stages is not None:
+                        record['stages'] = stages
+                    output.write(json.dumps(record) + '\n')
+                    output.flush()
+                    records.append(record)
+                    log.write('{benchmark:>14} {raster_size:>5}px {buildings:>5} buildings {vertices:>3} vertices: '
+                              '{mean:.6f} s/feature, {throughput:.1f} features/s\n'.format(
+                                  mean=latency['mean'], throughput=latency['throughput'] or 0, **record))
+    return records
+
+
+def record_key(record):
+    return tuple(record[key] for key in ('benchmark', 'raster_size', 'buildings', 'building_size', 'vertices'))
+
+
+def read_records(path):
+    with open(path) as src:
+        return [json.loads(line) for line in src if line.strip()]
+
+
+def compare(old_path, new_path, threshold=1.1, output=sys.stdout):
+    """
+    Print the ratio of the mean latency of the matching records of two result files
+    :param threshold: ratios above it are marked as regressions
+    :return: list of the keys of the regressions
+    """
+    old = {record_key(record): record for record in read_records(old_path) if record['type'] == 'benchmark'}
+    regressions = []
+    for record in read_records(new_path):
+        if record['type'] != 'benchmark' or record_key(record) not in old:
+            continue
+        ratio = record['latency']['mean'] / old[record_key(record)]['latency']['mean']
+        marker = ''
+        if ratio > threshold:
+            marker = '  REGRESSION'
+            regressions.append(record_key(record))
+        output.write('{:>14} {:>5}px {:>5} buildings {:>3}m {:>3} vertices: {:.3f}x{}\n'.format(
+            *record_key(record), ratio, marker))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark VectorAttributes on synthetic scenes')
+    subparsers = parser.add_subparsers(dest='command')
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=1.1)
+    parser.add_argument('--quick', action='store_true', help='run the small scenes only')
+    parser.add_argument('--benchmark', action='append', choices=sorted(BENCHMARKS),
+                        help='benchmark to run, can be repeated, all if not given')
+    parser.add_argument('--repeat', type=int, default=3, help='the best of repeat runs is recorded')
+    parser.add_argument('--max-features', type=int, default=None,
+                        help='time at most this many features of each scene')
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'vectorattributes_benchmarks'),
+                        help='directory of the synthetic scenes, reused between runs')
+    parser.add_argument('--output', default=None, help='result file, a new file in benchmarks/results if not given')
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        return 1 if compare(args.old, args.new, threshold=args.threshold) else 0
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = os.path.join(RESULTS_DIRECTORY, '{}_{}.jsonl'.format(
+            datetime.datetime.now().strftime('%Y%m%dT%H%M%S'), git_commit() or 'unknown'))
+    with open(output, 'w') as dst:
+        run_suite(QUICK_SCENES if args.quick else SCENES, OUTLINES, args.benchmark or list(BENCHMARKS), args.data,
+                  dst, repeat=args.repeat, max_features=args.max_features)
+    sys.stderr.write('results written to {}\n'.format(output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Synthetic scenes for the benchmarks: a DTM, a DSM and a tree masked DSM GeoTIFF with buildings, trees and a patch of
+nodata, and the footprints of the buildings.  Every scene is generated from a seed, so the same parameters give the
+same files on every machine
+"""
+import json
+import math
+import os
+import numpy as np
+import rasterio
+import rasterio.features
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon, mapping
+
+CRS = {'init': 'epsg:32610'}
+ORIGIN = (552400, 4182300)
+RESOLUTION = 0.5
+NODATA = -9999
+# Footprints keep this distance from the raster edges, more than the ground buffer of Footprint
+MARGIN = 10
+
+
+def building_polygon(center, size, vertices, rotation):
+    """
+    :param center: tuple(x, y) of the building
+    :param size: diameter of the building in metres
+    :param vertices: number of vertices of the outline, 4 gives a rectangle
+    :return: shapely Polygon of the footprint
+    """
+    if vertices == 4:
+        half = size / 2.
+        corners = [(-half, -half * 0.6), (half, -half * 0.6), (half, half * 0.6), (-half, half * 0.6)]
+    else:
+        # an irregular outline, the radius changes along the outline like the recesses of a real building
+        angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+        radii = size / 2. * (0.8 + 0.2 * np.cos(3 * angles))
+        corners = list(zip(radii * np.cos(angles), radii * np.sin(angles)))
+    cos, sin = math.cos(rotation), math.sin(rotation)
+    return Polygon([(center[0] + x * cos - y * sin, center[1] + x * sin + y * cos) for x, y in corners])
+
+
+def building_footprints(raster_size, count, size, vertices, seed=0):
+    """
+    Footprints of count buildings spread over a jittered grid of the raster area, so their density grows with count
+    :return: list of geojson features in CRS
+    """
+    state = np.random.RandomState(seed)
+    extent = raster_size * RESOLUTION - 2 * MARGIN - size
+    per_row = max(int(math.ceil(math.sqrt(count))), 1)
+    cell = extent / per_row
+    features = []
+    for index in range(count):
+        row, col = divmod(index, per_row)
+        jitter = state.uniform(0, max(cell - size, 0), 2)
+        center = (ORIGIN[0] + MARGIN + size / 2. + col * cell + jitter[0],
+                  ORIGIN[1] - MARGIN - size / 2. - row * cell - jitter[1])
+        polygon = building_polygon(center, size, vertices, state.uniform(0, math.pi))
+        features.append({'type': 'Feature', 'properties': {'id': index, 'height': round(state.uniform(3, 30), 2)},
+                         'geometry': mapping(polygon)})
+    return features
+
+
+def surfaces(raster_size, features, seed=0):
+    """
+    :return: tuple(dtm, dsm, tree masked dsm) float32 arrays.  The dtm is a gentle slope with hills, the dsm adds
+    the buildings, trees and noise, and the tree masked dsm is the dsm without the trees
+    """
+    state = np.random.RandomState(seed)
+    transform = from_origin(ORIGIN[0], ORIGIN[1], RESOLUTION, RESOLUTION)
+    rows, cols = np.mgrid[0:raster_size, 0:raster_size].astype(np.float32)
+    dtm = 20 + 0.01 * rows + 2 * np.sin(cols / 150.) * np.cos(rows / 200.)
+    buildings = rasterio.features.rasterize(
+        [(feature['geometry'], feature['properties']['height']) for feature in features],
+        out_shape=(raster_size, raster_size), transform=transform, fill=0, dtype=np.float32) if features else 0
+    tree_dsm = dtm + buildings + state.normal(0, 0.15, (raster_size, raster_size))
+    trees = np.zeros((raster_size, raster_size), dtype=np.float32)
+    for _ in range(raster_size // 20):
+        row, col, radius = state.randint(0, raster_size), state.randint(0, raster_size), state.randint(4, 12)
+        crown = (rows - row) ** 2 + (cols - col) ** 2 < radius ** 2
+        trees[crown] = np.maximum(trees[crown], state.uniform(5, 15))
+    dsm = np.maximum(tree_dsm, dtm + trees)
+    for array in (dtm, dsm, tree_dsm):
+        array[:8, :8] = NODATA
+    return dtm.astype(np.float32), dsm.astype(np.float32), tree_dsm.astype(np.float32)
+
+
+def write_raster(path, data, **profile):
+    meta = {'driver': 'GTiff', 'height': data.shape[0], 'width': data.shape[1], 'count': 1, 'dtype': 'float32',
+            'crs': 'EPSG:32610', 'transform': from_origin(ORIGIN[0], ORIGIN[1], RESOLUTION, RESOLUTION),
+            'nodata': NODATA}
+    meta.update(profile)
+    with rasterio.open(path, 'w', **meta) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def write_scene(directory, raster_size, count, size=20, vertices=4, seed=0, **profile):
+    """
+    Write a synthetic scene, or reuse it if it was already written with the same parameters
+    :param raster_size: width and height of the rasters in pixels
+    :param count: number of buildings
+    :param size: diameter of the buildings in metres
+    :param vertices: number of vertices of the building outlines
+    :param profile: creation options of the rasters, Ex. compress='lzw', tiled=True
+    :return: dict of the paths of 'dsm', 'tree_dsm', 'dtm' and 'footprints' (a FeatureCollection file)
+    """
+    suffix = ''.join('_{}-{}'.format(key, value) for key, value in sorted(profile.items()))
+    name = 'scene_{}_{}_{}_{}_{}{}'.format(raster_size, count, size, vertices, seed, suffix)
+    scene = os.path.join(directory, name)
+    paths = {key: os.path.join(scene, key + '.tif') for key in ('dsm', 'tree_dsm', 'dtm')}
+    paths['footprints'] = os.path.join(scene, 'footprints.geojson')
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+    os.makedirs(scene, exist_ok=True)
+    features = building_footprints(raster_size, count, size, vertices, seed=seed)
+    dtm, dsm, tree_dsm = surfaces(raster_size, features, seed=seed)
+    for key, data in (('dsm', dsm), ('tree_dsm', tree_dsm), ('dtm', dtm)):
+        write_raster(paths[key], data, **profile)
+    with open(paths['footprints'], 'w') as dst:
+        json.dump({'type': 'FeatureCollection', 'features': features}, dst)
+    return paths
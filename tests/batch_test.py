@@ -0,0 +1,85 @@
+import copy
+import json
+import pytest
+from tests.test_structures import *
+from vectorattributes.batch import DSMFootprintBatch, process_collection
+from vectorattributes.dsmfootprint import DSMFootprint
+from vectorattributes.metrics import collect
+
+
+def feature_collection():
+    return {'type': 'FeatureCollection',
+            'features': [copy.deepcopy(valid_geojson_polygon_feature_wgs) for _ in range(3)]}
+
+
+def single_outputs(dsm, tree_dsm, dtm):
+    return [DSMFootprint(feature, {'init': 'epsg:4326'}, dsm, synthetic_raster_crs, tree_dsm=tree_dsm,
+                         tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs).output_geojson()
+            for feature in feature_collection()['features']]
+
+
+def test_batch_matches_single_feature_output(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    batch = process_collection(feature_collection(), {'init': 'epsg:4326'}, dsm, synthetic_raster_crs,
+                               tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm,
+                               dem_crs=synthetic_raster_crs)
+    assert batch['type'] == 'FeatureCollection'
+    assert json.dumps(batch['features'], sort_keys=True) == json.dumps(single_outputs(dsm, tree_dsm, dtm),
+                                                                       sort_keys=True)
+
+
+def test_batch_does_not_modify_input(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    collection = feature_collection()
+    DSMFootprintBatch(collection, {'init': 'epsg:4326'}, dsm, synthetic_raster_crs).output_geojson()
+    assert collection == feature_collection()
+
+
+def test_batch_feature_crs_from_collection(synthetic_rasters):
+    class Collection(list):
+        crs = {'init': 'epsg:4326'}
+    batch = DSMFootprintBatch(Collection(feature_collection()['features']), None, synthetic_rasters[0],
+                              synthetic_raster_crs)
+    assert batch.input_feature_crs == 'epsg:4326'
+
+
+def test_batch_prepares_chunks_and_checks_crs_once(synthetic_rasters, monkeypatch):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    features = [copy.deepcopy(valid_geojson_polygon_feature_wgs) for _ in range(5)]
+    checks = []
+    raster_crs_isvalid = DSMFootprint.raster_crs_isvalid
+    monkeypatch.setattr(DSMFootprint, 'raster_crs_isvalid',
+                        classmethod(lambda cls, *args: checks.append(args) or raster_crs_isvalid(*args)))
+    with collect() as stage_metrics:
+        outputs = process_collection(copy.deepcopy(features), {'init': 'epsg:4326'}, dsm, synthetic_raster_crs,
+                                     tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm,
+                                     dem_crs=synthetic_raster_crs, chunk_size=2)['features']
+    assert len(checks) == 1
+    assert stage_metrics.totals()['prepare_geometries']['calls'] == 3
+    assert stage_metrics.totals()['reproject_features']['calls'] == 3
+    assert json.dumps(outputs, sort_keys=True) == json.dumps(single_outputs(dsm, tree_dsm, dtm)[:1] * 5,
+                                                             sort_keys=True)
+
+
+def test_batch_rejects_mismatched_dem_crs(synthetic_rasters):
+    with pytest.raises(ValueError):
+        DSMFootprintBatch(feature_collection(), {'init': 'epsg:4326'}, synthetic_rasters[0], synthetic_raster_crs,
+                          dem=synthetic_rasters[2], dem_crs={'init': 'epsg:32611'})
+
+
+def test_batch_rejects_non_collection_dict(synthetic_rasters):
+    with pytest.raises(TypeError):
+        DSMFootprintBatch(valid_geojson_polygon_feature_wgs, {'init': 'epsg:4326'}, synthetic_rasters[0],
+                          synthetic_raster_crs)
+
+
+def test_batch_reads_feature_file(synthetic_rasters, tmp_path):
+    path = str(tmp_path / 'footprints.geojson')
+    with open(path, 'w') as dst:
+        json.dump(feature_collection(), dst)
+    dsm, tree_dsm, dtm = synthetic_rasters
+    batch = DSMFootprintBatch(path, None, dsm, synthetic_raster_crs, tree_dsm=tree_dsm,
+                              tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs)
+    assert batch.input_feature_crs == 'epsg:4326'
+    assert json.dumps(batch.output_geojson()['features'], sort_keys=True) == json.dumps(
+        single_outputs(dsm, tree_dsm, dtm), sort_keys=True)
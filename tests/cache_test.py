@@ -0,0 +1,49 @@
+import json
+import pytest
+from shapely import affinity
+from shapely.geometry import mapping, shape as get_shape
+from tests.test_structures import *
+from vectorattributes.batch import process_collection
+from vectorattributes.cache import ResultCache
+from vectorattributes.dsmfootprint import NEW_DEFAULT_PARAMS
+from vectorattributes.footprint import DEFAULT_PARAMS
+
+
+def run(rasters, features, zonal, result_cache=None):
+    dsm, tree_dsm, dtm = rasters
+    return json.dumps(process_collection(features, synthetic_raster_crs, dsm, synthetic_raster_crs, tree_dsm=tree_dsm,
+                                         tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs,
+                                         zonal=zonal, result_cache=result_cache), sort_keys=True)
+
+
+@pytest.mark.parametrize('zonal', [False, True])
+def test_cached_rerun_matches(synthetic_rasters, tmp_path, zonal):
+    features = scattered_features()
+    expected = run(synthetic_rasters, features, zonal)
+    cache = ResultCache(str(tmp_path / 'cache'))
+    assert run(synthetic_rasters, features, zonal, cache) == expected
+    assert cache.stats() == {'hits': 0, 'misses': len(features)}
+    assert run(synthetic_rasters, features, zonal, cache) == expected
+    assert cache.stats() == {'hits': len(features), 'misses': len(features)}
+
+
+def test_threshold_change_uses_cached_stats(synthetic_rasters, tmp_path, monkeypatch):
+    features = scattered_features()
+    cache = ResultCache(str(tmp_path / 'cache'))
+    run(synthetic_rasters, features, False, cache)
+    monkeypatch.setitem(NEW_DEFAULT_PARAMS['error_thresholds'], 'min_eave_height', 12)
+    expected = run(synthetic_rasters, features, False)
+    assert run(synthetic_rasters, features, False, cache) == expected
+    assert cache.hits == len(features)
+
+
+def test_edits_and_params_are_recalculated(synthetic_rasters, tmp_path, monkeypatch):
+    features = scattered_features()
+    cache = ResultCache(str(tmp_path / 'cache'))
+    run(synthetic_rasters, features, False, cache)
+    features[0]['geometry'] = mapping(affinity.translate(get_shape(features[0]['geometry']), 1, 1))
+    run(synthetic_rasters, features, False, cache)
+    assert cache.stats() == {'hits': len(features) - 1, 'misses': len(features) + 1}
+    monkeypatch.setitem(DEFAULT_PARAMS['spatial_calcs'], 'eave_buffer', -0.2)
+    assert run(synthetic_rasters, features, False, cache) == run(synthetic_rasters, features, False)
+    assert cache.misses == 2 * len(features) + 1
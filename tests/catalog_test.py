@@ -0,0 +1,80 @@
+import copy
+import json
+import pytest
+import rasterio
+from shapely import affinity
+from tests.test_structures import *
+from vectorattributes.batch import process_collection
+from vectorattributes.catalog import MosaicRaster, RasterCatalog, RasterPool, process_catalog
+
+# column ranges of the two overlapping scenes the synthetic rasters are cut into
+scene_columns = [(0, 480), (400, 1000)]
+
+
+def write_scene(raster, path, cols):
+    window = ((0, raster.height), cols)
+    meta = dict(raster.meta, width=cols[1] - cols[0], transform=raster.window_transform(window))
+    with rasterio.open(path, 'w', **meta) as dst:
+        dst.write(raster.read(1, window=window), 1)
+    return path
+
+
+@pytest.fixture(scope='module')
+def scenes(synthetic_rasters, tmp_path_factory):
+    directory = tmp_path_factory.mktemp('scenes')
+    return [{layer: write_scene(raster, str(directory / '{}_{}.tif'.format(layer, index)), cols)
+             for layer, raster in zip(('dsm', 'tree_dsm', 'dtm'), synthetic_rasters)}
+            for index, cols in enumerate(scene_columns)]
+
+
+def test_assign_scenes(scenes):
+    with RasterCatalog(scenes) as catalog:
+        assigned, seams, _ = catalog.assign(scattered_features(), 'epsg:32610')
+    assert assigned == {0: [2, 3, 4, 5], 1: [1]}
+    assert seams == [0]
+
+
+@pytest.mark.parametrize('zonal', [False, True])
+def test_catalog_matches_single_raster(synthetic_rasters, scenes, zonal):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    features = scattered_features()
+    expected = process_collection(copy.deepcopy(features), synthetic_raster_crs, dsm, synthetic_raster_crs,
+                                  tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm,
+                                  dem_crs=synthetic_raster_crs, zonal=zonal)['features']
+    with RasterCatalog(scenes) as catalog:
+        results = dict((index, footprint.output_geojson()) for index, footprint in
+                       process_catalog(copy.deepcopy(features), synthetic_raster_crs, catalog, zonal=zonal))
+        assert catalog.pool.opens == 6
+    assert json.dumps([results[index] for index in range(len(features))], sort_keys=True) == \
+        json.dumps(expected, sort_keys=True)
+
+
+def test_mosaic_matches_raster(synthetic_rasters, scenes):
+    dsm = synthetic_rasters[0]
+    with RasterPool() as pool:
+        mosaic = MosaicRaster([pool.get(scene['dsm']) for scene in scenes], (552590.2, 4182020.1, 552650, 4182100))
+        assert mosaic.transform.c == 552590 and mosaic.transform.f == 4182100
+        window = dsm.window(*mosaic.bounds)
+        assert np.array_equal(mosaic.read(1), dsm.read(1, window=window))
+
+
+def test_uncovered_footprint_raises(scenes):
+    outside = copy.deepcopy(valid_geojson_polygon_feature_utm)
+    outside['geometry'] = mapping(affinity.translate(get_shape(outside['geometry']), 500, 0))
+    with RasterCatalog(scenes) as catalog:
+        with pytest.raises(ValueError):
+            list(process_catalog([outside], synthetic_raster_crs, catalog))
+
+
+def test_pool_closes_least_recently_used(scenes):
+    with RasterPool(max_open=3) as pool:
+        handles = [pool.get(path) for path in scenes[0].values()]
+        assert pool.get(scenes[0]['dsm']) is handles[0]
+        pool.get(scenes[1]['dsm'])
+        assert handles[1].closed and not handles[0].closed
+        assert (pool.opens, pool.hits, len(pool)) == (4, 1, 3)
+
+
+def test_catalog_checks_layers(scenes):
+    with pytest.raises(ValueError):
+        RasterCatalog([scenes[0], scenes[1]['dsm']])
@@ -0,0 +1,66 @@
+import json
+import os
+import pytest
+from tests.test_structures import scattered_features
+from vectorattributes.cli import checkpoint_path, main, read_checkpoint, run_checkpointed, write_checkpoint
+
+
+def write_footprints(path):
+    features = scattered_features()
+    with open(path, 'w') as dst:
+        json.dump({'type': 'FeatureCollection', 'crs': {'type': 'name', 'properties': {'name': 'EPSG:32610'}},
+                   'features': features}, dst)
+    return features
+
+
+def test_run_and_resume_after_crash(synthetic_rasters, tmp_path):
+    footprints = str(tmp_path / 'footprints.geojson')
+    output = str(tmp_path / 'out.ndjson')
+    features = write_footprints(footprints)
+    dsm, tree_dsm, dtm = [raster.name for raster in synthetic_rasters]
+    assert run_checkpointed(footprints, dsm, output, tree_dsm_path=tree_dsm, dtm_path=dtm, workers=2,
+                            chunk_size=2) == len(features)
+    with open(output) as src:
+        expected = src.read()
+    assert len(expected.splitlines()) == len(features)
+    assert read_checkpoint(checkpoint_path(output))['features'] == len(features)
+    assert run_checkpointed(footprints, dsm, output, tree_dsm_path=tree_dsm, dtm_path=dtm, workers=2) == 0
+
+    # a crash after the first chunk, with part of the second chunk written but not committed
+    checkpoint = read_checkpoint(checkpoint_path(output))
+    lines = expected.splitlines(True)
+    checkpoint.update(features=2, bytes=len(''.join(lines[:2])))
+    write_checkpoint(checkpoint_path(output), checkpoint)
+    with open(output, 'w') as dst:
+        dst.write(''.join(lines[:3]) + lines[3][:10])
+    assert run_checkpointed(footprints, dsm, output, tree_dsm_path=tree_dsm, dtm_path=dtm, workers=2,
+                            chunk_size=2) == len(features) - 2
+    with open(output) as src:
+        assert src.read() == expected
+
+    # an output lost or cut short after its checkpoint was written cannot be resumed
+    checkpoint.update(features=2, bytes=len(''.join(lines[:2])))
+    write_checkpoint(checkpoint_path(output), checkpoint)
+    with open(output, 'w') as dst:
+        dst.write(lines[0])
+    with pytest.raises(RuntimeError):
+        run_checkpointed(footprints, dsm, output, tree_dsm_path=tree_dsm, dtm_path=dtm, workers=2)
+    os.remove(output)
+    with pytest.raises(RuntimeError):
+        run_checkpointed(footprints, dsm, output, tree_dsm_path=tree_dsm, dtm_path=dtm, workers=2)
+
+
+def test_checkpoint_of_other_inputs(synthetic_rasters, tmp_path):
+    footprints = str(tmp_path / 'footprints.geojson')
+    output = str(tmp_path / 'out.ndjson')
+    features = write_footprints(footprints)
+    dsm = synthetic_rasters[0].name
+    run_checkpointed(footprints, dsm, output, workers=1)
+    with pytest.raises(RuntimeError):
+        run_checkpointed(footprints, dsm, output, dtm_path=synthetic_rasters[2].name, workers=1)
+    with pytest.raises(ValueError):
+        run_checkpointed(footprints, dsm, output, output_format='featurecollection')
+    assert main([footprints, dsm, '--dtm', synthetic_rasters[2].name, '-o', output, '--restart', '--quiet',
+                 '--workers', '1', '--chunk-size', '3', '--cache-mb', '16']) == 0
+    with open(output) as src:
+        assert len([json.loads(line) for line in src]) == len(features)
@@ -0,0 +1,78 @@
+import pytest
+from tests.test_structures import *
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.columns import ResultColumns, column_schema
+from shapely import wkb
+from shapely.geometry import shape as get_shape
+
+
+def batch(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    return DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs, tree_dsm=tree_dsm,
+                             tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs)
+
+
+def assert_same(column_value, output_value):
+    if isinstance(output_value, float) and np.isnan(output_value):
+        assert np.isnan(column_value)
+    else:
+        assert column_value == output_value
+
+
+def test_columns_match_output_geojson(synthetic_rasters):
+    results = batch(synthetic_rasters).columns(properties=['id'])
+    outputs = batch(synthetic_rasters).output_geojson()['features']
+    columns = results.columns()
+    assert len(results) == len(outputs)
+    assert set(columns) == set(name for name, _ in column_schema()) | {'id'}
+    for row, output in enumerate(outputs):
+        calculated = output['properties']['calculated_properties']
+        assert_same(columns['height_max'][row], calculated['height_max'])
+        for zone in ('ground', 'eave', 'roof'):
+            for stat, value in calculated[zone].items():
+                assert_same(columns['{}_{}'.format(zone, stat)][row], value)
+        for name, value in output['properties']['errors']['calculated_properties'].items():
+            assert columns['error_' + name][row] == value
+        assert columns['error_buffer0'][row] == output['properties']['errors']['footprint']['geometry']['buffer0']
+        assert columns['error_dsm_null'][row] == output['properties']['errors']['footprint']['dsm_null']
+        assert columns['id'][row] == output['properties']['original_properties']['id']
+        assert wkb.loads(results.geometry_wkb()[row]).equals_exact(get_shape(output['geometry']), 1e-9)
+
+
+def test_columns_grow(synthetic_rasters):
+    results = ResultColumns(size=1).extend(batch(synthetic_rasters).process())
+    assert len(results) == len(scattered_features())
+    assert results.capacity >= len(results)
+    assert np.isfinite(results.columns()['roof_max']).all()
+
+
+def test_structured_array(synthetic_rasters):
+    results = batch(synthetic_rasters).columns()
+    array = results.to_structured_array()
+    assert len(array) == len(results)
+    assert np.array_equal(array['roof_median'], results.columns()['roof_median'])
+    assert array['geometry'][0] == results.geometry_wkb()[0]
+
+
+def test_arrow_and_parquet(synthetic_rasters, tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    results = batch(synthetic_rasters).columns()
+    table = results.to_arrow()
+    assert table.num_rows == len(results)
+    assert table.column('roof_max').type == pyarrow.float64()
+    assert table.column('roof_pitch').type == pyarrow.string()
+    path = str(tmp_path / 'results.parquet')
+    results.to_parquet(path)
+    read = pyarrow.parquet.read_table(path)
+    assert read.column('eave_median').to_pylist() == list(results.columns()['eave_median'])
+    assert b'geo' in read.schema.metadata
+
+
+def test_geodataframe(synthetic_rasters):
+    pytest.importorskip('geopandas')
+    results = batch(synthetic_rasters).columns()
+    frame = results.to_geodataframe()
+    assert len(frame) == len(results)
+    assert frame.crs.to_epsg() == 4326
+    assert list(frame['roof_max']) == list(results.columns()['roof_max'])
@@ -0,0 +1,16 @@
+import pytest
+import rasterio
+from tests.test_structures import write_synthetic_raster
+
+
+@pytest.fixture(scope='session')
+def synthetic_rasters(tmp_path_factory):
+    """ Returns open (dsm, tree_dsm, dtm) rasters covering valid_geojson_polygon_feature_utm """
+    directory = tmp_path_factory.mktemp('rasters')
+    paths = (write_synthetic_raster(str(directory / 'dsm.tif'), 10, 15),
+             write_synthetic_raster(str(directory / 'tree_dsm.tif'), 10, 14, seed=1),
+             write_synthetic_raster(str(directory / 'dtm.tif'), 10, 0, seed=2))
+    handles = [rasterio.open(path) for path in paths]
+    yield handles
+    for handle in handles:
+        handle.close()
@@ -0,0 +1,113 @@
+import copy
+import json
+import numpy as np
+import pytest
+import rasterio
+from shapely import affinity
+from tests.test_structures import *
+from vectorattributes.dsmcalc import ArrayDSMCalc, DSMCalc, sorted_median, sorted_mode, sorted_percentile
+from vectorattributes.dsmfootprint import DSMFootprint
+
+valid_shapely_polygon_feature_utm = get_shape(valid_geojson_polygon_feature_utm['geometry'])
+random_values = np.sort(np.random.RandomState(0).rand(101).astype('float32') * 40)
+
+
+@pytest.mark.parametrize('q', [0, 10, 25, 50, 75, 90, 100])
+def test_sorted_percentile(q):
+    assert sorted_percentile(random_values, q) == np.percentile(random_values, q)
+    assert sorted_percentile(random_values[:-1], q) == np.percentile(random_values[:-1], q)
+
+
+def test_sorted_median():
+    assert sorted_median(random_values) == np.median(random_values)
+    assert sorted_median(random_values[:-1]) == np.median(random_values[:-1])
+
+
+def test_sorted_mode():
+    assert sorted_mode(np.array([1., 2., 2., 3., 3., 3., 4., 4.])) == (3., 1.)
+
+
+def test_sorted_mode_ties_lowest():
+    assert sorted_mode(np.array([1., 1., 2., 2., 5.])) == (1., 5.)
+
+
+def test_calculate_stats_new_values(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    calc = DSMFootprint.full_dsm_operations(DSMCalc(dsm, valid_shapely_polygon_feature_utm), test_dist=True)
+    compressed = calc.masked_dsm.compressed()
+    assert calc.values['range'] == round(float(compressed.max()) - float(compressed.min()), 5)
+    assert calc.values['area'] == calc.values['pixel_count'] * 0.25
+    assert calc.values['coverage'] == 1
+    assert calc.values['min'] <= calc.values['mode'] <= calc.values['max']
+
+
+def test_coverage_counts_clipped_pixels(synthetic_rasters):
+    # the window has no nodata, the pixels above height_max are masked but still touch the footprint
+    dsm = synthetic_rasters[0]
+    calc = DSMFootprint.full_dsm_operations(DSMCalc(dsm, valid_shapely_polygon_feature_utm, height_max=15),
+                                            test_dist=True)
+    assert calc.values['pixel_count'] == 674
+    assert np.count_nonzero(~calc.footprint_mask) == 54970
+    assert calc.values['coverage'] == 0.01226
+
+
+def test_clip_max_heights_uses_sorted_pixels(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    calc = DSMCalc(dsm, valid_shapely_polygon_feature_utm, height_max=25.5)
+    calc.mask_low_elevations()
+    calc.clip_max_heights()
+    assert calc.sorted_dsm.max() <= 25.5
+    assert np.array_equal(calc.sorted_dsm, np.sort(calc.masked_dsm.compressed()))
+
+
+def write_rough_dsm(synthetic_rasters, directory, nodata_hole):
+    """ The synthetic dsm with negative and low elevations, a spike on the building and optionally a nodata hole """
+    with rasterio.open(synthetic_rasters[0].name) as src:
+        data, profile = src.read(1), src.profile
+    if nodata_hole:
+        data[300:330, 300:400] = -9999
+    data[400:420, 250:270] = -500
+    data[420:440, 250:270] = -3
+    data[395:405, 395:400] += 60
+    path = str(directory / 'dsm.tif')
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data, 1)
+    return rasterio.open(path)
+
+
+@pytest.fixture(scope='module')
+def rough_dsm(synthetic_rasters, tmp_path_factory):
+    with write_rough_dsm(synthetic_rasters, tmp_path_factory.mktemp('rough'), True) as dsm:
+        yield dsm
+
+
+@pytest.fixture(scope='module')
+def low_dsm(synthetic_rasters, tmp_path_factory):
+    """ The rough dsm without the nodata hole, the footprint windows have no nodata """
+    with write_rough_dsm(synthetic_rasters, tmp_path_factory.mktemp('low'), False) as dsm:
+        yield dsm
+
+
+@pytest.fixture(scope='module')
+def clean_dsm(synthetic_rasters):
+    return synthetic_rasters[0]
+
+
+@pytest.mark.parametrize('raster', ['rough_dsm', 'low_dsm', 'clean_dsm'])
+@pytest.mark.parametrize('offset', [(0, 0), (-80, 40), (-20, -10)])
+@pytest.mark.parametrize('height_max', [np.NaN, 21.5])
+def test_array_dsm_calc_matches_dsm_calc(request, raster, offset, height_max):
+    dsm = request.getfixturevalue(raster)
+    geometry = affinity.translate(valid_shapely_polygon_feature_utm, *offset)
+    calcs = [DSMFootprint.full_dsm_operations(calc(dsm, geometry, height_max=height_max), test_dist=True)
+             for calc in (DSMCalc, ArrayDSMCalc)]
+    assert calcs[0].errors == calcs[1].errors
+    assert json.dumps(calcs[0].values.to_dict()) == json.dumps(calcs[1].values.to_dict())
+
+
+def test_dsmfootprint_unmasked_matches_masked(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    outputs = [DSMFootprint(copy.deepcopy(valid_geojson_polygon_feature_utm), synthetic_raster_crs, dsm,
+                            synthetic_raster_crs, tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm,
+                            dem_crs=synthetic_raster_crs, masked=masked).output_geojson() for masked in (True, False)]
+    assert json.dumps(outputs[0], sort_keys=True) == json.dumps(outputs[1], sort_keys=True)
@@ -0,0 +1,99 @@
+import copy
+import json
+import numpy as np
+from tests.test_structures import *
+from affine import Affine
+from vectorattributes import dsmfootprint
+from vectorattributes.dsmcalc import DSMCalc, RasterWindow, StackedWindow, aligned_grids, read_masked
+from vectorattributes.dsmfootprint import DSMFootprint
+
+valid_shapely_polygon_feature_utm = get_shape(valid_geojson_polygon_feature_utm['geometry'])
+
+
+def run_dsm_footprint(dsm, tree_dsm=None, dtm=None):
+    return DSMFootprint(copy.deepcopy(valid_geojson_polygon_feature_utm), synthetic_raster_crs, dsm,
+                        synthetic_raster_crs, tree_dsm=tree_dsm,
+                        tree_dsm_crs=synthetic_raster_crs if tree_dsm else None,
+                        dem=dtm, dem_crs=synthetic_raster_crs if dtm else None)
+
+
+def test_raster_window_slice_matches_read(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    raster_window = RasterWindow(dsm, [valid_shapely_polygon_feature_utm.buffer(6.2)])
+    calc = DSMCalc(dsm, valid_shapely_polygon_feature_utm)
+    window = calc.get_window_from_bounds()
+    sliced = raster_window.read(window)
+    direct = read_masked(dsm, window)
+    assert np.array_equal(sliced.data, direct.data)
+    assert np.array_equal(np.ma.getmaskarray(sliced), np.ma.getmaskarray(direct))
+    assert sliced.fill_value == direct.fill_value
+
+
+def test_raster_window_reads_uncovered_window(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    raster_window = RasterWindow(dsm, [valid_shapely_polygon_feature_utm.buffer(-30)])
+    calc = DSMCalc(dsm, valid_shapely_polygon_feature_utm)
+    assert raster_window.contains(calc.get_window_from_bounds()) is False
+    assert raster_window.read(calc.get_window_from_bounds()).shape == calc.dsm_data.shape
+
+
+def test_dsm_calc_values_with_raster_window(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    raster_window = RasterWindow(dsm, [valid_shapely_polygon_feature_utm])
+    shared = DSMFootprint.full_dsm_operations(DSMCalc(dsm, valid_shapely_polygon_feature_utm,
+                                                      raster_window=raster_window), test_dist=True)
+    separate = DSMFootprint.full_dsm_operations(DSMCalc(dsm, valid_shapely_polygon_feature_utm), test_dist=True)
+    assert shared.values == separate.values
+    assert shared.errors == separate.errors
+
+
+def test_single_read_per_raster(synthetic_rasters):
+    dsm, tree_dsm, dtm = [CountingRaster(raster) for raster in synthetic_rasters]
+    run_dsm_footprint(dsm, tree_dsm, dtm)
+    assert (dsm.reads, tree_dsm.reads, dtm.reads) == (1, 1, 1)
+
+
+def test_single_read_dsm_only(synthetic_rasters):
+    dsm = CountingRaster(synthetic_rasters[0])
+    run_dsm_footprint(dsm)
+    assert dsm.reads == 1
+
+
+class ShiftedRaster(CountingRaster):
+    """ Wraps a rasterio dataset with its grid moved by one pixel """
+    @property
+    def transform(self):
+        return self.raster.transform * Affine.translation(1, 0)
+
+
+def test_aligned_grids(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    assert aligned_grids([dsm, None, dtm])
+    assert aligned_grids([dsm, tree_dsm, dtm])
+    assert not aligned_grids([dsm, ShiftedRaster(tree_dsm), dtm])
+
+
+def test_stacked_read_matches_separate_reads(synthetic_rasters, monkeypatch):
+    stacked = run_dsm_footprint(*synthetic_rasters)
+    assert stacked.stacked
+    monkeypatch.setattr(dsmfootprint, 'aligned_grids', lambda rasters: False)
+    separate = run_dsm_footprint(*synthetic_rasters)
+    assert not separate.stacked
+    assert json.dumps(stacked.output_geojson()) == json.dumps(separate.output_geojson())
+
+
+def test_stacked_window_reads_each_raster_once(synthetic_rasters):
+    dsm, _, dtm = [CountingRaster(raster) for raster in synthetic_rasters]
+    stack = StackedWindow([dsm, dsm, dtm], [valid_shapely_polygon_feature_utm.buffer(6.2)])
+    assert stack.stack.shape[0] == 2
+    assert (dsm.reads, dtm.reads) == (1, 1)
+    assert np.array_equal(stack.layer(dtm).data, read_masked(dtm, stack.window).data)
+
+
+def test_stacked_layers_share_footprint_mask(synthetic_rasters):
+    dsm, _, dtm = synthetic_rasters
+    stack = StackedWindow([dsm, dtm], [valid_shapely_polygon_feature_utm])
+    dsm_calc = DSMCalc(dsm, valid_shapely_polygon_feature_utm, raster_window=RasterWindow(dsm, [], stack=stack))
+    dtm_calc = DSMCalc(dtm, valid_shapely_polygon_feature_utm, raster_window=RasterWindow(dtm, [], stack=stack))
+    assert len(stack.masks) == 1
+    assert np.array_equal(dsm_calc.rasterize_footprint(), dtm_calc.rasterize_footprint())
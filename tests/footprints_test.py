@@ -39,3 +39,21 @@ def test_invalid_get_polygon_buffer_error():
 # TODO need a shape that would require a convex hull
 # def test_invalid_get_polygon_convex_hull():
 #     raise NotImplementedError
+
+
+def test_projected_footprint_keeps_working_crs():
+    wgs = Footprint(valid_geojson_polygon_feature_wgs, {'init': 'epsg:4326'})
+    projected = Footprint(valid_geojson_polygon_feature_wgs, {'init': 'epsg:4326'}, projected=True)
+    assert projected.geometry_crs == projected.working_crs == 'EPSG:32610'
+    assert round_shapely_object(projected.footprint) == valid_shapely_polygon_feature_utm
+    assert projected.footprint_ground_full.area > projected.footprint.area
+    output = projected.output_geometries()
+    assert output['footprint'].equals_exact(wgs.footprint, 1e-9)
+    for name in ['footprint_ground_full', 'footprint_ground', 'footprint_roof', 'footprint_eave']:
+        assert output[name].equals_exact(getattr(wgs, name), 0)
+
+
+def test_utm_footprint_is_not_reprojected():
+    footprint = Footprint(valid_geojson_polygon_feature_utm, {'init': 'epsg:32610'}, projected=True)
+    assert footprint.working_crs == footprint.geometry_crs == 'epsg:32610'
+    assert footprint.output_geometries('epsg:32610')['footprint'] is footprint.footprint
@@ -41,3 +41,12 @@ def test_validate_feature_key_fail():
 def test_validate_feature_geom_key_fail():
     assert GeojsonCheck(no_coordinates_geojson_polygon_feature).is_geojson is False
 
+
+def test_validate_feature_collection():
+    collection = {'type': 'FeatureCollection', 'features': [valid_geojson_polygon_feature]}
+    assert GeojsonCheck(collection).is_geojson is True
+    assert GeojsonCheck(collection).type == 'FeatureCollection'
+
+
+def test_validate_feature_collection_without_features():
+    assert GeojsonCheck({'type': 'FeatureCollection'}).is_geojson is False
@@ -0,0 +1,60 @@
+import copy
+import pytest
+from tests.test_structures import *
+from vectorattributes.footprint import Footprint
+from vectorattributes.geometry import FootprintGeometries, buffer_donut_many, to_geometry_array
+from shapely.geometry import shape as get_shape
+from shapely.geometry import Polygon
+
+
+def wgs_features():
+    features = [copy.deepcopy(valid_geojson_polygon_feature_wgs), copy.deepcopy(valid_geojson_polygon_feature_ocean),
+                copy.deepcopy(invalid_geojson_overlap_polygon)]
+    for feature in features:
+        feature['geometry'].pop('crs', None)
+    return features
+
+
+def assert_matches_footprints(features, crs, projected):
+    geometries = FootprintGeometries([get_shape(feature['geometry']) for feature in features], crs, projected)
+    assert len(geometries) == len(features)
+    for index, feature in enumerate(features):
+        footprint = Footprint(feature, crs, projected=projected)
+        assert geometries.geometry_errors(index) == footprint.footprint_errors['geometry']
+        assert geometries.working_crs[index] == footprint.working_crs
+        assert geometries.geometry_crs[index] == footprint.geometry_crs
+        for name in ['footprint', 'footprint_ground_full', 'footprint_ground', 'footprint_roof', 'footprint_eave',
+                     'working_footprint']:
+            assert getattr(geometries, name)[index].equals_exact(getattr(footprint, name), 0), name
+
+
+def test_geometries_match_footprint_utm():
+    assert_matches_footprints(scattered_features(), {'init': 'epsg:32610'}, False)
+
+
+@pytest.mark.parametrize('projected', [False, True])
+def test_geometries_match_footprint_wgs(projected):
+    assert_matches_footprints(wgs_features(), {'init': 'epsg:4326'}, projected)
+
+
+def test_invalid_geometry_flags():
+    geometries = FootprintGeometries([get_shape(feature['geometry']) for feature in wgs_features()],
+                                     {'init': 'epsg:4326'})
+    assert list(geometries.buffer0) == [False, False, True]
+    assert list(geometries.convex_hull) == [False, False, False]
+
+
+def test_feature_geometries_build_footprint():
+    features = scattered_features()
+    geometries = FootprintGeometries([get_shape(feature['geometry']) for feature in features],
+                                     {'init': 'epsg:32610'})
+    prepared = Footprint(features[1], {'init': 'epsg:32610'}, geometries=geometries.feature_geometries(1))
+    footprint = Footprint(features[1], {'init': 'epsg:32610'})
+    assert prepared.footprint_errors == footprint.footprint_errors
+    assert prepared.footprint_eave.equals_exact(footprint.footprint_eave, 0)
+    assert prepared.geometry_crs == footprint.geometry_crs
+
+
+def test_buffer_donut_zero_distance():
+    with pytest.raises(ValueError):
+        buffer_donut_many(to_geometry_array([Polygon([(0, 0), (1, 0), (1, 1)])]), 0)
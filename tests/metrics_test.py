@@ -0,0 +1,54 @@
+import copy
+from tests.test_structures import *
+from vectorattributes import metrics
+from vectorattributes.batch import process_collection
+from vectorattributes.dsmfootprint import DSMFootprint
+from vectorattributes.runner import run_scene
+
+
+def dsm_footprint(rasters):
+    dsm, tree_dsm, dtm = rasters
+    return DSMFootprint(copy.deepcopy(scattered_features()[0]), synthetic_raster_crs, dsm, synthetic_raster_crs,
+                        tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs)
+
+
+def test_stages_and_zones(synthetic_rasters):
+    calls = []
+    with metrics.collect(metrics.StageMetrics(callback=lambda *args: calls.append(args))) as collected:
+        dsm_footprint(synthetic_rasters).output_geojson()
+    assert metrics.active() is None
+    rows = {(row['stage'], row['zone']): row for row in collected.rows()}
+    for zone in ('null', 'footprint', 'ground', 'eave', 'roof'):
+        assert rows['zone_calculations', zone]['calls'] == 1
+    for zone in ('footprint', 'ground', 'eave', 'roof'):
+        assert rows['calculate_stats', zone]['calls'] == 1
+    assert ('null_data_error', 'null') in rows
+    assert rows['read_raster_windows', None]['calls'] == 1
+    assert rows['output_geojson', None]['calls'] == 1
+    assert len(calls) == sum(row['calls'] for row in rows.values())
+    assert collected.totals()['calculate_stats']['calls'] == 4
+    assert 'zone_calculations' in collected.report()
+
+
+def test_disabled_records_nothing(synthetic_rasters):
+    collected = metrics.StageMetrics()
+    dsm_footprint(synthetic_rasters)
+    assert metrics.active() is None
+    assert collected.rows() == []
+
+
+def test_batch_and_worker_stages(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    features = scattered_features()
+    with metrics.collect() as collected:
+        process_collection(features, synthetic_raster_crs, dsm, synthetic_raster_crs, tree_dsm=tree_dsm,
+                           tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs, zonal=True)
+    totals = collected.totals()
+    assert totals['zonal_stats']['calls'] == totals['prepare_geometries']['calls'] == totals['process_chunk']['calls']
+    assert totals['calculate_properties']['calls'] == len(features)
+
+    merged = metrics.StageMetrics()
+    list(run_scene(None, *[raster.name for raster in synthetic_rasters], workers=2, chunk_size=2, features=features,
+                   feature_crs=synthetic_raster_crs, metrics=merged))
+    assert merged.totals()['output_geojson']['calls'] == len(features)
+    assert merged.totals()['zone_calculations']['calls'] == 5 * len(features)
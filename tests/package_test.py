@@ -0,0 +1,36 @@
+import subprocess
+import sys
+import pytest
+import vectorattributes
+
+
+def loaded_modules(statement):
+    """
+    :return: set of the modules loaded by a fresh interpreter running statement
+    """
+    output = subprocess.check_output([sys.executable, '-c', statement + '; import sys; print(" ".join(sys.modules))'])
+    return set(output.decode().split())
+
+
+def test_light_imports_skip_gdal():
+    modules = loaded_modules('import vectorattributes.geojson_check')
+    assert not modules & {'rasterio', 'pyproj', 'shapely', 'numpy'}
+    modules = loaded_modules('from vectorattributes import get_utm_epsg; get_utm_epsg(-74, 40)')
+    assert not modules & {'rasterio', 'pyproj'}
+
+
+def test_lazy_exports():
+    from vectorattributes import DSMFootprint, dsmfootprint
+    assert DSMFootprint is dsmfootprint.DSMFootprint
+    assert vectorattributes.DEFAULT_PARAMS is vectorattributes.footprint.DEFAULT_PARAMS
+    assert 'DSMFootprintBatch' in dir(vectorattributes)
+    for name in vectorattributes.__all__:
+        assert getattr(vectorattributes, name).__name__ == 'vectorattributes.' + name
+    with pytest.raises(AttributeError):
+        vectorattributes.missing
+    # module internals are only reached through their submodule
+    for name in ('WHITESPACE', 'FILL_ROWS', 'round_or_nan', 'checkpoint_path'):
+        assert name not in dir(vectorattributes)
+        with pytest.raises(AttributeError):
+            getattr(vectorattributes, name)
+    assert vectorattributes.validate.__name__ == 'vectorattributes.validate'
@@ -0,0 +1,107 @@
+import copy
+import json
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely import affinity
+from shapely.geometry import box
+from tests.test_structures import *
+from vectorattributes.batch import process_collection
+from vectorattributes.dsmcalc import DSMCalc
+from vectorattributes.dsmfootprint import DSMFootprint
+from vectorattributes.prescreen import NullGrid
+
+hole_transform = from_origin(1000, 2000, 0.5, 0.5)
+
+
+@pytest.fixture(scope='module')
+def hole_raster(tmp_path_factory):
+    """ dsm without a nodata value, with a large -9999 hole, scattered -9999 pixels and a ragged hole edge """
+    random = np.random.RandomState(3)
+    data = (10 + random.rand(400, 400)).astype('float32')
+    data[100:300, 50:200] = -9999
+    data[300:400, 250:400][random.rand(100, 150) < 0.04] = -9999
+    data[50:100, 200:260][random.rand(50, 60) < 0.5] = -9999
+    path = str(tmp_path_factory.mktemp('holes') / 'dsm.tif')
+    with rasterio.open(path, 'w', driver='GTiff', height=400, width=400, count=1, dtype='float32',
+                       crs='EPSG:32610', transform=hole_transform) as dst:
+        dst.write(data, 1)
+    with rasterio.open(path) as raster:
+        yield raster
+
+
+def footprints(count, seed=0):
+    random = np.random.RandomState(seed)
+    for _ in range(count):
+        x, y = 1000 + random.uniform(5, 190), 1800 + random.uniform(5, 190)
+        size = random.uniform(1, 30)
+        footprint = box(x, y, min(x + size, 1198), min(y + random.uniform(1, 30), 1998))
+        yield affinity.rotate(footprint, random.uniform(0, 90)) if random.rand() < 0.5 else footprint
+
+
+def exact_null(raster, footprint):
+    try:
+        return DSMCalc(raster, footprint).errors['dsm_null']
+    except ValueError:
+        return None
+
+
+def test_screen_matches_dsm_calc(hole_raster):
+    grid = NullGrid(hole_raster)
+    decided = 0
+    for footprint in footprints(300):
+        screened = grid.screen(footprint)
+        if screened is not None:
+            decided += 1
+            assert screened == exact_null(hole_raster, footprint)
+    assert decided > 200
+
+
+@pytest.mark.parametrize('cell_size', [1, 5, 16])
+def test_screen_matches_dsm_calc_cell_sizes(hole_raster, cell_size):
+    grid = NullGrid(hole_raster, cell_size=cell_size)
+    for footprint in footprints(60, seed=cell_size):
+        screened = grid.screen(footprint)
+        assert screened is None or screened == exact_null(hole_raster, footprint)
+
+
+def test_fill_matches_lazy_counts(hole_raster):
+    lazy = NullGrid(hole_raster, cell_size=7)
+    for footprint in footprints(50):
+        lazy.screen(footprint)
+    filled = NullGrid(hole_raster, cell_size=7).fill()
+    assert filled.counted.all()
+    assert np.array_equal(lazy.valid[lazy.counted], filled.valid[lazy.counted])
+    assert np.array_equal(lazy.nulls[lazy.counted], filled.nulls[lazy.counted])
+    assert filled.nulls.sum() == (hole_raster.read(1) == -9999).sum()
+
+
+def test_raster_nodata_is_not_null(synthetic_rasters):
+    # the nodata corner of the synthetic dsm is masked, DSMCalc never counts it as null
+    grid = NullGrid(synthetic_rasters[0]).fill()
+    assert grid.nulls.sum() == 0
+    assert grid.valid.sum() == 800 * 1000 - 25
+
+
+def test_dsm_footprint_prescreen_skips_dsm_read(synthetic_rasters):
+    dsm, tree_dsm, dtm = [CountingRaster(raster) for raster in synthetic_rasters]
+    kwargs = dict(tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs)
+    expected = DSMFootprint(copy.deepcopy(valid_geojson_polygon_feature_utm), synthetic_raster_crs, dsm,
+                            synthetic_raster_crs, **kwargs)
+    dsm.reads = 0
+    grid = NullGrid(dsm)
+    screened = DSMFootprint(copy.deepcopy(valid_geojson_polygon_feature_utm), synthetic_raster_crs, dsm,
+                            synthetic_raster_crs, null_grid=grid, **kwargs)
+    assert 'dsm' not in screened.raster_windows
+    assert dsm.reads == 1
+    assert json.dumps(screened.output_geojson()) == json.dumps(expected.output_geojson())
+
+
+def test_collection_prescreen(synthetic_rasters):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    kwargs = dict(tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs)
+    features = [copy.deepcopy(valid_geojson_polygon_feature_utm) for _ in range(3)]
+    assert process_collection(copy.deepcopy(features), synthetic_raster_crs, dsm, synthetic_raster_crs,
+                              prescreen=True, **kwargs) == \
+        process_collection(features, synthetic_raster_crs, dsm, synthetic_raster_crs, **kwargs)
@@ -1,5 +1,6 @@
 from vectorattributes.projection import *
 from tests.test_structures import *
+from shapely.geometry import Point
 from shapely.geometry import shape as get_shape
 
 
@@ -23,3 +24,26 @@ def test_convert_4326_to_utm():
     output = convert_4326_to_utm(valid_shapely_polygon_feature_wgs)
     reprojected = round_shapely_object(output)
     assert reprojected == valid_shapely_polygon_feature_utm
+
+
+def test_transformer_is_cached():
+    assert get_transformer('epsg:4326', 'EPSG:32610') is get_transformer('EPSG:4326', 'epsg:32610')
+    assert get_transformer('epsg:4326', 'epsg:32610') is not get_transformer('epsg:32610', 'epsg:4326')
+
+
+def test_reproject_many_matches_reproject():
+    polygons = [valid_shapely_polygon_feature_wgs, valid_shapely_polygon_feature_wgs.buffer(0.001),
+                valid_shapely_polygon_feature_wgs.centroid]
+    reprojected = reproject_many(polygons, from_proj='epsg:4326', to_proj='epsg:32610')
+    assert len(reprojected) == 3
+    for polygon, output in zip(polygons, reprojected):
+        assert output.equals_exact(reproject(polygon, from_proj='epsg:4326', to_proj='epsg:32610'), 0)
+    assert round_shapely_object(reprojected[0]) == valid_shapely_polygon_feature_utm
+
+
+def test_reproject_many_keeps_z():
+    point_z = Point(-122.4024, 37.7845, 12.5)
+    reprojected = reproject_many([point_z, point_z.centroid], from_proj='epsg:4326', to_proj='epsg:32610')
+    assert reprojected[0].has_z and reprojected[0].z == 12.5
+    assert not reprojected[1].has_z
+    assert reprojected[0].x == reprojected[1].x
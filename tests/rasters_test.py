@@ -0,0 +1,83 @@
+import copy
+import json
+import numpy as np
+import pytest
+import rasterio
+from rasterio.windows import Window
+from tests.test_structures import *
+from vectorattributes.batch import process_collection
+from vectorattributes.dsmfootprint import DSMFootprint
+from vectorattributes.rasters import BlockCache, MemmapRaster, cached_rasters, open_raster
+
+WINDOWS = [((0, 800), (0, 1000)), ((3, 300), (250, 700)), ((795, 805), (990, 1200)), ((5, 3), (0, 2)),
+           Window(10, 20, 300, 270)]
+
+
+@pytest.mark.parametrize('profile', [{}, {'tiled': True, 'blockxsize': 256, 'blockysize': 256}])
+def test_memmap_reads_match_rasterio(tmp_path, profile):
+    path = write_synthetic_raster(str(tmp_path / 'dsm.tif'), 10, 15, **profile)
+    with rasterio.open(path) as src, MemmapRaster(path) as raster:
+        assert raster.meta == src.meta
+        assert raster.bounds == src.bounds and raster.res == src.res
+        assert raster.index(552500.3, 4182100.7) == src.index(552500.3, 4182100.7)
+        for window in WINDOWS:
+            assert np.array_equal(raster.read(1, window=window), src.read(1, window=window))
+
+
+def test_memmap_window_is_view(tmp_path):
+    path = write_synthetic_raster(str(tmp_path / 'dsm.tif'), 10, 15)
+    with MemmapRaster(path) as raster:
+        data = raster.read(1, window=((10, 20), (30, 40)))
+        assert np.shares_memory(data, raster.band)
+        assert not data.flags.writeable
+
+
+def test_open_raster_falls_back_to_rasterio(tmp_path):
+    path = write_synthetic_raster(str(tmp_path / 'dsm.tif'), 10, 15, compress='lzw')
+    with pytest.raises(ValueError):
+        MemmapRaster(path)
+    with open_raster(path) as raster:
+        assert isinstance(raster, rasterio.io.DatasetReader)
+
+
+def test_dsmfootprint_with_memmap_raster(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    expected = DSMFootprint(copy.deepcopy(valid_geojson_polygon_feature_utm), synthetic_raster_crs, dsm,
+                            synthetic_raster_crs).output_geojson()
+    with open_raster(dsm.name) as raster:
+        assert isinstance(raster, MemmapRaster)
+        output = DSMFootprint(copy.deepcopy(valid_geojson_polygon_feature_utm), synthetic_raster_crs, raster,
+                              synthetic_raster_crs).output_geojson()
+    assert json.dumps(output, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+@pytest.mark.parametrize('profile', [{}, {'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'compress': 'lzw'}])
+def test_cached_reads_match_rasterio(tmp_path, profile):
+    path = write_synthetic_raster(str(tmp_path / 'dsm.tif'), 10, 15, **profile)
+    with rasterio.open(path) as src:
+        raster, missing = cached_rasters([src, None])
+        assert missing is None
+        for window in WINDOWS + WINDOWS:
+            assert np.array_equal(raster.read(1, window=window), src.read(1, window=window))
+        assert raster.cache.hits > 0
+        assert raster.index(552500.3, 4182100.7) == src.index(552500.3, 4182100.7)
+
+
+def test_block_cache_evicts_least_recently_used():
+    cache = BlockCache(max_bytes=16)
+    load = lambda: np.zeros(1, dtype=np.float64)
+    for key in ('a', 'b', 'a', 'c', 'a', 'b'):
+        cache.get(key, load)
+    assert cache.stats() == {'hits': 2, 'misses': 4, 'evictions': 2, 'blocks': 2, 'bytes': 16}
+    assert list(cache.blocks) == ['a', 'b']
+    assert not cache.get('a', load).flags.writeable
+
+
+@pytest.mark.parametrize('zonal', [False, True])
+def test_batch_with_block_cache(synthetic_rasters, zonal):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    outputs = [process_collection(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs,
+                                  tree_dsm=tree_dsm, tree_dsm_crs=synthetic_raster_crs, dem=dtm,
+                                  dem_crs=synthetic_raster_crs, zonal=zonal, cache_bytes=cache_bytes)
+               for cache_bytes in (None, 1024 * 1024)]
+    assert json.dumps(outputs[0], sort_keys=True) == json.dumps(outputs[1], sort_keys=True)
@@ -0,0 +1,82 @@
+import copy
+import io
+import json
+import pytest
+from tests.test_structures import *
+from vectorattributes.readers import FeatureReader, JSONStream, crs_from_geojson
+
+
+def features():
+    return [dict(copy.deepcopy(valid_geojson_polygon_feature_utm), properties={'id': index, 'name': 'x' * index})
+            for index in range(20)]
+
+
+def collection_text(**members):
+    return json.dumps(dict(members, features=features()), indent=2)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 13, 65536])
+def test_collection_file_is_streamed(chunk_size):
+    source = io.StringIO(collection_text(type='FeatureCollection'))
+    assert json.dumps(list(FeatureReader(source, chunk_size=chunk_size))) == json.dumps(features())
+
+
+def test_collection_type_checked_before_features():
+    reader = FeatureReader(io.StringIO(json.dumps({'type': 'Feature', 'features': features()})))
+    with pytest.raises(TypeError):
+        next(iter(reader))
+
+
+def test_collection_type_checked_at_end():
+    reader = iter(FeatureReader(io.StringIO(json.dumps({'features': features()[:2]}))))
+    next(reader)
+    next(reader)
+    with pytest.raises(TypeError):
+        next(reader)
+
+
+def test_collection_crs(tmp_path):
+    path = str(tmp_path / 'footprints.geojson')
+    with open(path, 'w') as dst:
+        dst.write(collection_text(type='FeatureCollection', crs={'type': 'name', 'properties': {
+            'name': 'urn:ogc:def:crs:EPSG::32610'}}))
+    reader = FeatureReader(path)
+    assert reader.source_format == 'featurecollection'
+    assert reader.crs == {'init': 'epsg:32610'}
+    assert len(list(reader)) == 20
+
+
+def test_crs_from_geojson():
+    assert crs_from_geojson(None) == {'init': 'epsg:4326'}
+    assert crs_from_geojson({'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:OGC:1.3:CRS84'}}) == \
+        {'init': 'epsg:4326'}
+    with pytest.raises(RuntimeError):
+        crs_from_geojson({'type': 'name', 'properties': {'name': 'unknown'}})
+
+
+@pytest.mark.parametrize('extension, separator', [('.geojsonl', ''), ('.geojson', '\x1e')])
+def test_sequence_file(tmp_path, extension, separator):
+    path = str(tmp_path / ('footprints' + extension))
+    with open(path, 'w') as dst:
+        for feature in features():
+            dst.write(separator + json.dumps(feature, indent=2 if separator else None) + '\n')
+    reader = FeatureReader(path)
+    assert reader.source_format == 'geojsonseq'
+    assert reader.crs == {'init': 'epsg:4326'}
+    assert json.dumps(list(reader)) == json.dumps(features())
+
+
+def test_dict_collection():
+    assert len(list(FeatureReader({'type': 'FeatureCollection', 'features': features()}))) == 20
+    with pytest.raises(TypeError):
+        list(FeatureReader({'type': 'Feature', 'features': []}))
+
+
+def test_json_stream_numbers_across_chunks():
+    stream = JSONStream(io.StringIO('[12345, 6789]'), chunk_size=3)
+    stream.expect('[')
+    assert stream.decode() == 12345
+    stream.expect(',')
+    assert stream.decode() == 6789
+    stream.expect(']')
+    assert stream.peek() == ''
@@ -0,0 +1,58 @@
+import copy
+import json
+import pytest
+from tests.test_structures import *
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.dsmfootprint import error_factory as calculation_error_factory
+from vectorattributes.footprint import error_factory as footprint_error_factory
+from vectorattributes.records import *
+
+
+def test_error_view_matches_error_factories():
+    flags = ErrorFlags()
+    footprint_errors = flags.view(FOOTPRINT_ERRORS)
+    assert footprint_errors == footprint_error_factory()
+    calculation_errors = flags.reset(CALCULATION_ERRORS)
+    assert calculation_errors.to_dict() == calculation_error_factory()
+    assert flags.bits == 0
+
+
+def test_error_view_sets_bits():
+    flags = ErrorFlags()
+    footprint_errors = flags.view(FOOTPRINT_ERRORS)
+    footprint_errors['geometry']['buffer0'] = True
+    footprint_errors.update({'negative_elevation': True, 'comparison_factor_exceeded': False})
+    calculation_errors = flags.reset(CALCULATION_ERRORS)
+    calculation_errors['min_eave'] = True
+    assert flags.bits == BUFFER0 | NEGATIVE_ELEVATION | MIN_EAVE
+    assert footprint_errors.bits == BUFFER0 | NEGATIVE_ELEVATION
+    assert footprint_errors.to_dict() == {'geometry': {'buffer0': True, 'convex_hull': False}, 'dsm_null': False,
+                                          'negative_elevation': True, 'comparison_factor_exceeded': False}
+    footprint_errors['geometry']['buffer0'] = False
+    assert not flags.is_set(BUFFER0)
+    with pytest.raises(KeyError):
+        footprint_errors['unknown'] = True
+
+
+def test_zone_stats_round_trip():
+    values = {'tree_masked_dsm': True, 'pixel_count': 12, 'height_max': np.NaN, 'min': 1.5, 'std': 0,
+              '10th_perc': np.float64(2.25), 'elevation': 3.0, 'pitch': 'flat', 'height': 4.5}
+    stats = ZoneStats(values)
+    assert dict(stats) == values
+    assert list(stats) == list(values)
+    assert json.dumps(stats.to_dict()) == json.dumps(values)
+    assert type(stats['pixel_count']) is int and type(stats['tree_masked_dsm']) is bool
+    stats.pop('std')
+    assert 'std' not in stats and len(stats) == len(values) - 1
+    with pytest.raises(KeyError):
+        stats['comparison_factor']
+
+
+def test_error_bit_array(synthetic_rasters):
+    features = [copy.deepcopy(valid_geojson_polygon_feature_utm) for _ in range(2)]
+    footprints = list(DSMFootprintBatch(features, synthetic_raster_crs, synthetic_rasters[0],
+                                        synthetic_raster_crs).process())
+    bits = error_bit_array(footprints)
+    assert bits.dtype == np.uint32
+    assert list(bits) == [footprint.error_flags.bits for footprint in footprints]
+    assert list((bits & MIN_EAVE) > 0) == [footprint.calculation_errors['min_eave'] for footprint in footprints]
@@ -0,0 +1,58 @@
+import copy
+import json
+import rasterio
+from tests.test_structures import *
+from vectorattributes.batch import process_collection
+from vectorattributes.runner import crs_to_dict, process_scene, run_scene, spatial_chunks, spatial_order, stream_chunks
+
+
+def raster_paths(rasters):
+    return [raster.name for raster in rasters]
+
+
+def test_crs_to_dict():
+    assert crs_to_dict(None) is None
+    assert crs_to_dict({'init': 'epsg:4326'}) == {'init': 'epsg:4326'}
+    assert crs_to_dict(rasterio.crs.CRS.from_epsg(32610)) == {'init': 'epsg:32610'}
+
+
+def test_spatial_chunks_are_contiguous():
+    features = [{'geometry': {'type': 'Point', 'coordinates': (x, y)}} for x in (0, 100, 1, 101) for y in (0, 1)]
+    order = spatial_order(features)
+    assert sorted(order) == list(range(len(features)))
+    chunks = [sorted(index for index, _ in chunk) for chunk in spatial_chunks(features, 4)]
+    assert chunks == [[0, 1, 4, 5], [2, 3, 6, 7]]
+
+
+def test_stream_chunks_index_every_feature():
+    features = [{'geometry': {'type': 'Point', 'coordinates': (x, 0)}} for x in range(10)]
+    chunks = list(stream_chunks(iter(features), 2, window=4))
+    assert sorted(index for chunk in chunks for index, _ in chunk) == list(range(10))
+    assert all(features[index] is feature for chunk in chunks for index, feature in chunk)
+    assert [max(index for index, _ in chunk) // 4 for chunk in chunks] == [0, 0, 1, 1, 2]
+
+
+def test_run_scene_matches_batch(synthetic_rasters):
+    dsm_path, tree_dsm_path, dtm_path = raster_paths(synthetic_rasters)
+    features = scattered_features()
+    expected = process_collection(features, synthetic_raster_crs, *synthetic_rasters[:1], synthetic_raster_crs,
+                                  tree_dsm=synthetic_rasters[1], tree_dsm_crs=synthetic_raster_crs,
+                                  dem=synthetic_rasters[2], dem_crs=synthetic_raster_crs)['features']
+    for ordered, window in ((True, 16384), (False, 16384), (True, 4)):
+        results = list(run_scene(None, dsm_path, tree_dsm_path, dtm_path, workers=2, chunk_size=2, ordered=ordered,
+                                 features=iter(features), feature_crs=synthetic_raster_crs, window=window))
+        if ordered:
+            assert [index for index, _ in results] == list(range(len(features)))
+        outputs = [output for _, output in sorted(results, key=lambda result: result[0])]
+        assert json.dumps(outputs, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+def test_process_scene_from_file(synthetic_rasters, tmp_path):
+    path = str(tmp_path / 'footprints.geojson')
+    features = [copy.deepcopy(valid_geojson_polygon_feature_wgs) for _ in range(3)]
+    with open(path, 'w') as dst:
+        json.dump({'type': 'FeatureCollection', 'features': features}, dst)
+    output = process_scene(path, raster_paths(synthetic_rasters)[0], workers=2, chunk_size=1)
+    assert output['type'] == 'FeatureCollection'
+    assert len(output['features']) == 3
+    assert len(set(json.dumps(feature['properties'], sort_keys=True) for feature in output['features'])) == 1
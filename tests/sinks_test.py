@@ -0,0 +1,62 @@
+import copy
+import io
+import json
+import numpy as np
+import pytest
+from tests.test_structures import *
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.sinks import encode_feature, open_sink, to_serializable, write_results
+
+
+def outputs():
+    return [{'type': 'feature', 'geometry': {'type': 'Point', 'coordinates': (1.0, 2.0)},
+             'properties': {'index': index, 'max': np.float32(1.5), 'count': np.int64(3), 'flag': np.bool_(True),
+                            'median': np.NaN}} for index in range(3)]
+
+
+def test_to_serializable():
+    assert to_serializable(outputs()[0]['properties']) == {'index': 0, 'max': 1.5, 'count': 3, 'flag': True,
+                                                           'median': None}
+    assert json.loads(encode_feature(outputs()[0]))['geometry']['coordinates'] == [1.0, 2.0]
+
+
+def test_ndjson_sink():
+    destination = io.StringIO()
+    assert write_results(outputs(), destination) == 3
+    lines = destination.getvalue().splitlines()
+    assert [json.loads(line)['properties']['index'] for line in lines] == [0, 1, 2]
+
+
+def test_geojson_sequence_sink():
+    destination = io.StringIO()
+    write_results(outputs(), destination, 'geojsonseq')
+    records = destination.getvalue().split('\x1e')
+    assert records[0] == ''
+    assert [json.loads(record)['properties']['index'] for record in records[1:]] == [0, 1, 2]
+
+
+@pytest.mark.parametrize('results', [[], outputs()])
+def test_feature_collection_sink(results, tmp_path):
+    path = str(tmp_path / 'output.geojson')
+    with open_sink(path, 'featurecollection') as sink:
+        sink.write_many(iter(results))
+    collection = json.load(open(path))
+    assert collection['type'] == 'FeatureCollection'
+    assert len(collection['features']) == len(results)
+    with pytest.raises(RuntimeError):
+        sink.write(outputs()[0])
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        open_sink(io.StringIO(), 'csv')
+
+
+def test_batch_write_matches_output_geojson(synthetic_rasters):
+    features = [copy.deepcopy(valid_geojson_polygon_feature_utm) for _ in range(2)]
+    destination = io.StringIO()
+    batch = DSMFootprintBatch(features, synthetic_raster_crs, synthetic_rasters[0], synthetic_raster_crs)
+    assert batch.write(destination) == 2
+    expected = DSMFootprintBatch(features, synthetic_raster_crs, synthetic_rasters[0],
+                                 synthetic_raster_crs).output_geojson()['features']
+    assert [json.loads(line) for line in destination.getvalue().splitlines()] == to_serializable(expected)
@@ -7,6 +7,7 @@ Notes:
 """
 from collections import OrderedDict
 import numpy as np
+from shapely import affinity
 from shapely.geometry import mapping, shape as get_shape
 
 
@@ -112,3 +113,56 @@ invalid_geojson_overlap_polygon = {
         'crs': {'init': 'epsg:4326'},
         'type': 'Polygon'}
 }
+
+
+# synthetic rasters covering valid_geojson_polygon_feature_utm, used for end to end DSMFootprint runs
+synthetic_raster_crs = {'init': 'epsg:32610'}
+
+
+def write_synthetic_raster(path, ground_elevation, building_height, seed=0, **profile):
+    """
+    Write a 0.5m UTM raster with random noise, the Yerba Buena Gardens footprint raised by building_height and a small
+    block of nodata in the upper left corner
+    :return: path of the written raster
+    """
+    import rasterio
+    import rasterio.features
+    from rasterio.transform import from_origin
+    transform = from_origin(552400, 4182300, 0.5, 0.5)
+    data = (ground_elevation + np.random.RandomState(seed).rand(800, 1000)).astype('float32')
+    building = rasterio.features.rasterize([(get_shape(valid_geojson_polygon_feature_utm['geometry']), 1)],
+                                           out_shape=data.shape, transform=transform)
+    data[building == 1] += building_height
+    data[:5, :5] = -9999
+    meta = {'driver': 'GTiff', 'height': 800, 'width': 1000, 'count': 1, 'dtype': 'float32', 'crs': 'EPSG:32610',
+            'transform': transform, 'nodata': -9999}
+    meta.update(profile)
+    with rasterio.open(path, 'w', **meta) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def scattered_features():
+    """ Footprints of different sizes that are not aligned with the raster grid, two of them neighbouring """
+    footprint = get_shape(valid_geojson_polygon_feature_utm['geometry'])
+    features = []
+    for x_offset, y_offset, scale in [(0, 0, 1), (30, 20, 0.3), (-60, -40, 0.2), (-100, 40, 0.05), (5, 5, 0.1),
+                                      (8, 3, 0.1)]:
+        geometry = affinity.translate(affinity.scale(footprint, scale, scale),
+                                      x_offset + 0.123, y_offset + 0.0377)
+        features.append({'type': 'Feature', 'properties': {'id': len(features)}, 'geometry': mapping(geometry)})
+    return features
+
+
+class CountingRaster(object):
+    """ Wraps a rasterio dataset and counts the calls to read """
+    def __init__(self, raster):
+        self.raster = raster
+        self.reads = 0
+
+    def __getattr__(self, item):
+        return getattr(self.raster, item)
+
+    def read(self, *args, **kwargs):
+        self.reads += 1
+        return self.raster.read(*args, **kwargs)
@@ -0,0 +1,63 @@
+import copy
+import json
+import numpy as np
+import pytest
+import rasterio
+from tests.test_structures import *
+from vectorattributes.batch import process_collection
+from vectorattributes.tiles import TileGrid, TileRaster, assign_tiles, process_tiles
+
+
+@pytest.fixture(scope='module')
+def tiled_rasters(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('tiled')
+    profile = {'tiled': True, 'blockxsize': 64, 'blockysize': 64}
+    paths = (write_synthetic_raster(str(directory / 'dsm.tif'), 10, 15, **profile),
+             write_synthetic_raster(str(directory / 'tree_dsm.tif'), 10, 14, seed=1, **profile),
+             write_synthetic_raster(str(directory / 'dtm.tif'), 10, 0, seed=2, **profile))
+    rasters = [rasterio.open(path) for path in paths]
+    yield rasters
+    for raster in rasters:
+        raster.close()
+
+
+def raster_kwargs(rasters):
+    dsm, tree_dsm, dtm = rasters
+    return {'dsm': dsm, 'dsm_crs': synthetic_raster_crs, 'tree_dsm': tree_dsm, 'tree_dsm_crs': synthetic_raster_crs,
+            'dem': dtm, 'dem_crs': synthetic_raster_crs}
+
+
+@pytest.mark.parametrize('tile_size, halo, zonal', [(16, None, False), (100, 6.2, False), (100, None, True)])
+def test_tiles_match_collection(tiled_rasters, tile_size, halo, zonal):
+    features = scattered_features()
+    expected = process_collection(copy.deepcopy(features), synthetic_raster_crs, zonal=zonal,
+                                  **raster_kwargs(tiled_rasters))['features']
+    results = dict((index, footprint.output_geojson()) for index, footprint in process_tiles(
+        copy.deepcopy(features), synthetic_raster_crs, tile_size=tile_size, halo=halo, zonal=zonal,
+        **raster_kwargs(tiled_rasters)))
+    assert sorted(results) == list(range(len(features)))
+    assert json.dumps([results[index] for index in range(len(features))], sort_keys=True) == \
+        json.dumps(expected, sort_keys=True)
+
+
+def test_grid_is_block_aligned(tiled_rasters, synthetic_rasters):
+    grid = TileGrid(tiled_rasters[0], tile_size=100)
+    assert (grid.tile_rows, grid.tile_cols, grid.shape) == (128, 128, (7, 8))
+    assert TileGrid(synthetic_rasters[0], tile_size=100).shape[1] == 1
+    with pytest.raises(ValueError):
+        TileGrid(tiled_rasters[0], halo=1)
+    features = scattered_features()
+    assigned = assign_tiles(grid, features, 'epsg:32610', 'epsg:32610')
+    assert sorted(index for indices in assigned.values() for index in indices) == list(range(len(features)))
+    assert list(assigned) == sorted(assigned)
+
+
+def test_tile_raster_reads(tiled_rasters):
+    dsm = tiled_rasters[0]
+    tile = TileRaster(dsm, TileGrid(dsm, tile_size=100, halo=10).bounds(9))
+    assert tile.rows == range(64, 320) and tile.cols == range(64, 320)
+    assert not tile.data.flags.writeable
+    for window in (((120, 130), (200, 210)), ((0, 50), (0, 50)), ((250, 300), (100, 120))):
+        assert np.array_equal(tile.read(1, window=window), dsm.read(1, window=window))
+    assert tile.read(window=((120, 130), (200, 210))).shape == (1, 10, 10)
+    assert tile.bounds == dsm.bounds
@@ -0,0 +1,57 @@
+import numpy as np
+from tests.test_structures import *
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.validate import REFERENCE_NODATA, join_ids, validate
+
+
+def batch(rasters):
+    dsm, tree_dsm, dtm = rasters
+    return DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs, tree_dsm=tree_dsm,
+                             tree_dsm_crs=synthetic_raster_crs, dem=dtm, dem_crs=synthetic_raster_crs)
+
+
+def reference_of(outputs):
+    """ Reference table in the layout of the height_attributed_buildings shapefiles, in reverse order """
+    properties = [feature['properties'] for feature in reversed(outputs['features'])]
+    roof = [p['calculated_properties']['roof'] for p in properties]
+    return {
+        'u_id': np.array([p['original_properties']['id'] for p in properties]),
+        'rf_max': np.array([REFERENCE_NODATA if r['max'] != r['max'] else r['max'] for r in roof]),
+        'rf_med': np.array([r['median'] * 1.01 for r in roof]),
+        'rf_shp': np.array([{'flat': 0, 'moderate': 1}.get(r['pitch'], 2) for r in roof]),
+        'dsm_null': np.array([int(p['errors']['footprint']['dsm_null']) for p in properties]),
+        'rf_std': np.zeros(len(roof))
+    }
+
+
+def test_join_ids():
+    assert join_ids(['b', 'x', 'a'], ['a', 'b']).tolist() == [1, -1, 0]
+
+
+def test_matching_reference(synthetic_rasters):
+    outputs = batch(synthetic_rasters).output_geojson()
+    reference = reference_of(outputs)
+    validation = validate(outputs, reference, id_property='id', reference_id='u_id')
+    assert sorted(validation.mismatches) == ['dsm_null', 'rf_max', 'rf_med', 'rf_shp']
+    assert not validation.any_mismatch().any()
+    assert validation.summary() == []
+    assert validation.unreferenced == 0
+
+    columns = batch(synthetic_rasters).columns(properties=['id'])
+    assert not validate(columns, reference, id_property='id', reference_id='u_id').any_mismatch().any()
+
+
+def test_mismatch_masks(synthetic_rasters):
+    outputs = batch(synthetic_rasters).output_geojson()
+    reference = reference_of(outputs)
+    reference['rf_med'][1] *= 1.1
+    reference['dsm_null'][2] = 1 - reference['dsm_null'][2]
+    reference['u_id'][3] = 100
+    validation = validate(outputs, reference, id_property='id', reference_id='u_id', tolerances={'rf_med': 0.05})
+    assert validation.mismatches['rf_med'].tolist() == [False, True, False, False, False, False]
+    assert validation.mismatches['dsm_null'][2]
+    assert validation.missing.tolist() == [False, False, False, True, False, False]
+    assert validation.unreferenced == 1
+    assert [row['column'] for row in validation.summary()] == ['dsm_null', 'rf_med']
+    assert validation.summary()[0]['percentage'] == 20.
+    assert '2 of 6 reference buildings mismatched, 1 without an output' in validation.report()
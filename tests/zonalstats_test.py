@@ -0,0 +1,117 @@
+import json
+import numpy as np
+import pytest
+from shapely import affinity
+from shapely.geometry import mapping
+from tests.test_structures import *
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.zonalstats import GroupedValues, ZoneLabels
+
+valid_shapely_polygon_feature_utm = get_shape(valid_geojson_polygon_feature_utm['geometry'])
+
+
+def flatten(properties, path=''):
+    if isinstance(properties, dict):
+        for key, value in properties.items():
+            yield from flatten(value, path + '/' + key)
+    else:
+        yield path, properties
+
+
+def test_grouped_values_match_numpy():
+    random = np.random.RandomState(0)
+    labels = random.randint(0, 5, 500)
+    labels[labels == 3] = 4
+    values = random.rand(500).astype('float32') * 100
+    grouped = GroupedValues(labels, values, 6)
+    assert list(grouped.counts) == [np.sum(labels == label) for label in range(6)]
+    for label in (0, 1, 2, 4):
+        zone = values[labels == label]
+        assert grouped.reduce(np.minimum)[label] == zone.min()
+        assert grouped.reduce(np.maximum)[label] == zone.max()
+        assert grouped.percentile(10)[label] == np.percentile(zone, 10)
+        assert grouped.percentile(75)[label] == np.percentile(zone, 75)
+        assert grouped.median()[label] == np.median(zone)
+        assert np.isclose(grouped.mean()[label], zone.mean())
+        assert np.isclose(grouped.std()[label], zone.std())
+    assert np.isnan(grouped.percentile(50)[3]) and np.isnan(grouped.reduce(np.minimum)[5])
+
+
+def test_grouped_values_modes():
+    grouped = GroupedValues(np.array([0, 0, 0, 1, 1, 1, 1]), np.array([2., 2., 1., 3., 4., 4., 3.]), 3)
+    modes, minorities = grouped.modes()
+    assert list(modes[:2]) == [2., 3.] and list(minorities[:2]) == [1., 3.]
+    assert np.isnan(modes[2]) and np.isnan(minorities[2])
+
+
+def test_grouped_values_subset():
+    grouped = GroupedValues(np.array([2, 0, 1, 2, 1]), np.array([5., 1., 3., 4., 2.]), 3)
+    subset = grouped.subset(1, 3)
+    assert list(subset.labels) == [0, 0, 1, 1]
+    assert list(subset.values) == [2., 3., 4., 5.]
+
+
+def test_zone_labels_overlapping_zones(synthetic_rasters):
+    footprint = valid_shapely_polygon_feature_utm
+    zone_labels = ZoneLabels(synthetic_rasters[0], [footprint, footprint.buffer(-0.1), footprint.buffer(6.2)])
+    assert list(zone_labels.exceptions) == [None, None, None]
+    counts = zone_labels.grouped.counts
+    assert counts[1] < counts[0] < counts[2]
+
+
+def test_zone_labels_uncovered_geometry(synthetic_rasters):
+    ocean = get_shape(valid_geojson_polygon_feature_ocean['geometry'])
+    zone_labels = ZoneLabels(synthetic_rasters[0], [valid_shapely_polygon_feature_utm, ocean])
+    assert zone_labels.exceptions[0] is None
+    assert isinstance(zone_labels.exceptions[1], ValueError)
+    assert zone_labels.grouped.counts[1] == 0
+
+
+@pytest.mark.parametrize('use_tree, use_dtm', [(False, False), (True, False), (True, True), (False, True)])
+def test_zonal_batch_matches_dsm_calc(synthetic_rasters, use_tree, use_dtm):
+    dsm, tree_dsm, dtm = synthetic_rasters
+    kwargs = {'tree_dsm': tree_dsm if use_tree else None, 'tree_dsm_crs': synthetic_raster_crs if use_tree else None,
+              'dem': dtm if use_dtm else None, 'dem_crs': synthetic_raster_crs if use_dtm else None}
+    expected = DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs,
+                                 **kwargs).output_geojson()
+    zonal = DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs, zonal=True,
+                              chunk_size=4, **kwargs).output_geojson()
+    for expected_feature, zonal_feature in zip(expected['features'], zonal['features']):
+        expected_properties = dict(flatten(expected_feature['properties']))
+        zonal_properties = dict(flatten(zonal_feature['properties']))
+        assert list(expected_properties) == list(zonal_properties)
+        for key, value in expected_properties.items():
+            if isinstance(value, float):
+                assert np.isclose(value, zonal_properties[key], rtol=1e-6, equal_nan=True), key
+            else:
+                assert value == zonal_properties[key], key
+
+
+def test_zonal_batch_raises_for_uncovered_feature(synthetic_rasters):
+    outside = affinity.translate(valid_shapely_polygon_feature_utm, 10000, 0)
+    features = scattered_features()[:2] + [{'type': 'Feature', 'properties': {}, 'geometry': mapping(outside)}]
+    batch = DSMFootprintBatch(features, synthetic_raster_crs, synthetic_rasters[0], synthetic_raster_crs, zonal=True)
+    with pytest.raises(ValueError):
+        batch.output_geojson()
+
+
+def test_zonal_batch_splits_chunk_by_window_pixels(synthetic_rasters):
+    dsm = synthetic_rasters[0]
+    whole = DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs, zonal=True)
+    single = DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs)
+    batch = DSMFootprintBatch(scattered_features(), synthetic_raster_crs, dsm, synthetic_raster_crs, zonal=True,
+                              window_pixels=20000)
+    features, geometries = batch.prepare_chunk(scattered_features())
+    footprints = [batch.process_feature(feature, calculate=False, reprojected=True,
+                                        geometries=geometries.feature_geometries(index))
+                  for index, feature in enumerate(features)]
+    groups, outliers = batch.zonal_groups(features, footprints)
+    # the large footprint alone covers more than the budget and is calculated on its own
+    assert outliers == [0]
+    assert len(groups) > 1 and sorted(sum(groups, [])) == [1, 2, 3, 4, 5]
+    for group in groups:
+        bounds = np.array([batch.zone_bounds(footprints[index]) for index in group])
+        assert batch.window_size(tuple(bounds[:, :2].min(axis=0)) + tuple(bounds[:, 2:].max(axis=0))) <= 20000
+    split = [json.dumps(feature, sort_keys=True) for feature in batch.output_geojson()['features']]
+    assert split[1:] == [json.dumps(feature, sort_keys=True) for feature in whole.output_geojson()['features']][1:]
+    assert split[0] == json.dumps(single.output_geojson()['features'][0], sort_keys=True)
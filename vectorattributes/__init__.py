@@ -1,7 +1,52 @@
-from .dsmcalc import *
-from .dsmfootprint import *
-from .footprint import *
-from .geojson_check import *
+"""
+The submodules and the names they export are loaded on first access, so importing the package or a light module like
+geojson_check does not import rasterio, GDAL or pyproj.  from vectorattributes import DSMFootprint imports
+dsmfootprint and its dependencies only then
+"""
+import importlib
 
-__all__ = ['dsmcalc', 'dsmfootprint', 'footprint', 'geojson_check']
-__name__ = 'vectorattributes'
+# Names exported by each submodule, available as vectorattributes.<name>.  These are the names the package exported
+# before it loaded its submodules lazily and the entry points added since, everything else is reached through its
+# submodule
+_EXPORTS = {
+    'batch': ('DSMFootprintBatch', 'process_collection'),
+    'cache': ('ResultCache',),
+    'catalog': ('RasterCatalog', 'process_catalog'),
+    'cli': ('run_checkpointed',),
+    'columns': ('ResultColumns',),
+    'dsmcalc': ('ArrayDSMCalc', 'DSMCalc', 'factory'),
+    'dsmfootprint': ('DSMFootprint', 'NEW_DEFAULT_PARAMS', 'calculation_factory'),
+    'footprint': ('DEFAULT_PARAMS', 'Footprint', 'error_factory'),
+    'geometry': ('FootprintGeometries',),
+    'geojson_check': ('GeojsonCheck',),
+    'metrics': ('StageMetrics',),
+    'prescreen': ('NullGrid',),
+    'projection': ('convert_4326_to_utm', 'get_utm_epsg', 'reproject'),
+    'rasters': ('BlockCache', 'open_raster'),
+    'readers': ('FeatureReader', 'read_features'),
+    'records': ('ZoneStats',),
+    'runner': ('process_scene', 'run_scene'),
+    'sinks': ('open_sink', 'write_results'),
+    'tiles': ('process_tiles',),
+    'validate': ('Validation',),
+    'zonalstats': ('footprint_zone_calcs',),
+}
+_NAMES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = ['batch', 'cache', 'catalog', 'cli', 'columns', 'dsmcalc', 'dsmfootprint', 'footprint', 'geometry',
+           'geojson_check', 'metrics', 'prescreen', 'rasters', 'readers', 'records', 'runner', 'sinks', 'tiles',
+           'validate', 'zonalstats']
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return importlib.import_module('.' + name, __name__)
+    if name in _NAMES:
+        value = getattr(importlib.import_module('.' + _NAMES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_NAMES))
@@ -0,0 +1,4 @@
+from vectorattributes.cli import main
+import sys
+
+sys.exit(main())
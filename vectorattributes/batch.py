@@ -0,0 +1,289 @@
+from vectorattributes.cache import ResultCache
+from vectorattributes.columns import ResultColumns
+from vectorattributes.dsmcalc import get_bounds_window
+from vectorattributes.dsmfootprint import DSMFootprint
+from vectorattributes.geometry import FootprintGeometries, spatial_order
+from vectorattributes.metrics import timed
+from vectorattributes.prescreen import NullGrid
+from vectorattributes.projection import reproject_many
+from vectorattributes.rasters import BlockCache, cached_rasters
+from vectorattributes.readers import FeatureReader
+from vectorattributes.sinks import write_results
+from vectorattributes.zonalstats import ZONES, footprint_zone_calcs
+from itertools import islice
+import shapely.geometry
+from shapely.geometry import mapping as to_json
+from shapely.geometry import shape as get_shape
+
+
+# Default budget in dsm pixels of the shared raster read of a group of footprints calculated together in zonal mode,
+# 4096 x 4096 pixels
+ZONAL_WINDOW_PIXELS = 1 << 24
+
+
+class DSMFootprintBatch(object):
+    """
+    This class runs DSMFootprint over every feature of a collection.  Setup that is identical for every feature (crs
+    validation, checking the tree masked dsm and dem against the dsm) is done once for the whole collection instead of
+    once per feature.  The output for each feature is identical to DSMFootprint.output_geojson()
+
+    :param features: fiona collection, geojson FeatureCollection, path of a footprint file read with
+    readers.FeatureReader or any iterable of geojson features
+    :param feature_crs: crs of the features, if None the crs attribute of a fiona collection or FeatureReader is used
+    :param dsm: src object of raster already opened by rasterio or another i/o library
+    :param dsm_crs:
+    :param tree_dsm:
+    :param tree_dsm_crs:
+    :param dem:
+    :param dem_crs:
+    :param zonal: if True the zones of chunk_size features at a time are calculated together with
+    zonalstats.footprint_zone_calcs instead of one DSMCalc per zone.  Statistics then agree with DSMCalc to floating
+    point accumulation order.  A chunk is ordered spatially and split into groups of footprints whose shared raster
+    read stays within window_pixels, see zonal_groups
+    :param chunk_size: number of features per chunk.  The features of a chunk are reprojected and their footprint
+    geometries prepared together, and in zonal mode their zones are calculated together
+    :param cache_bytes: if set, the rasters are read through a rasters.BlockCache of this many bytes shared by the
+    dsm, tree masked dsm and dem, so the raster blocks neighbouring footprints have in common are decoded once
+    :param masked: if False DSMFootprint calculates the zones with dsmcalc.ArrayDSMCalc instead of DSMCalc, outside of
+    zonal mode
+    :param result_cache: cache.ResultCache or the directory of one.  The zone statistics of footprints already in the
+    cache are read from it instead of the rasters, and those of every other footprint are added to it
+    :param prescreen: if True the null check is decided from the counts of one prescreen.NullGrid of the dsm shared by
+    every feature where they allow, outside of zonal mode and only with a tree masked dsm
+    :param window_pixels: most dsm pixels of the shared raster read of a group of footprints in zonal mode, a
+    footprint whose zones alone cover more is calculated on its own with DSMCalc
+    """
+    def __init__(self, features, feature_crs, dsm, dsm_crs, tree_dsm=None, tree_dsm_crs=None, dem=None, dem_crs=None,
+                 zonal=False, chunk_size=256, cache_bytes=None, masked=True,
+                 result_cache=None, prescreen=False, window_pixels=ZONAL_WINDOW_PIXELS):
+        self.features = self.get_features(features)
+        if feature_crs is None:
+            feature_crs = getattr(self.features, 'crs', None)
+        self.block_cache = None
+        if cache_bytes:
+            self.block_cache = BlockCache(cache_bytes)
+            dsm, tree_dsm, dem = cached_rasters([dsm, tree_dsm, dem], cache=self.block_cache)
+        self.dsm = dsm
+        self.tree_dsm = tree_dsm
+        self.dem = dem
+        self.raster_crs = {'dsm_crs': dsm_crs, 'tree_dsm_crs': tree_dsm_crs, 'dem_crs': dem_crs}
+        self.input_feature_crs = DSMFootprint.crs_isvalid(feature_crs)
+        self.dsm_crs, self.tree_dsm_crs, self.dem_crs = DSMFootprint.raster_crs_isvalid(dsm_crs, tree_dsm,
+                                                                                        tree_dsm_crs, dem_crs)
+        self.zonal = zonal
+        self.chunk_size = chunk_size
+        self.window_pixels = window_pixels
+        self.masked = masked
+        if isinstance(result_cache, str):
+            result_cache = ResultCache(result_cache)
+        self.result_cache = result_cache
+        self.null_grid = NullGrid(self.dsm) if prescreen and tree_dsm is not None else None
+
+    @staticmethod
+    def get_features(features):
+        """
+        :return: iterable of the features in the input collection, read lazily if features is a file path
+        """
+        if isinstance(features, dict):
+            FeatureReader.check_collection(features)
+            return features['features']
+        if isinstance(features, str):
+            return FeatureReader(features)
+        return features
+
+    @timed('reproject_features')
+    def reproject_features(self, features):
+        """
+        Reproject the geometries of many features into the dsm crs with one coordinate transform
+        :return: list of copies of the features with their geometries in the dsm crs
+        """
+        features = [dict(feature.__geo_interface__ if hasattr(feature, '__geo_interface__') and
+                         not isinstance(feature, dict) else feature) for feature in features]
+        if self.input_feature_crs != self.dsm_crs and features:
+            geometries = reproject_many([get_shape(feature['geometry']) for feature in features],
+                                        from_proj=self.input_feature_crs, to_proj=self.dsm_crs)
+            for feature, geometry in zip(features, geometries):
+                feature['geometry'] = to_json(geometry)
+        return features
+
+    def reproject_feature(self, feature):
+        """
+        :return: copy of the feature with its geometry in the dsm crs
+        """
+        return self.reproject_features([feature])[0]
+
+    def process_feature(self, feature, calculate=True, reprojected=False, geometries=None):
+        """
+        :param reprojected: True if the feature geometry is already in the dsm crs
+        :param geometries: footprint geometries of the feature already prepared in the dsm crs
+        :return: DSMFootprint of a single feature of the collection
+        """
+        if not reprojected:
+            feature = self.reproject_feature(feature)
+        cached = calculate and self.result_cache is not None
+        footprint = DSMFootprint(feature, self.raster_crs['dsm_crs'], self.dsm,
+                                 self.raster_crs['dsm_crs'], tree_dsm=self.tree_dsm,
+                                 tree_dsm_crs=self.raster_crs['tree_dsm_crs'], dem=self.dem,
+                                 dem_crs=self.raster_crs['dem_crs'], calculate=calculate and not cached,
+                                 geometries=geometries, masked=self.masked, null_grid=self.null_grid,
+                                 raster_crs=(self.dsm_crs, self.tree_dsm_crs, self.dem_crs))
+        if cached:
+            key = self.result_cache.key(footprint)
+            self.result_cache.calculate(footprint, key, self.result_cache.get(key))
+        return footprint
+
+    def prepare_chunk(self, features):
+        """
+        Reproject a chunk of features and prepare their footprint geometries together
+        :return: tuple(list of the features in the dsm crs, geometry.FootprintGeometries of the chunk)
+        """
+        features = self.reproject_features(features)
+        return features, FootprintGeometries([get_shape(feature['geometry']) for feature in features],
+                                             self.raster_crs['dsm_crs'])
+
+    def process_features_chunk(self, features):
+        """
+        Prepare the footprint geometries of a chunk of features together and calculate each feature on its own
+        :return: generator of the DSMFootprint objects of the chunk
+        """
+        features, geometries = self.prepare_chunk(features)
+        for index, feature in enumerate(features):
+            yield self.process_feature(feature, reprojected=True, geometries=geometries.feature_geometries(index))
+
+    def window_size(self, bounds):
+        """
+        :param bounds: tuple(minx, miny, maxx, maxy) in the dsm crs
+        :return: number of dsm pixels in the window of the bounds
+        """
+        (row_start, row_stop), (col_start, col_stop) = get_bounds_window(self.dsm, bounds)
+        return (row_stop - row_start) * (col_stop - col_start)
+
+    def zone_bounds(self, footprint):
+        """
+        :return: combined bounds of the zones of a footprint covered by the dsm, None if no zone is covered
+        """
+        dsm_bbox = shapely.geometry.box(*self.dsm.bounds)
+        bounds = [geom.bounds for geom in (footprint.footprint, footprint.footprint_ground, footprint.footprint_eave,
+                                           footprint.footprint_roof)
+                  if geom is not None and not geom.is_empty and dsm_bbox.contains(geom)]
+        if not bounds:
+            return None
+        return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+    def zonal_groups(self, features, footprints):
+        """
+        Order footprints spatially and split them into groups of neighbours, such that the combined window of the zones
+        of a group stays within window_pixels
+        :param features: features of the footprints in the dsm crs
+        :return: tuple(list of lists of footprint indices to calculate together, list of the indices of the footprints
+        whose zones alone exceed window_pixels)
+        """
+        groups, outliers, group, group_bounds = [], [], [], None
+        for index in spatial_order(features):
+            index = int(index)
+            bounds = self.zone_bounds(footprints[index])
+            if bounds is not None and self.window_size(bounds) > self.window_pixels:
+                outliers.append(index)
+                continue
+            if bounds is not None and group_bounds is not None:
+                merged = (min(bounds[0], group_bounds[0]), min(bounds[1], group_bounds[1]),
+                          max(bounds[2], group_bounds[2]), max(bounds[3], group_bounds[3]))
+                if self.window_size(merged) > self.window_pixels:
+                    groups.append(group)
+                    group, merged = [], bounds
+                bounds = merged
+            group.append(index)
+            group_bounds = bounds if bounds is not None else group_bounds
+        if group:
+            groups.append(group)
+        return groups, outliers
+
+    @timed('process_chunk')
+    def process_chunk(self, features):
+        """
+        Prepare the footprint geometries and calculate the zones of a chunk of features together
+        :return: list of DSMFootprint objects of the chunk
+        """
+        features, geometries = self.prepare_chunk(features)
+        footprints = [self.process_feature(feature, calculate=False, reprojected=True,
+                                           geometries=geometries.feature_geometries(index))
+                      for index, feature in enumerate(features)]
+        keys = records = [None] * len(footprints)
+        if self.result_cache is not None:
+            keys = [self.result_cache.key(footprint, zonal=True) for footprint in footprints]
+            records = [self.result_cache.get(key) for key in keys]
+        # only the zones of footprints that are not cached are calculated, the outliers each with their own DSMCalc
+        missing = [index for index, record in enumerate(records) if record is None]
+        groups, _ = self.zonal_groups([features[index] for index in missing], [footprints[index] for index in missing])
+        zone_calcs = {}
+        for group in groups:
+            group = [missing[index] for index in group]
+            zone_calcs.update(zip(group, footprint_zone_calcs([footprints[index] for index in group], self.dsm,
+                                                              self.tree_dsm, self.dem)))
+        for index, footprint in enumerate(footprints):
+            for zone in ZONES:
+                if index in zone_calcs and zone_calcs[index][zone].exception is not None:
+                    raise zone_calcs[index][zone].exception
+            if self.result_cache is None:
+                footprint.calculate(zone_calcs=zone_calcs.get(index))
+            else:
+                self.result_cache.calculate(footprint, keys[index], records[index], zone_calcs=zone_calcs.get(index))
+        return footprints
+
+    def process(self):
+        """
+        Generator of DSMFootprint objects, one per feature and in the order of the input collection
+        """
+        return self.process_features(self.features)
+
+    def process_features(self, features):
+        """
+        Generator of DSMFootprint objects for any iterable of features, using the rasters and crs setup of the batch
+        """
+        features = iter(features)
+        chunk = list(islice(features, self.chunk_size))
+        while chunk:
+            for footprint in self.process_chunk(chunk) if self.zonal else self.process_features_chunk(chunk):
+                yield footprint
+            chunk = list(islice(features, self.chunk_size))
+
+    def output_geojson(self):
+        """
+        :return: geojson FeatureCollection with one DSMFootprint.output_geojson() feature per input feature
+        """
+        return {
+            'type': 'FeatureCollection',
+            'features': [processed.output_geojson() for processed in self.process()]
+        }
+
+    def write(self, destination, output_format='ndjson'):
+        """
+        Stream the processed features to a file as they are produced instead of collecting them in memory
+        :param destination: path of the output file or an open text file object
+        :param output_format: 'ndjson', 'geojsonseq' or 'featurecollection', see sinks.open_sink
+        :return: number of features written
+        """
+        return write_results(self.process(), destination, output_format)
+
+    def columns(self, properties=None):
+        """
+        Collect the processed features into typed columns instead of geojson dicts
+        :param properties: names of original feature properties to keep as columns
+        :return: columns.ResultColumns of the collection
+        """
+        size = len(self.features) if hasattr(self.features, '__len__') else 1024
+        return ResultColumns(size, properties=properties).extend(self.process())
+
+
+def process_collection(features, feature_crs, dsm, dsm_crs, tree_dsm=None, tree_dsm_crs=None, dem=None,
+                       dem_crs=None, zonal=False, chunk_size=256, cache_bytes=None, masked=True,
+                       result_cache=None, prescreen=False):
+    """
+    Run DSMFootprint over a whole collection of features
+    :return: geojson FeatureCollection of the processed features
+    """
+    return DSMFootprintBatch(features, feature_crs, dsm, dsm_crs, tree_dsm=tree_dsm, tree_dsm_crs=tree_dsm_crs,
+                             dem=dem, dem_crs=dem_crs, zonal=zonal, chunk_size=chunk_size,
+                             cache_bytes=cache_bytes, masked=masked, result_cache=result_cache,
+                             prescreen=prescreen).output_geojson()
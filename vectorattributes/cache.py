@@ -0,0 +1,167 @@
+from vectorattributes.dsmcalc import DSMCalc
+from vectorattributes.footprint import Footprint
+from vectorattributes.records import ZoneStats
+from vectorattributes.zonalstats import ZoneResult
+import hashlib
+import json
+import os
+import shapely
+
+
+# Version of the cache records, bump it when a change to the calculations makes cached statistics stale
+CACHE_VERSION = 2
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """
+    :return: sha256 hex digest of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as src:
+        for chunk in iter(lambda: src.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def raster_fingerprint(raster, checksum=False):
+    """
+    Identify the content of an open raster without reading it: its path, file size and modification time, shape and
+    transform
+    :param raster: rasterio dataset or any raster with the same attributes, or None
+    :param checksum: if True the sha256 of the file content is used instead of the modification time
+    :return: dict of the fingerprint, None for a missing raster
+    """
+    if raster is None:
+        return None
+    fingerprint = {'name': raster.name, 'shape': [raster.height, raster.width],
+                   'transform': list(raster.transform)[:6]}
+    if os.path.isfile(raster.name):
+        stat = os.stat(raster.name)
+        fingerprint['size'] = stat.st_size
+        if checksum:
+            fingerprint['sha256'] = file_checksum(raster.name)
+        else:
+            fingerprint['mtime'] = stat.st_mtime_ns
+    return fingerprint
+
+
+def stats_params():
+    """
+    :return: the parameters the zone statistics depend on, the spatial_calcs of Footprint and the dsm_calc parameters
+    of DSMCalc.  The error thresholds are left out as they only affect DSMFootprint.calculate_properties
+    """
+    return {'spatial_calcs': Footprint.DEFAULT_PARAMS['spatial_calcs'],
+            'dsm_calc': DSMCalc.DEFAULT_PARAMS['dsm_calc']}
+
+
+def zone_calcs_from_record(record):
+    """
+    :param record: dict of DSMFootprint.zone_record()
+    :return: dict of zone name to ZoneResult, the zone_calcs input of DSMFootprint.calculate
+    """
+    errors = record['errors']
+    zone_calcs = {'null': ZoneResult(errors={'dsm_null': errors['dsm_null']}),
+                  'footprint': ZoneResult(ZoneStats(record['footprint']), {
+                      'negative_elevation': errors['negative_elevation'],
+                      'comparison_factor_exceeded': errors['comparison_factor_exceeded']})}
+    for zone in ('ground', 'eave', 'roof'):
+        zone_calcs[zone] = ZoneResult(ZoneStats(record[zone]), {})
+    return zone_calcs
+
+
+class ResultCache(object):
+    """
+    On-disk cache of the zone statistics of footprints, so reruns over the same rasters only calculate new, edited or
+    parameter affected footprints.  Records are stored under the sha256 of their content address: the footprint
+    geometry and its crs, the fingerprints of the dsm, tree masked dsm and dem, the parameters of stats_params and
+    whether the zones were calculated in zonal mode, whose statistics can differ from DSMCalc in the last digits.
+
+    Only the zone statistics are cached, the calculated properties and their errors are derived again from a cached
+    record with DSMFootprint.calculate_properties, so a change of the error thresholds of NEW_DEFAULT_PARAMS never
+    reads the rasters again.  Records are written atomically, so several processes can share a cache directory
+
+    :param directory: directory of the cache, created if it does not exist
+    :param checksum: fingerprint the rasters by the sha256 of their content instead of their modification time
+    """
+    def __init__(self, directory, checksum=False):
+        self.directory = directory
+        self.checksum = checksum
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def raster_fingerprint(self, raster):
+        """
+        :return: raster_fingerprint of the raster, computed once per raster object
+        """
+        if id(raster) not in self._fingerprints:
+            self._fingerprints[id(raster)] = (raster, raster_fingerprint(raster, checksum=self.checksum))
+        return self._fingerprints[id(raster)][1]
+
+    def key(self, footprint, zonal=False):
+        """
+        :param footprint: DSMFootprint with its geometries prepared
+        :param zonal: True if the zone statistics are calculated with zonalstats.footprint_zone_calcs
+        :return: hex content address of the zone statistics of the footprint
+        """
+        address = {
+            'version': CACHE_VERSION,
+            'geometry': shapely.to_wkb(footprint.footprint, hex=True),
+            'crs': footprint.geometry_crs,
+            'rasters': [self.raster_fingerprint(raster)
+                        for raster in (footprint.dsm, getattr(footprint, 'tree_dsm', None), footprint.dem)],
+            'params': stats_params(),
+            'zonal': zonal
+        }
+        return hashlib.sha256(json.dumps(address, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """
+        :return: the cached DSMFootprint.zone_record() of the key, None if it is not cached
+        """
+        try:
+            with open(self.path(key), 'r') as src:
+                record = json.load(src)
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    def put(self, key, record):
+        """
+        Store a DSMFootprint.zone_record() under its key
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as dst:
+            json.dump(record, dst)
+        os.replace(temporary, path)
+
+    def stats(self):
+        """
+        :return: dict of the hit and miss counters
+        """
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def calculate(self, footprint, key, record, zone_calcs=None):
+        """
+        Calculate a DSMFootprint created with calculate=False from its cached zone statistics, or on a cache miss
+        calculate its zones and cache them
+        :param key: key of the footprint
+        :param record: record of the key returned by get, None on a cache miss
+        :param zone_calcs: zone_calcs of the footprint calculated elsewhere, used on a cache miss
+        :return: footprint
+        """
+        if record is not None:
+            footprint.calculate(zone_calcs=zone_calcs_from_record(record))
+            return footprint
+        footprint.calculate_zones(zone_calcs)
+        self.put(key, footprint.zone_record())
+        footprint.calculate_properties()
+        return footprint
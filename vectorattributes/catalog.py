@@ -0,0 +1,352 @@
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.footprint import Footprint
+from vectorattributes.metrics import timed
+from vectorattributes.projection import crs_to_dict, reproject_many
+from vectorattributes.rasters import open_raster, window_ranges
+from vectorattributes.tiles import ground_buffer
+from affine import Affine
+from collections import OrderedDict, defaultdict
+from rasterio.transform import TransformMethodsMixin
+from shapely.geometry import shape as get_shape
+import math
+import numpy as np
+import rasterio
+import shapely
+
+# Raster layers of a scene, in the order of the dsm, tree_dsm and dem arguments of DSMFootprint
+LAYERS = ('dsm', 'tree_dsm', 'dtm')
+# Default number of raster handles a RasterPool keeps open
+DEFAULT_MAX_OPEN = 32
+# Pixels read around a mosaic beyond the ground buffer, so the windows of the zones are never cut at its edge
+MOSAIC_PADDING = 2
+
+
+class RasterPool(object):
+    """
+    Open raster handles by path, opened on first use and closed least recently used first once more than max_open are
+    open.  A handle is only closed when another raster is opened, so the handles of the scene being processed stay
+    open as long as max_open holds all of its layers
+
+    :param max_open: number of handles kept open, at least the number of LAYERS
+    :param memmap: open uncompressed GeoTIFFs as rasters.MemmapRaster, see rasters.open_raster
+    """
+    def __init__(self, max_open=DEFAULT_MAX_OPEN, memmap=False):
+        if max_open < len(LAYERS):
+            raise ValueError('max_open must be at least {}'.format(len(LAYERS)))
+        self.max_open = max_open
+        self.memmap = memmap
+        self.handles = OrderedDict()
+        self.opens = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, path):
+        """
+        :return: open handle of the raster at path, None if path is None
+        """
+        if path is None:
+            return None
+        handle = self.handles.get(path)
+        if handle is not None:
+            self.hits += 1
+            self.handles.move_to_end(path)
+            return handle
+        handle = open_raster(path, memmap=self.memmap)
+        self.opens += 1
+        self.handles[path] = handle
+        while len(self.handles) > self.max_open:
+            _, evicted = self.handles.popitem(last=False)
+            evicted.close()
+        return handle
+
+    def close(self):
+        """
+        Close every open handle
+        """
+        while self.handles:
+            _, handle = self.handles.popitem(last=False)
+            handle.close()
+
+
+def grid_offset(transform, other):
+    """
+    :return: tuple(row, col) offset in whole pixels of the origin of the other transform on the grid of transform,
+    None if the two grids do not share pixel edges and sizes
+    """
+    if transform[1] or transform[3] or other[1] or other[3] or \
+            not np.isclose(transform.a, other.a) or not np.isclose(transform.e, other.e):
+        return None
+    col, row = (other.c - transform.c) / transform.a, (other.f - transform.f) / transform.e
+    if not np.isclose(col, round(col), atol=1e-6) or not np.isclose(row, round(row), atol=1e-6):
+        return None
+    return int(round(row)), int(round(col))
+
+
+class MosaicRaster(TransformMethodsMixin):
+    """
+    In-memory raster of the first band of several rasters on one pixel grid over given bounds, for footprints that
+    cross the seam between scenes.  Pixels take the value of the first raster in order that has data there, pixels no
+    raster covers are nodata.  It has the attributes and methods of a rasterio dataset that DSMCalc, RasterWindow and
+    the zonal calculations use, and as the pixels are those of the scenes the statistics are the ones of a single
+    raster of the whole area
+
+    :param rasters: list of open rasters sharing crs, dtype and pixel grid, raises ValueError if they do not
+    :param bounds: tuple(minx, miny, maxx, maxy) to cover, grown to whole pixels of the grid
+    """
+    def __init__(self, rasters, bounds):
+        first = rasters[0]
+        for raster in rasters[1:]:
+            if grid_offset(first.transform, raster.transform) is None or raster.dtypes[0] != first.dtypes[0]:
+                raise ValueError('Cannot mosaic {} and {} without resampling, their pixel grids or data types differ'
+                                 .format(first.name, raster.name))
+        transform = first.transform
+        cols = sorted(((x - transform.c) / transform.a for x in bounds[0::2]))
+        rows = sorted(((y - transform.f) / transform.e for y in bounds[1::2]))
+        row_start, col_start = int(math.floor(rows[0])), int(math.floor(cols[0]))
+        self.name = 'mosaic of {}'.format(', '.join(raster.name for raster in rasters))
+        self.crs = first.crs
+        self.transform = transform * Affine.translation(col_start, row_start)
+        self.res = first.res
+        self.height = int(math.ceil(rows[1])) - row_start
+        self.width = int(math.ceil(cols[1])) - col_start
+        self.count = 1
+        self.dtypes = first.dtypes[:1]
+        self.nodata = next((raster.nodata for raster in rasters if raster.nodata is not None), None)
+        self.meta = dict(first.meta, count=1, width=self.width, height=self.height, transform=self.transform,
+                         nodata=self.nodata)
+        self.block_shapes = [(self.height, self.width)]
+        self.bounds = rasterio.coords.BoundingBox(*rasterio.transform.array_bounds(self.height, self.width,
+                                                                                   self.transform))
+        self.band = self.paste(rasters)
+        self.closed = False
+
+    def __repr__(self):
+        return "<MosaicRaster of {} rows {} cols>".format(self.height, self.width)
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def paste(self, rasters):
+        """
+        :return: read-only array of the mosaic, each raster read once for its part of it
+        """
+        band = np.full(self.shape, self.nodata if self.nodata is not None else 0, dtype=self.dtypes[0])
+        filled = np.zeros(self.shape, dtype=bool)
+        for raster in rasters:
+            row_offset, col_offset = grid_offset(raster.transform, self.transform)
+            rows = range(max(row_offset, 0), min(row_offset + self.height, raster.height))
+            cols = range(max(col_offset, 0), min(col_offset + self.width, raster.width))
+            if not rows or not cols:
+                continue
+            data = raster.read(1, window=((rows.start, rows.stop), (cols.start, cols.stop)))
+            target = (slice(rows.start - row_offset, rows.stop - row_offset),
+                      slice(cols.start - col_offset, cols.stop - col_offset))
+            empty = ~filled[target]
+            if raster.nodata is not None:
+                empty &= data != raster.nodata
+            band[target][empty] = data[empty]
+            filled[target] |= empty
+        band.flags.writeable = False
+        return band
+
+    def read(self, indexes=None, window=None):
+        """
+        Read the band like rasterio's read
+        :param indexes: 1, or None for a 3d array with a single band
+        :param window: tuple((row start, row stop), (col start, col stop)) or rasterio Window, the whole band if None
+        :return: read-only array of the window
+        """
+        if indexes not in (None, 1):
+            raise ValueError('MosaicRaster only reads band 1')
+        rows, cols = window_ranges(window, self.height, self.width)
+        data = self.band[rows.start:rows.stop, cols.start:cols.stop]
+        return data if indexes is not None else data[np.newaxis]
+
+    def close(self):
+        self.band = None
+        self.closed = True
+
+
+class RasterCatalog(object):
+    """
+    Index of many scenes, each a dsm with an optional tree masked dsm and dtm, by the area all layers of a scene
+    cover, held in a shapely STRtree.  A footprint is processed on the first scene that covers it and its ground
+    buffer, or on a MosaicRaster of the scenes it crosses if no single scene does.  Raster handles are opened on first
+    use and shared through a RasterPool, so a collection spanning any number of scenes runs in a single job.
+
+    Every layer of every scene has to be in the same crs, and either all scenes or none have a tree masked dsm and
+    dtm.  Only the metadata of the rasters is read when the catalog is created
+
+    :param scenes: list of dicts of LAYERS to raster paths, 'tree_dsm' and 'dtm' optional, or of dsm paths
+    :param margin: distance in crs units a footprint has to be inside a scene to be processed on it, the ground buffer
+    if None
+    :param max_open: raster handles kept open, see RasterPool
+    :param memmap: open uncompressed GeoTIFFs as rasters.MemmapRaster
+    """
+    def __init__(self, scenes, margin=None, max_open=DEFAULT_MAX_OPEN, memmap=False):
+        if not scenes:
+            raise ValueError('A catalog needs at least one scene')
+        self.scenes = [self.scene_paths(scene) for scene in scenes]
+        for layer in LAYERS[1:]:
+            if len(set(scene[layer] is None for scene in self.scenes)) > 1:
+                raise ValueError('Either every scene or none has a {}'.format(layer))
+        self.margin = margin if margin is not None else ground_buffer()
+        self.crs = None
+        self.areas = np.array([self.scene_area(scene) for scene in self.scenes], dtype=object)
+        self.tree = shapely.STRtree(self.areas)
+        self.pool = RasterPool(max_open=max_open, memmap=memmap)
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def scene_paths(scene):
+        """
+        :return: dict of every layer name to its path or None
+        """
+        if isinstance(scene, str):
+            scene = {'dsm': scene}
+        unknown = set(scene) - set(LAYERS)
+        if unknown:
+            raise ValueError('Unknown scene layers {}, must be of {}'.format(sorted(unknown), ', '.join(LAYERS)))
+        return {layer: scene.get(layer) for layer in LAYERS}
+
+    def scene_area(self, scene):
+        """
+        Read the metadata of the layers of a scene and check their crs against the catalog
+        :return: shapely box of the area every layer of the scene covers
+        """
+        area = None
+        for path in scene.values():
+            if path is None:
+                continue
+            with rasterio.open(path, 'r') as src:
+                crs = crs_to_dict(src.crs)
+                bounds = shapely.box(*src.bounds)
+            if self.crs is None:
+                self.crs = crs
+            elif crs != self.crs:
+                raise ValueError('All catalog rasters must have the same crs, {} is {} not {}'
+                                 .format(path, crs, self.crs))
+            area = bounds if area is None else shapely.intersection(area, bounds)
+        return area
+
+    def scene_of(self, geometries):
+        """
+        :param geometries: array of shapely geometries in the catalog crs
+        :return: int array of the index of the first scene covering each geometry and its margin, -1 if none does
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        scenes = np.full(len(geometries), -1, dtype=np.int64)
+        if not len(geometries):
+            return scenes
+        geometry_index, scene_index = self.tree.query(shapely.buffer(geometries, self.margin), predicate='within')
+        # sort descending so the first scene of every geometry is assigned last
+        order = np.lexsort((-scene_index, geometry_index))
+        scenes[geometry_index[order]] = scene_index[order]
+        return scenes
+
+    @timed('assign_scenes')
+    def assign(self, features, feature_crs):
+        """
+        Assign every feature to the first scene covering it
+        :param feature_crs: validated crs string of the features, Ex. 'epsg:4326'
+        :return: tuple(dict of scene index to the list of the indices of its features, list of the indices of the
+        features no single scene covers, array of the feature geometries in the catalog crs)
+        """
+        geometries = np.array([get_shape(feature['geometry']) for feature in features], dtype=object)
+        catalog_crs = Footprint.crs_isvalid(self.crs)
+        if feature_crs != catalog_crs and len(geometries):
+            geometries = np.array(reproject_many(geometries, from_proj=feature_crs, to_proj=catalog_crs),
+                                  dtype=object)
+        scenes = self.scene_of(geometries)
+        assigned = defaultdict(list)
+        for index in np.argsort(scenes, kind='stable'):
+            if scenes[index] >= 0:
+                assigned[int(scenes[index])].append(int(index))
+        return dict(assigned), [int(index) for index in np.flatnonzero(scenes < 0)], geometries
+
+    def open_scene(self, scene):
+        """
+        :return: list of the open dsm, tree masked dsm and dtm of a scene, None for missing layers
+        """
+        return [self.pool.get(self.scenes[scene][layer]) for layer in LAYERS]
+
+    @timed('mosaic')
+    def mosaic(self, geometry):
+        """
+        Mosaic the scenes a geometry and its margin cross
+        :param geometry: shapely geometry in the catalog crs
+        :return: list of MosaicRaster objects of the dsm, tree masked dsm and dtm, None for missing layers
+        """
+        area = shapely.buffer(geometry, self.margin)
+        scenes = sorted(self.tree.query(area, predicate='intersects'))
+        if not scenes or not shapely.union_all(self.areas[scenes]).contains(area):
+            raise ValueError('Footprint not contained in the catalog area')
+        if len(scenes) > self.pool.max_open:
+            raise ValueError('Footprint crosses {} scenes, more than the {} open rasters of the pool'
+                             .format(len(scenes), self.pool.max_open))
+        size = MOSAIC_PADDING * max(abs(value) for value in self.pool.get(self.scenes[scenes[0]]['dsm']).res)
+        bounds = shapely.buffer(shapely.envelope(area), size, join_style='mitre').bounds
+        mosaics = []
+        for layer in LAYERS:
+            if self.scenes[scenes[0]][layer] is None:
+                mosaics.append(None)
+                continue
+            mosaics.append(MosaicRaster([self.pool.get(self.scenes[scene][layer]) for scene in scenes], bounds))
+        return mosaics
+
+    def close(self):
+        self.pool.close()
+
+
+def process_catalog(features, feature_crs, catalog, **batch_options):
+    """
+    Process a collection over the scenes of a catalog.  The features covered by a scene are processed together on the
+    open rasters of that scene, scene by scene, then every feature crossing a seam on a mosaic of the scenes it
+    crosses.  A feature no scene or mosaic covers raises ValueError like DSMFootprint does
+    :param catalog: RasterCatalog
+    :param batch_options: zonal, chunk_size, cache_bytes, masked, result_cache or prescreen options of
+    DSMFootprintBatch
+    :return: generator of (input index, DSMFootprint) tuples, in scene order
+    """
+    collection = DSMFootprintBatch.get_features(features)
+    features = list(collection)
+    if feature_crs is None:
+        feature_crs = getattr(collection, 'crs', None)
+    assigned, seams, geometries = catalog.assign(features, Footprint.crs_isvalid(feature_crs))
+    for scene, indices in assigned.items():
+        for index, footprint in zip(indices, catalog_batch(catalog, [features[index] for index in indices],
+                                                          feature_crs, catalog.open_scene(scene), batch_options)):
+            yield index, footprint
+    for index in seams:
+        for footprint in catalog_batch(catalog, [features[index]], feature_crs, catalog.mosaic(geometries[index]),
+                                       batch_options):
+            yield index, footprint
+
+
+def catalog_batch(catalog, features, feature_crs, rasters, batch_options):
+    """
+    :param rasters: list of the dsm, tree masked dsm and dtm to process the features on
+    :return: generator of the DSMFootprint objects of the features
+    """
+    dsm, tree_dsm, dtm = rasters
+    batch = DSMFootprintBatch(features, feature_crs, dsm, catalog.crs, tree_dsm=tree_dsm,
+                              tree_dsm_crs=catalog.crs if tree_dsm is not None else None, dem=dtm,
+                              dem_crs=catalog.crs if dtm is not None else None, **batch_options)
+    return batch.process()
@@ -0,0 +1,154 @@
+"""
+Command line runner of a whole scene with checkpoints, so an interrupted run resumes after its last committed chunk
+
+    python -m vectorattributes footprints.shp dsm.tif --tree-dsm tree_dsm.tif --dtm dtm.tif -o buildings.ndjson
+"""
+from vectorattributes.readers import FeatureReader
+from vectorattributes.runner import run_scene
+from vectorattributes.sinks import GeojsonSequenceSink, NDJSONSink
+from itertools import islice
+import argparse
+import json
+import os
+import sys
+
+# Output formats that can be appended to a chunk at a time, a FeatureCollection is only valid once it is complete
+CHECKPOINT_SINKS = {
+    'ndjson': NDJSONSink,
+    'geojsonseq': GeojsonSequenceSink
+}
+
+
+def checkpoint_path(output):
+    return output + '.checkpoint.json'
+
+
+def read_checkpoint(path):
+    """
+    :return: dict of the checkpoint, None if there is no checkpoint
+    """
+    try:
+        with open(path, 'r') as src:
+            return json.load(src)
+    except IOError:
+        return None
+
+
+def write_checkpoint(path, checkpoint):
+    """
+    Replace the checkpoint atomically, a crash leaves either the previous or the new checkpoint
+    """
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'w') as dst:
+        json.dump(checkpoint, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(temporary, path)
+
+
+def run_inputs(footprint_path, dsm_path, tree_dsm_path, dtm_path, zonal, output_format, feature_count):
+    """
+    :return: dict of the inputs of a run, a checkpoint only resumes a run with the same inputs
+    """
+    return {'footprints': os.path.abspath(footprint_path),
+            'rasters': [os.path.abspath(path) if path is not None else None
+                        for path in (dsm_path, tree_dsm_path, dtm_path)],
+            'zonal': zonal, 'format': output_format, 'features': feature_count}
+
+
+def run_checkpointed(footprint_path, dsm_path, output, tree_dsm_path=None, dtm_path=None, workers=None,
+                     chunk_size=1024, zonal=False, memmap=False, cache_bytes=None, result_cache=None,
+                     output_format='ndjson', restart=False, log=None, prescreen=False):
+    """
+    Process every footprint of a scene into a record per line output file, in the order of the footprint file.
+    Results are committed a chunk at a time: the chunk is appended to the output and synced, then the checkpoint
+    next to the output records the number of committed features and the output size.  A rerun after a crash truncates
+    the output to the checkpointed size, dropping a partly written chunk, and processes the remaining features only.
+    Features are streamed from the footprint file, a first pass counts them and the run skips the committed ones
+
+    :param output: path of the output file
+    :param workers: number of worker processes, see runner.run_scene
+    :param chunk_size: number of features committed at a time
+    :param cache_bytes: byte budget of the raster block cache of each worker
+    :param output_format: 'ndjson' or 'geojsonseq'
+    :param restart: ignore an existing checkpoint and start over
+    :param log: text file progress is written to, None for no progress
+    :param prescreen: decide the null check from the coarse nodata counts of the dsm where they allow, see
+    runner.run_scene
+    :return: number of features processed by this call
+    """
+    if output_format not in CHECKPOINT_SINKS:
+        raise ValueError('Output format must be one of {}'.format(', '.join(sorted(CHECKPOINT_SINKS))))
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+    reader = FeatureReader(footprint_path)
+    feature_count = sum(1 for _ in reader)
+    inputs = run_inputs(footprint_path, dsm_path, tree_dsm_path, dtm_path, zonal, output_format, feature_count)
+    checkpoint = None if restart else read_checkpoint(checkpoint_path(output))
+    if checkpoint is not None and checkpoint['inputs'] != inputs:
+        raise RuntimeError('The checkpoint {} belongs to a run with other inputs, rerun with restart to start over'
+                           .format(checkpoint_path(output)))
+    if checkpoint is None:
+        checkpoint = {'inputs': inputs, 'features': 0, 'bytes': 0}
+    elif (os.path.getsize(output) if os.path.exists(output) else 0) < checkpoint['bytes']:
+        raise RuntimeError('The output {} is shorter than its checkpoint {}, rerun with restart to start over'
+                           .format(output, checkpoint_path(output)))
+    start = checkpoint['features']
+    if start == feature_count:
+        return 0
+    with open(output, 'a' if os.path.exists(output) else 'w') as dst:
+        dst.truncate(checkpoint['bytes'])
+        dst.seek(checkpoint['bytes'])
+        sink = CHECKPOINT_SINKS[output_format](dst)
+        results = run_scene(None, dsm_path, tree_dsm_path=tree_dsm_path, dtm_path=dtm_path, workers=workers,
+                            chunk_size=min(chunk_size, 64), features=islice(reader, start, None),
+                            feature_crs=reader.crs,
+                            zonal=zonal, memmap=memmap, cache_bytes=cache_bytes, result_cache=result_cache,
+                            prescreen=prescreen)
+        for _, output_geojson in results:
+            sink.write(output_geojson)
+            if sink.count % chunk_size == 0 or start + sink.count == feature_count:
+                dst.flush()
+                os.fsync(dst.fileno())
+                checkpoint.update(features=start + sink.count, bytes=dst.tell())
+                write_checkpoint(checkpoint_path(output), checkpoint)
+                if log is not None:
+                    log.write('{}/{} features\n'.format(checkpoint['features'], feature_count))
+        return sink.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m vectorattributes',
+                                     description='Calculate the height attributes of the building footprints of a '
+                                                 'scene, resuming an interrupted run from its checkpoint')
+    parser.add_argument('footprints', help='footprint file, any format readers.FeatureReader can read')
+    parser.add_argument('dsm', help='dsm raster')
+    parser.add_argument('--tree-dsm', default=None, help='tree masked dsm raster')
+    parser.add_argument('--dtm', default=None, help='dtm raster')
+    parser.add_argument('-o', '--output', required=True, help='output file, newline delimited geojson by default')
+    parser.add_argument('--format', default='ndjson', choices=sorted(CHECKPOINT_SINKS), help='output format')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the number of cpus')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='features committed per checkpoint')
+    parser.add_argument('--cache-mb', type=float, default=None,
+                        help='size of the raster block cache of each worker in megabytes, the features are '
+                             'streamed so memory does not grow with the number of features')
+    parser.add_argument('--zonal', action='store_true', help='calculate the zones of a chunk together')
+    parser.add_argument('--memmap', action='store_true', help='memory map uncompressed GeoTIFFs')
+    parser.add_argument('--result-cache', default=None, help='directory of a result cache shared between runs')
+    parser.add_argument('--prescreen', action='store_true',
+                        help='decide the null check from coarse nodata counts of the dsm where they allow')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+    cache_bytes = int(args.cache_mb * (1 << 20)) if args.cache_mb is not None else None
+    try:
+        count = run_checkpointed(args.footprints, args.dsm, args.output, tree_dsm_path=args.tree_dsm,
+                                 dtm_path=args.dtm, workers=args.workers, chunk_size=args.chunk_size,
+                                 zonal=args.zonal, memmap=args.memmap, cache_bytes=cache_bytes,
+                                 result_cache=args.result_cache, output_format=args.format, restart=args.restart,
+                                 log=None if args.quiet else sys.stderr, prescreen=args.prescreen)
+    except (RuntimeError, ValueError) as error:
+        parser.exit(2, '{}: error: {}\n'.format(parser.prog, error))
+    if not args.quiet:
+        sys.stderr.write('{} features written to {}\n'.format(count, args.output))
+    return 0
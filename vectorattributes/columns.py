@@ -0,0 +1,198 @@
+from vectorattributes.geometry import FootprintGeometries, to_geometry_array
+from vectorattributes.records import BUFFER0, CALCULATION_ERRORS, CONVEX_HULL, FOOTPRINT_ERRORS
+import json
+import numpy as np
+import shapely
+
+
+OUTPUT_ZONES = ('ground', 'eave', 'roof')
+
+# Zone statistics of DSMFootprint.output_geojson and their column dtype.  pixel_count is a float so a zone without a
+# count stays NaN like in the geojson output
+STAT_COLUMNS = [
+    ('tree_masked_dsm', np.bool_),
+    ('pixel_count', np.float64),
+    ('height_max', np.float64),
+    ('min', np.float64),
+    ('max', np.float64),
+    ('mean', np.float64),
+    ('sum', np.float64),
+    ('median', np.float64),
+    ('10th_perc', np.float64),
+    ('25th_perc', np.float64),
+    ('75th_perc', np.float64),
+    ('90th_perc', np.float64),
+    ('range', np.float64),
+    ('mode', np.float64),
+    ('minor', np.float64),
+    ('area', np.float64),
+    ('coverage', np.float64),
+    ('elevation', np.float64)
+]
+
+ZONE_EXTRA_COLUMNS = {
+    'ground': [],
+    'eave': [('height', np.float64)],
+    'roof': [('height', np.float64), ('pitch', object)]
+}
+
+# Error flag columns error_<name> and their bit in the error bitmask
+ERROR_COLUMNS = [('buffer0', BUFFER0), ('convex_hull', CONVEX_HULL)] + \
+    [(name, bit) for name, bit in FOOTPRINT_ERRORS.items() if name != 'geometry'] + list(CALCULATION_ERRORS.items())
+
+
+def column_schema():
+    """
+    :return: list of (column name, dtype) of the statistics and error columns, zone statistics are named
+    <zone>_<stat> Ex. roof_max, eave_median, errors error_<name> Ex. error_dsm_null, error_roof_height and the
+    error bitmask of records errors
+    """
+    schema = [('height_max', np.float64)]
+    for zone in OUTPUT_ZONES:
+        schema.extend(('{}_{}'.format(zone, stat), dtype) for stat, dtype in STAT_COLUMNS + ZONE_EXTRA_COLUMNS[zone])
+    schema.extend(('error_{}'.format(name), np.bool_) for name, _ in ERROR_COLUMNS)
+    schema.append(('errors', np.uint32))
+    return schema
+
+
+def empty_column(dtype, size):
+    if dtype is np.float64:
+        return np.full(size, np.NaN)
+    if dtype is object:
+        return np.full(size, None, dtype=object)
+    return np.zeros(size, dtype=dtype)
+
+
+class ResultColumns(object):
+    """
+    This class collects the results of many DSMFootprints into preallocated typed numpy columns instead of one nested
+    dict per building: one column per statistic per zone, the error flags, the footprint geometry and optionally
+    some of the original properties.  The columns grow if more footprints are added than were allocated.  Exports to
+    numpy structured arrays, Arrow tables, Parquet files and GeoDataFrames share the column memory where the format
+    allows it
+
+    :param size: number of footprints to allocate the columns for
+    :param properties: names of original feature properties to keep as columns
+    """
+    def __init__(self, size=1024, properties=None):
+        self.schema = column_schema()
+        self.properties = list(properties or [])
+        self.count = 0
+        self.capacity = max(int(size), 1)
+        self.data = {name: empty_column(dtype, self.capacity) for name, dtype in self.schema}
+        self.data.update({name: empty_column(object, self.capacity) for name in self.properties})
+        self.geometries = empty_column(object, self.capacity)
+        self.geometry_crs = empty_column(object, self.capacity)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        """
+        Double the capacity of every column
+        """
+        self.capacity *= 2
+        self.data = {name: self.grown(column) for name, column in self.data.items()}
+        self.geometries = self.grown(self.geometries)
+        self.geometry_crs = self.grown(self.geometry_crs)
+
+    def grown(self, column):
+        grown = empty_column(column.dtype.type if column.dtype != object else object, self.capacity)
+        grown[:self.count] = column[:self.count]
+        return grown
+
+    def append(self, footprint):
+        """
+        Add the results of one calculated DSMFootprint
+        """
+        if self.count == self.capacity:
+            self.grow()
+        row = self.count
+        data = self.data
+        data['height_max'][row] = footprint.footprint_calcs['height_max']
+        for zone, calcs in (('ground', footprint.ground_calcs), ('eave', footprint.eave_calcs),
+                            ('roof', footprint.roof_calcs)):
+            for stat, _ in STAT_COLUMNS + ZONE_EXTRA_COLUMNS[zone]:
+                if stat in calcs:
+                    data['{}_{}'.format(zone, stat)][row] = calcs[stat]
+        error_bits = footprint.error_flags.bits
+        data['errors'][row] = error_bits
+        for name, bit in ERROR_COLUMNS:
+            data['error_' + name][row] = bool(error_bits & bit)
+        for name in self.properties:
+            data[name][row] = footprint.properties.get(name)
+        self.geometries[row] = footprint.footprint
+        self.geometry_crs[row] = footprint.geometry_crs
+        self.count += 1
+
+    def extend(self, footprints):
+        """
+        Add the results of every DSMFootprint of an iterable, e.g. the DSMFootprintBatch.process() generator
+        :return: self
+        """
+        for footprint in footprints:
+            self.append(footprint)
+        return self
+
+    def columns(self):
+        """
+        :return: dict of column name to numpy array view of the filled rows
+        """
+        return {name: column[:self.count] for name, column in self.data.items()}
+
+    def geometry_wkb(self, to_proj='epsg:4326'):
+        """
+        Convert all footprints to to_proj, grouped by crs, and encode them as WKB in one vectorized call each
+        :return: numpy object array of WKB bytes
+        """
+        geometries = FootprintGeometries.reproject_groups(to_geometry_array(self.geometries[:self.count]),
+                                                          self.geometry_crs[:self.count], to_proj)
+        return shapely.to_wkb(geometries)
+
+    def to_structured_array(self):
+        """
+        :return: numpy structured array with one field per column, plus the WKB geometry
+        """
+        columns = self.columns()
+        columns['geometry'] = self.geometry_wkb()
+        array = np.empty(self.count, dtype=[(name, column.dtype) for name, column in columns.items()])
+        for name, column in columns.items():
+            array[name] = column
+        return array
+
+    def to_arrow(self):
+        """
+        :return: pyarrow Table of the columns with a WKB geometry column and GeoParquet metadata
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('pyarrow is required to export results to Arrow or Parquet')
+        arrays = {}
+        for name, column in self.columns().items():
+            arrays[name] = pyarrow.array(column, from_pandas=column.dtype == object)
+        arrays['geometry'] = pyarrow.array(self.geometry_wkb(), type=pyarrow.binary())
+        geo_metadata = {'version': '1.0.0', 'primary_column': 'geometry',
+                        'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': []}}}
+        return pyarrow.table(arrays, metadata={'geo': json.dumps(geo_metadata)})
+
+    def to_parquet(self, path, **kwargs):
+        """
+        Write the columns to a GeoParquet file, kwargs are passed to pyarrow.parquet.write_table
+        """
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow is required to export results to Arrow or Parquet')
+        pyarrow.parquet.write_table(self.to_arrow(), path, **kwargs)
+
+    def to_geodataframe(self):
+        """
+        :return: geopandas GeoDataFrame of the columns in epsg:4326
+        """
+        try:
+            import geopandas
+        except ImportError:
+            raise ImportError('geopandas is required to export results to a GeoDataFrame')
+        geometry = geopandas.GeoSeries.from_wkb(self.geometry_wkb(), crs='EPSG:4326')
+        return geopandas.GeoDataFrame(self.columns(), geometry=geometry)
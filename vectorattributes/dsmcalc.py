@@ -1,3 +1,6 @@
+from vectorattributes.records import ZoneStats
+from vectorattributes.metrics import timed
+from vectorattributes.rasters import window_ranges
 import shapely.geometry
 from shapely.geometry.base import BaseGeometry, BaseMultipartGeometry
 from affine import Affine
@@ -17,6 +20,46 @@ DEFAULT_PARAMS = {
 }
 
 
+# Fraction of the unmasked pixels of a footprint at the dsm_nodata value from which dsm_null is set
+NULL_FRACTION = 0.05
+
+PERCENTILES = (('10th_perc', 10), ('25th_perc', 25), ('75th_perc', 75), ('90th_perc', 90))
+
+
+def sorted_percentile(sorted_values, q):
+    """
+    Percentile of an already sorted array with the same linear interpolation as np.percentile, without the partition
+    np.percentile does on every call
+    """
+    virtual_index = (q / 100.) * (sorted_values.size - 1)
+    below = int(math.floor(virtual_index))
+    fraction = virtual_index - below
+    lower = sorted_values[below]
+    upper = sorted_values[min(below + 1, sorted_values.size - 1)]
+    difference = upper - lower
+    if fraction >= 0.5:
+        return np.float64(upper - difference * (1 - fraction))
+    return np.float64(lower + difference * fraction)
+
+
+def sorted_median(sorted_values):
+    """
+    Median of an already sorted array, computed like np.median
+    """
+    middle = sorted_values[(sorted_values.size - 1) // 2:sorted_values.size // 2 + 1]
+    return middle.mean()
+
+
+def sorted_mode(sorted_values):
+    """
+    Most and least common value of an already sorted array, ties go to the lowest value
+    :return: tuple(mode, minority)
+    """
+    starts = np.flatnonzero(np.concatenate(([True], sorted_values[1:] != sorted_values[:-1])))
+    counts = np.diff(np.append(starts, sorted_values.size))
+    return sorted_values[starts[np.argmax(counts)]], sorted_values[starts[np.argmin(counts)]]
+
+
 def factory():
     return {
         "all": {
@@ -31,6 +74,159 @@ def factory():
     }
 
 
+def get_bounds_window(raster, bounds):
+    """
+    Get pixel coordinates of a bounding box in relation to the raster and output in bounding box format
+    :param bounds: tuple(minx, miny, maxx, maxy)
+    :return: tuple((row start, row stop), (col start, col stop))
+    """
+    ul = raster.index(*bounds[0:2])
+    lr = raster.index(*bounds[2:4])
+    return (lr[0], ul[0] + 1), (ul[1], lr[1] + 1)
+
+
+def read_masked(raster, window):
+    """
+    Read the first band of a raster in the given window and mask out its nodata values.  The masked array shares the
+    memory of the read, which is a view of the file for a rasters.MemmapRaster
+    :return: masked array with the raster nodata value as fill value
+    """
+    return mask_nodata(raster, raster.read(1, window=window))
+
+
+def mask_nodata(raster, elev_data):
+    """
+    Mask the nodata values of the raster in data read from it, sharing the memory of the data
+    :return: masked array with the raster nodata value as fill value
+    """
+    try:
+        nodata_val = raster.meta['nodata']
+    except KeyError:
+        nodata_val = None
+    elev_masked = np.ma.masked_where(elev_data == nodata_val, elev_data, copy=False)
+    np.ma.set_fill_value(elev_masked, nodata_val)
+    return elev_masked
+
+
+def aligned_grids(rasters):
+    """
+    :param rasters: list of open rasters, None entries are left out
+    :return: True if the rasters share one grid and data type, the same transform, width, height and band dtype, so
+    a pixel window is the same area and reads the same type on each of them
+    """
+    rasters = [raster for raster in rasters if raster is not None]
+    return all(raster.transform == rasters[0].transform and raster.width == rasters[0].width and
+               raster.height == rasters[0].height and raster.dtypes[0] == rasters[0].dtypes[0]
+               for raster in rasters[1:])
+
+
+def covered_window(raster, geometries):
+    """
+    Get the pixel window of the combined bounding box of the geometries covered by the raster in the same format as
+    DSMCalc.get_window_from_bounds
+    :return: window, None if no geometry is covered
+    """
+    raster_bbox = shapely.geometry.box(*raster.bounds)
+    bounds = [geom.bounds for geom in geometries if not geom.is_empty and raster_bbox.contains(geom)]
+    if not bounds:
+        return None
+    return get_bounds_window(raster, (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                                      max(b[2] for b in bounds), max(b[3] for b in bounds)))
+
+
+class RasterWindow(object):
+    """
+    Reads a raster a single time for the combined bounding box of several geometries.  DSMCalc objects created with
+    the RasterWindow slice their data out of the shared read instead of each reading their own window of the raster.
+
+    Geometries that are not covered by the raster are left out of the combined window, DSMCalc raises for those when
+    it checks the raster coverage.
+    """
+    def __init__(self, raster, geometries, stack=None):
+        """
+        :param raster: src object of raster already opened by rasterio or another i/o library
+        :param geometries: list of shapely geometries whose DSMCalc objects will read from this window
+        :param stack: optional StackedWindow the raster is a layer of, the window and data are then the layer of the
+        stacked read and the footprint masks are shared with the other layers
+        """
+        self.raster = raster
+        self.masks = None
+        if stack is not None:
+            self.window = stack.window
+            self.data = stack.layer(raster)
+            self.masks = stack.masks
+            return
+        self.window = self.get_window(geometries)
+        self.data = None
+        if self.window is not None:
+            self.data = read_masked(self.raster, self.window)
+
+    def get_window(self, geometries):
+        """
+        Get the pixel window of the combined bounding box of the covered geometries in the same format as
+        DSMCalc.get_window_from_bounds
+        """
+        return covered_window(self.raster, geometries)
+
+    def contains(self, window):
+        if self.window is None:
+            return False
+        (row_start, row_stop), (col_start, col_stop) = self.window
+        return (row_start <= window[0][0] and window[0][1] <= row_stop and
+                col_start <= window[1][0] and window[1][1] <= col_stop)
+
+    def read(self, window):
+        """
+        :return: masked array view of the shared read for the window, read from the raster if not contained
+        """
+        if not self.contains(window):
+            return read_masked(self.raster, window)
+        row_offset, col_offset = self.window[0][0], self.window[1][0]
+        return self.data[window[0][0] - row_offset:window[0][1] - row_offset,
+                         window[1][0] - col_offset:window[1][1] - col_offset]
+
+
+class StackedWindow(object):
+    """
+    Reads rasters that share one grid, see aligned_grids, for the combined bounding box of the geometries of all of
+    them in a single pass into one (rasters, rows, cols) stack.  The window is computed once for every raster, and a
+    footprint rasterized for one layer is reused on the others, as it covers the same pixels on each of them.
+    RasterWindow objects created with the stack slice their layer out of it
+    """
+    def __init__(self, rasters, geometries):
+        """
+        :param rasters: list of open rasters on the same grid, a raster given more than once is read once
+        :param geometries: list of shapely geometries whose DSMCalc objects will read from the stack
+        """
+        self.rasters = []
+        for raster in rasters:
+            if all(raster is not stacked for stacked in self.rasters):
+                self.rasters.append(raster)
+        self.window = covered_window(self.rasters[0], geometries)
+        # rasterized footprints by (id of the geometry, window corners), with the geometry to keep its id valid
+        self.masks = {}
+        self.stack = None
+        if self.window is not None:
+            self.stack = self.read_stack()
+
+    def read_stack(self):
+        first = self.rasters[0]
+        rows, cols = window_ranges(self.window, first.height, first.width)
+        stack = np.empty((len(self.rasters), len(rows), len(cols)), dtype=first.dtypes[0])
+        for layer, raster in enumerate(self.rasters):
+            stack[layer] = raster.read(1, window=self.window)
+        return stack
+
+    def layer(self, raster):
+        """
+        :return: masked array of the layer of a raster with its nodata values masked, None if nothing was read
+        """
+        if self.stack is None:
+            return None
+        layer = next(layer for layer, stacked in enumerate(self.rasters) if stacked is raster)
+        return mask_nodata(raster, self.stack[layer])
+
+
 class DSMCalc(object):
     """
     This class is designed to run the statistical analysis on the input DSM in the area of the vector object.  It takes
@@ -42,25 +238,33 @@ class DSMCalc(object):
     data in the area of the provided feature and determines the percent of feature area that is null.  It does not
     continue more analysis after that.
 
+    Order statistics (percentiles, median, min, max, range, mode and minor) are all read from one sorted copy of the
+    unmasked pixels, see sort_dsm.
+
     If null_values_only values should output with: {}
     If all methods are run values should output with: height_max, pixel_count, comparison_factor, min, max, mean, sum,
-    std, med, range, mode, minor
+    std, med, range, mode, minor, area (m^2 of the unmasked pixels) and coverage (fraction of the pixels touching the
+    footprint that are unmasked)
     """
     DEFAULT_PARAMS = DEFAULT_PARAMS
 
-    def __init__(self, dsm, footprint, find_nulls_only=False, height_max=np.NaN):
+    def __init__(self, dsm, footprint, find_nulls_only=False, height_max=np.NaN, raster_window=None):
         """
         :param dsm:
         :param footprint: shapely polygon
+        :param raster_window: optional RasterWindow of the dsm to slice the footprint data from
         """
+        self.raster_window = raster_window
         self.errors = self.set_default_errors(find_nulls_only)
-        self.values = {"tree_masked_dsm": False, "pixel_count": np.NaN, "height_max": height_max}
+        self.values = ZoneStats({"tree_masked_dsm": False, "pixel_count": np.NaN, "height_max": height_max})
         if not isinstance(footprint, (BaseGeometry, BaseMultipartGeometry)):
             raise TypeError('DSMCalc input geometry is not a shapely geometry based object')
         self.footprint = self.check_vector_validity(footprint)
         self.dsm = self.check_raster_coverage(dsm, footprint)
         self.dsm_data = self.read_dsm()
+        self.footprint_mask = self.rasterize_footprint()
         self.masked_dsm = self.mask_dsm()
+        self.sorted_dsm = None
         self.null_data_error()
 
     @staticmethod
@@ -103,31 +307,28 @@ class DSMCalc(object):
         """
         Get pixel coordinates of the bounding box and output in bounding box format
         """
-        ul, lr = self.get_upper_left_lower_right()
-        window = ((lr[0], ul[0] + 1), (ul[1], lr[1] + 1))
-        return window
+        return get_bounds_window(self.dsm, self.footprint.bounds)
 
+    @timed('read_dsm')
     def read_dsm(self):
         """
         Read in dsm data from the bounding box of footprint
         """
         window = self.get_window_from_bounds()
-        elev_data = self.dsm.read(1, window=window)
-        # Mask out nodata values
-        try:
-            nodata_val = self.dsm.meta['nodata']
-        except KeyError:
-            nodata_val = None
-        elev_masked = np.ma.masked_where(elev_data == nodata_val, elev_data)
-        np.ma.set_fill_value(elev_masked, nodata_val)
-        return elev_masked
+        if self.raster_window is not None:
+            return self.raster_window.read(window)
+        return read_masked(self.dsm, window)
 
-    def mask_dsm(self):
+    @timed('rasterize_footprint')
+    def rasterize_footprint(self):
         """
-        Create a mask of the dsm pixels touching the footprint by rasterizing the footprint values and masking the part
-        of the raster data that overlaps with the feature
+        Create a mask of the dsm pixels touching the footprint by rasterizing the footprint values
+        :return: boolean array, False for the pixels touching the footprint
         """
         ul, lr = self.get_upper_left_lower_right()
+        masks = self.raster_window.masks if self.raster_window is not None else None
+        if masks is not None and (id(self.footprint), ul, lr) in masks:
+            return masks[id(self.footprint), ul, lr][1]
         t = self.dsm.transform
         shifted_affine = Affine(t.a, t.b, t.c + ul[1] * t.a, t.d, t.e, t.f + lr[0] * t.e)
 
@@ -137,23 +338,40 @@ class DSMCalc(object):
             transform=shifted_affine,
             fill=1,
             all_touched=True,
-            dtype=np.uint8)
+            dtype=np.uint8).astype(bool)
+        if masks is not None:
+            masks[id(self.footprint), ul, lr] = (self.footprint, mask)
+        return mask
 
-        masked_dsm = np.ma.array(data=self.dsm_data, mask=mask.astype(bool))
+    @timed('mask_dsm')
+    def mask_dsm(self):
+        """
+        Mask the part of the raster data that does not overlap with the feature.  The mask is a copy, footprint_mask
+        stays the pixels touching the footprint when masked_dsm is masked further
+        """
+        masked_dsm = np.ma.array(data=self.dsm_data, mask=self.footprint_mask.copy())
         return masked_dsm
 
+    @timed('null_data_error')
     def null_data_error(self):
         """
-        Check if there are more than 5% null values
+        Check if there are more than NULL_FRACTION (5%) null values
         """
         dsm_nodata = self.DEFAULT_PARAMS['dsm_calc']['dsm_nodata']
-        count_nodata = np.ma.equal(self.masked_dsm, dsm_nodata).sum()
+        count_nodata = self.count_unmasked_equal(dsm_nodata)
         self.set_pixel_count()
-        if self.values['pixel_count'] > 0 and float(count_nodata)/self.values['pixel_count'] >= 0.05:
+        if self.values['pixel_count'] > 0 and float(count_nodata)/self.values['pixel_count'] >= NULL_FRACTION:
             self.errors['dsm_null'] = True
         if self.values['pixel_count'] < 1:
             raise ValueError('Footprint area was found to be fully masked')
 
+    def count_unmasked_equal(self, value):
+        """
+        :return: number of unmasked pixels equal to value
+        """
+        return np.ma.equal(self.masked_dsm, value).sum()
+
+    @timed('mask_low_elevations')
     def mask_low_elevations(self):
         """
         Mask all elevations below the default 'min_elevation' parameter and set error, if negative elevations exist
@@ -161,8 +379,28 @@ class DSMCalc(object):
         if len(self.masked_dsm[self.masked_dsm <= 0]) > 0:
             self.errors['negative_elevation'] = True
             self.masked_dsm[self.masked_dsm < self.DEFAULT_PARAMS['dsm_calc']['min_elevation']] = np.ma.masked
+            self.sorted_dsm = None
         self.set_pixel_count()
 
+    def sort_dsm(self):
+        """
+        Compress and sort the unmasked pixels a single time, later masking only ever removes the top of the sorted
+        array (clip_max_heights), which is done by slicing
+        :return: sorted array of the unmasked pixels
+        """
+        if self.sorted_dsm is None:
+            self.sorted_dsm = np.sort(self.masked_dsm.compressed())
+        return self.sorted_dsm
+
+    def search_sorted(self, value, side='left'):
+        """
+        Binary search of value in the sorted pixels, value is compared in the same dtype as in the masked array
+        comparisons
+        :return: index of value in the sorted pixels
+        """
+        sorted_dsm = self.sort_dsm()
+        return int(np.searchsorted(sorted_dsm, np.result_type(sorted_dsm, value).type(value), side=side))
+
     def set_pixel_count(self):
         """
         Count number of unmasked pixels
@@ -172,8 +410,9 @@ class DSMCalc(object):
 
     def remove_anomalous_roof(self, p_100, p_75):
         # if self.values['pixel_count'] > 1:
-        co_array = self.masked_dsm[(self.masked_dsm <= p_100) & (self.masked_dsm >= p_75)]
-        height_max = np.median(co_array.compressed())
+        sorted_dsm = self.sort_dsm()
+        co_array = sorted_dsm[self.search_sorted(p_75):self.search_sorted(p_100, side='right')]
+        height_max = sorted_median(co_array)
         self.values['height_max'] = round(float(height_max), 5)
 
     def comparison_factor_maximum(self, p_100, p_75):
@@ -185,16 +424,18 @@ class DSMCalc(object):
             self.errors['comparison_factor_exceeded'] = True
             self.remove_anomalous_roof(p_100, p_75)
 
+    @timed('comparison_factor')
     def comparison_factor(self):
         """
         Calculate the 25th, 75th, and 100th percentile values for the data.  Determine comparison factor between the
         quartile ranges (q4r, iqr).  If calculated comparison factor is greater than a set threshold, this indicates an
         atypical feature on the roof, whose values we then remove.
         """
-        if not self.masked_dsm.compressed().size <= 1:
-            p_100 = np.percentile(self.masked_dsm.compressed(), 100)
-            p_75 = np.percentile(self.masked_dsm.compressed(), 75)
-            p_25 = np.percentile(self.masked_dsm.compressed(), 25)
+        sorted_dsm = self.sort_dsm()
+        if not sorted_dsm.size <= 1:
+            p_100 = sorted_percentile(sorted_dsm, 100)
+            p_75 = sorted_percentile(sorted_dsm, 75)
+            p_25 = sorted_percentile(sorted_dsm, 25)
 
             q4r = p_100 - p_75
             iqr = p_75 - p_25
@@ -207,9 +448,17 @@ class DSMCalc(object):
                     self.values['comparison_factor'] = comparison_factor
             self.comparison_factor_maximum(p_100, p_75)
 
+    @timed('clip_max_heights')
     def clip_max_heights(self):
+        """
+        Mask the pixels above height_max.  The cut is found with a binary search of the sorted pixels and the masked
+        array is only touched if there is anything to clip
+        """
         if not math.isnan(self.values['height_max']):
-            self.masked_dsm[self.masked_dsm > self.values['height_max']] = np.ma.masked
+            keep = self.search_sorted(self.values['height_max'], side='right')
+            if keep < self.sorted_dsm.size:
+                self.masked_dsm[self.masked_dsm > self.values['height_max']] = np.ma.masked
+                self.sorted_dsm = self.sorted_dsm[:keep]
 
     def get_pixel_area(self):
         """
@@ -218,36 +467,139 @@ class DSMCalc(object):
         pixel_size_x, pixel_size_y = self.dsm.res
         return 1 / (pixel_size_x * pixel_size_y)
 
+    def dsm_sum(self):
+        return self.masked_dsm.sum()
+
+    def dsm_mean(self):
+        return self.masked_dsm.mean()
+
+    def dsm_std(self):
+        return self.masked_dsm.std()
+
+    @timed('calculate_stats')
     def calculate_stats(self):
-        filled_dsm = np.ma.filled(self.masked_dsm).flatten()
-        filled_dsm = filled_dsm[filled_dsm != self.masked_dsm.fill_value]
-        if self.masked_dsm.compressed().size > 1:
+        sorted_dsm = self.sort_dsm()
+        if sorted_dsm.size > 1:
             self.set_pixel_count()
-            self.values['min'] = round(float(self.masked_dsm.min()), 5)
-            self.values['max'] = round(float(self.masked_dsm.max()), 5)
-            self.values['mean'] = round(float(self.masked_dsm.mean()), 5)
-            self.values['sum'] = round(float(self.masked_dsm.sum()), 5)
-            self.values['std'] = round(float(self.masked_dsm.std()), 5)
-            self.values['median'] = round(float(np.median(self.masked_dsm.compressed())), 5)
-
-            self.values['10th_perc'] = np.percentile(filled_dsm, 10)
-            self.values['25th_perc'] = np.percentile(filled_dsm, 25)
-            self.values['75th_perc'] = np.percentile(filled_dsm, 75)
-            self.values['90th_perc'] = np.percentile(filled_dsm, 90)
-
-        elif self.masked_dsm.compressed().size == 1:
-            self.values['min'] = round(float(self.masked_dsm.compressed()[0]), 5)
-            self.values['max'] = round(float(self.masked_dsm.compressed()[0]), 5)
-            self.values['mean'] = round(float(self.masked_dsm.compressed()[0]), 5)
-            self.values['sum'] = round(float(self.masked_dsm.compressed()[0]), 5)
+            self.values['min'] = round(float(sorted_dsm[0]), 5)
+            self.values['max'] = round(float(sorted_dsm[-1]), 5)
+            self.values['mean'] = round(float(self.dsm_mean()), 5)
+            self.values['sum'] = round(float(self.dsm_sum()), 5)
+            self.values['std'] = round(float(self.dsm_std()), 5)
+            self.values['median'] = round(float(sorted_median(sorted_dsm)), 5)
+
+            for name, q in PERCENTILES:
+                self.values[name] = sorted_percentile(sorted_dsm, q)
+
+            mode, minor = sorted_mode(sorted_dsm)
+            self.values['range'] = round(float(sorted_dsm[-1]) - float(sorted_dsm[0]), 5)
+            self.values['mode'] = round(float(mode), 5)
+            self.values['minor'] = round(float(minor), 5)
+
+        elif sorted_dsm.size == 1:
+            self.values['min'] = round(float(sorted_dsm[0]), 5)
+            self.values['max'] = round(float(sorted_dsm[0]), 5)
+            self.values['mean'] = round(float(sorted_dsm[0]), 5)
+            self.values['sum'] = round(float(sorted_dsm[0]), 5)
             self.values['std'] = 0
             self.values['pixel_count'] = 1
-            self.values['median'] = round(float(self.masked_dsm.compressed()[0]), 5)
+            self.values['median'] = round(float(sorted_dsm[0]), 5)
 
             self.values.update({'10th_perc': np.NaN, '25th_perc': np.NaN, '75th_perc': np.NaN, '90th_perc': np.NaN})
+            self.values.update({'range': 0, 'mode': round(float(sorted_dsm[0]), 5),
+                                'minor': round(float(sorted_dsm[0]), 5)})
 
-        elif self.masked_dsm.compressed().size == 0:
+        elif sorted_dsm.size == 0:
             self.values['pixel_count'] = 0
             self.values.update({'min': np.NaN, 'max': np.NaN, 'mean': np.NaN, 'sum': np.NaN, 'median': np.NaN,
                                 '10th_perc': np.NaN, '25th_perc': np.NaN, '75th_perc': np.NaN, '90th_perc': np.NaN,
-                                'std': np.NaN})
+                                'std': np.NaN, 'range': np.NaN, 'mode': np.NaN, 'minor': np.NaN})
+        self.values['area'] = round(self.values['pixel_count'] / self.get_pixel_area(), 5)
+        self.values['coverage'] = round(self.values['pixel_count'] / int(np.count_nonzero(~self.footprint_mask)), 5)
+
+
+class ArrayDSMCalc(DSMCalc):
+    """
+    DSMCalc without numpy masked arrays.  masked_dsm is the plain array of the raster window and valid is a single
+    boolean array of its unmasked pixels.  The nodata, footprint, low elevation and height clip filters clear pixels of
+    valid in place instead of building new masked arrays, and sums and moments are taken over the whole window with
+    the masked pixels zeroed, the same reductions numpy.ma runs.  values and errors are identical to DSMCalc
+    """
+    @timed('read_dsm')
+    def read_dsm(self):
+        """
+        Read in dsm data from the bounding box of footprint
+        :return: plain array of the window
+        """
+        window = self.get_window_from_bounds()
+        if self.raster_window is not None:
+            return np.ma.getdata(self.raster_window.read(window))
+        return self.dsm.read(1, window=window)
+
+    @timed('mask_dsm')
+    def mask_dsm(self):
+        """
+        Set valid to the pixels that touch the footprint and are not the raster nodata value
+        :return: plain array of the window
+        """
+        self.valid = ~self.footprint_mask
+        nodata_val = self.dsm.meta.get('nodata')
+        if nodata_val is not None:
+            self.valid &= self.dsm_data != nodata_val
+        return self.dsm_data
+
+    def count_unmasked_equal(self, value):
+        return np.count_nonzero(self.valid & (self.masked_dsm == value))
+
+    def set_pixel_count(self):
+        self.values['pixel_count'] = int(np.count_nonzero(self.valid))
+
+    @timed('mask_low_elevations')
+    def mask_low_elevations(self):
+        """
+        Mask all elevations below the default 'min_elevation' parameter and set error, if negative elevations exist.
+        Like the masked array indexing of DSMCalc, every pixel of the window counts for the negative elevation error,
+        masked or not
+        """
+        if (self.masked_dsm <= 0).any():
+            self.errors['negative_elevation'] = True
+            self.valid &= ~(self.masked_dsm < self.DEFAULT_PARAMS['dsm_calc']['min_elevation'])
+            self.sorted_dsm = None
+        self.set_pixel_count()
+
+    def sort_dsm(self):
+        if self.sorted_dsm is None:
+            self.sorted_dsm = np.sort(self.masked_dsm[self.valid])
+        return self.sorted_dsm
+
+    @timed('clip_max_heights')
+    def clip_max_heights(self):
+        if not math.isnan(self.values['height_max']):
+            keep = self.search_sorted(self.values['height_max'], side='right')
+            if keep < self.sorted_dsm.size:
+                self.valid &= ~(self.masked_dsm > self.values['height_max'])
+                self.sorted_dsm = self.sorted_dsm[:keep]
+
+    def zeroed(self, data):
+        return np.where(self.valid, data, data.dtype.type(0))
+
+    def dsm_sum(self):
+        return self.zeroed(self.masked_dsm).sum()
+
+    def dsm_mean(self, keepdims=False):
+        """
+        Mean like MaskedArray.mean, the sum of integer rasters is taken in float64
+        """
+        dtype = np.float64 if issubclass(self.masked_dsm.dtype.type, (np.integer, np.bool_)) else None
+        count = np.count_nonzero(self.valid)
+        if keepdims:
+            count = np.full((1,) * self.masked_dsm.ndim, count)
+        return self.zeroed(self.masked_dsm).sum(dtype=dtype, keepdims=keepdims) * 1. / count
+
+    def dsm_std(self):
+        """
+        Standard deviation like MaskedArray.std, from the anomalies to the mean kept as an array
+        """
+        anomalies = self.masked_dsm - self.dsm_mean(keepdims=True)
+        anomalies *= anomalies
+        return np.sqrt(np.divide(self.zeroed(anomalies).sum(), np.count_nonzero(self.valid)))
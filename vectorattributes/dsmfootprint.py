@@ -1,7 +1,10 @@
 from vectorattributes.footprint import Footprint
-from vectorattributes.dsmcalc import DSMCalc
+from vectorattributes.dsmcalc import ArrayDSMCalc, DSMCalc, RasterWindow, StackedWindow, aligned_grids, factory
+from vectorattributes.metrics import timed
 import numpy as np
 from vectorattributes.projection import reproject
+from vectorattributes.records import CALCULATION_ERRORS
+from vectorattributes.zonalstats import ZoneResult
 from shapely.geometry import mapping as to_json
 from shapely.geometry import shape as get_shape
 
@@ -71,43 +74,79 @@ class DSMFootprint(Footprint):
     :param tree_dsm_crs:
     :param dem:
     :param dem_crs:
+    :param calculate: if False only the footprint geometries are created and calculate() has to be called separately
+    :param geometries: optional footprint geometries prepared in the dsm crs, see Footprint
+    :param masked: if False the zones are calculated with dsmcalc.ArrayDSMCalc, which gives identical results without
+    numpy masked arrays
+    :param raster_crs: optional tuple(dsm crs, tree dsm crs, dem crs) already checked with raster_crs_isvalid, as a
+    DSMFootprintBatch does once for all its features, the check is then skipped
+    :param null_grid: optional prescreen.NullGrid of the dsm.  With a tree masked dsm the null check is decided from
+    its cell counts when they allow, and the dsm is then not read for the footprint
     """
     NEW_DEFAULT_PARAMS = NEW_DEFAULT_PARAMS
 
-    def __init__(self, feature, feature_crs, dsm, dsm_crs, tree_dsm=None, tree_dsm_crs=None, dem=None, dem_crs=None):
+    def __init__(self, feature, feature_crs, dsm, dsm_crs, tree_dsm=None, tree_dsm_crs=None, dem=None, dem_crs=None,
+                 calculate=True, geometries=None, masked=True, null_grid=None, raster_crs=None):
         # Setting all the initial variables
         self.dsm = dsm
-        self.dsm_crs = self.crs_isvalid(dsm_crs)
+        self.null_grid = null_grid
+        self.dsm_calc = DSMCalc if masked else ArrayDSMCalc
         self.input_feature_crs = self.crs_isvalid(feature_crs)
         # TODO these logic statements probably shouldn't be here
         # TODO Jon - how do you feel about a class that has some attributes only under certain circumstances
-        tree_flag = False
+        self.tree_flag = False
         if tree_dsm:
             self.tree_dsm = tree_dsm
-            self.tree_dsm_crs = self.crs_isvalid(tree_dsm_crs)
-            tree_flag = True
-            if self.tree_dsm_crs != self.dsm_crs:
-                raise ValueError('Tree masked dsm crs must match not-masked dsm crs')
+            self.tree_flag = True
         # set the dem
         self.dem = dem
-        self.dem_crs = self.crs_isvalid(dem_crs)
-        if self.dem_crs is not None and self.dem_crs != self.dsm_crs:
-            raise ValueError('dem crs must match not-masked dsm crs')
+        if raster_crs is None:
+            raster_crs = self.raster_crs_isvalid(dsm_crs, tree_dsm, tree_dsm_crs, dem_crs)
+        self.dsm_crs, self.tree_dsm_crs, self.dem_crs = raster_crs
+        # rasters on one grid are read together into a single stack, see read_raster_windows
+        self.stacked = aligned_grids([dsm, tree_dsm if self.tree_flag else None, dem])
         # set feature crs
         if self.input_feature_crs != self.dsm_crs:
             feature = self.reproject_footprint(feature, self.input_feature_crs, self.dsm_crs)
-        super().__init__(feature, dsm_crs)
+        super().__init__(feature, dsm_crs, geometries=geometries)
         self.DEFAULT_PARAMS.update(NEW_DEFAULT_PARAMS)
+        if calculate:
+            self.calculate()
+
+    def calculate(self, zone_calcs=None):
+        """
+        Run the statistics of each zone, then derive the calculated properties and errors from them
+        :param zone_calcs: optional dict of zone name ('null', 'footprint', 'ground', 'eave', 'roof') to objects with
+        values and errors dicts (DSMCalc or zonalstats.ZoneResult) that were already calculated for this footprint
+        """
+        self.calculate_zones(zone_calcs)
+        self.calculate_properties()
 
-        # Calculations round 1
-        self.footprint_errors['dsm_null'] = self.determine_is_null()
-        self.calculation_errors = error_factory()
-        self.footprint_calcs = self.footprint_calculations(tree_flag=tree_flag)
-        self.ground_calcs = self.ground_calculations()
-        self.eave_calcs = self.eave_calculations(tree_flag=tree_flag)
-        self.roof_calcs = self.roof_calculations(tree_flag=tree_flag)
+    def calculate_zones(self, zone_calcs=None):
+        """
+        Calculations round 1, the statistics of each zone read from the rasters, see calculate
+        """
+        self.calculation_errors = self.error_flags.reset(CALCULATION_ERRORS)
+        if zone_calcs is None:
+            self.dsm_footprint = self.screen_null()
+            self.raster_windows = self.read_raster_windows(tree_flag=self.tree_flag,
+                                                           null_zone=self.dsm_footprint is None)
+            if self.dsm_footprint is None:
+                self.dsm_footprint = self.null_calculation()
+            self.footprint_errors['dsm_null'] = self.determine_is_null()
+            self.footprint_calcs = self.footprint_calculations(tree_flag=self.tree_flag)
+            self.ground_calcs = self.ground_calculations()
+            self.eave_calcs = self.eave_calculations(tree_flag=self.tree_flag)
+            self.roof_calcs = self.roof_calculations(tree_flag=self.tree_flag)
+        else:
+            self.set_zone_calcs(zone_calcs)
 
-        # Calculations round 2
+    @timed('calculate_properties')
+    def calculate_properties(self):
+        """
+        Calculations round 2, the calculated properties and their errors derived from the zone statistics, see
+        calculate.  Only the error thresholds of DEFAULT_PARAMS are used here
+        """
         self.calculations = calculation_factory()
         self.get_elevations()
         self.calculate_pitch()
@@ -119,15 +158,103 @@ class DSMFootprint(Footprint):
 
     # I took out crs_isvalid here because I think it should inherit, if something goes wanky perhaps repaste it here
 
+    @classmethod
+    def raster_crs_isvalid(cls, dsm_crs, tree_dsm=None, tree_dsm_crs=None, dem_crs=None):
+        """
+        Validate the raster crs inputs and check that the tree masked dsm and dem match the dsm
+        :return: tuple(dsm crs, tree dsm crs, dem crs) as validated epsg strings
+        """
+        dsm_crs = cls.crs_isvalid(dsm_crs)
+        if tree_dsm:
+            tree_dsm_crs = cls.crs_isvalid(tree_dsm_crs)
+            if tree_dsm_crs != dsm_crs:
+                raise ValueError('Tree masked dsm crs must match not-masked dsm crs')
+        else:
+            tree_dsm_crs = None
+        dem_crs = cls.crs_isvalid(dem_crs)
+        if dem_crs is not None and dem_crs != dsm_crs:
+            raise ValueError('dem crs must match not-masked dsm crs')
+        return dsm_crs, tree_dsm_crs, dem_crs
+
     @staticmethod
+    @timed('reproject_footprint')
     def reproject_footprint(feature, feature_crs, dsm_crs):
         footprint_reproj = reproject(get_shape(feature['geometry']), from_proj=feature_crs, to_proj=dsm_crs)
         feature['geometry'] = to_json(footprint_reproj)
         return feature
 
+    @timed('read_raster_windows')
+    def read_raster_windows(self, tree_flag, null_zone=True):
+        """
+        Read each raster once for the combined area of all the zones calculated from it, the DSMCalc objects of the
+        individual zones slice their data out of these reads.  If the rasters share one grid they are read in a
+        single pass into one StackedWindow for the combined area of every zone instead
+        :param null_zone: False if the null check was already decided by screen_null
+        :return: dict of raster name ('dsm', 'tree_dsm', 'dem') to RasterWindow
+        """
+        zones = {'dsm': [self.footprint]} if null_zone else {}
+        surface_model = 'tree_dsm' if tree_flag else 'dsm'
+        zones.setdefault(surface_model, []).extend([self.footprint, self.footprint_eave, self.footprint_roof])
+        height_model = 'dem' if self.dem else 'dsm'
+        zones.setdefault(height_model, []).append(self.footprint_ground)
+        stack = None
+        if self.stacked and len(zones) > 1:
+            stack = StackedWindow([getattr(self, name) for name in zones],
+                                  [geometry for geometries in zones.values() for geometry in geometries])
+        return {name: RasterWindow(getattr(self, name), geometries, stack=stack) for name, geometries in zones.items()}
+
+    def set_zone_calcs(self, zone_calcs):
+        """
+        Take the zone statistics from calculations done outside of this object
+        """
+        self.footprint_errors['dsm_null'] = zone_calcs['null'].errors['dsm_null']
+        self.footprint_errors.update({'negative_elevation': zone_calcs['footprint'].errors['negative_elevation'],
+                                      'comparison_factor_exceeded':
+                                          zone_calcs['footprint'].errors['comparison_factor_exceeded']})
+        self.footprint_calcs = zone_calcs['footprint'].values
+        self.ground_calcs = zone_calcs['ground'].values
+        self.eave_calcs = zone_calcs['eave'].values
+        self.roof_calcs = zone_calcs['roof'].values
+
+    def zone_record(self):
+        """
+        :return: dict of the zone statistics and footprint errors of calculate_zones as plain python types, which
+        cache.zone_calcs_from_record turns back into the zone_calcs of calculate.  Has to be taken before
+        calculate_properties, which adds to the zone statistics
+        """
+        return {
+            'errors': {name: self.footprint_errors[name] for name in ('dsm_null', 'negative_elevation',
+                                                                      'comparison_factor_exceeded')},
+            'footprint': dict(self.footprint_calcs),
+            'ground': dict(self.ground_calcs),
+            'eave': dict(self.eave_calcs),
+            'roof': dict(self.roof_calcs)
+        }
+
+    @timed('zone_calculations', zone='null')
+    def null_calculation(self):
+        """
+        :return: DSMCalc of the footprint on the dsm, for the null check
+        """
+        return self.dsm_calc(self.dsm, self.footprint, raster_window=self.raster_windows['dsm'])
+
+    def screen_null(self):
+        """
+        Decide the null check from the counts of the null grid.  Only done with a tree masked dsm, without one the
+        DSMCalc of the null check is also the footprint zone and is needed anyway
+        :return: ZoneResult with the errors of the null check, None if it has to be calculated with a DSMCalc
+        """
+        if self.null_grid is None or not self.tree_flag:
+            return None
+        dsm_null = self.null_grid.screen(self.footprint)
+        if dsm_null is None:
+            return None
+        errors = factory()['all']
+        errors['dsm_null'] = dsm_null
+        return ZoneResult(errors=errors)
+
     def determine_is_null(self):
-        footprint = DSMCalc(self.dsm, self.footprint)
-        return footprint.errors['dsm_null']
+        return self.dsm_footprint.errors['dsm_null']
 
     @staticmethod
     def full_dsm_operations(dsm_calc_obj, test_dist):
@@ -138,12 +265,14 @@ class DSMFootprint(Footprint):
         dsm_calc_obj.calculate_stats()
         return dsm_calc_obj
 
+    @timed('zone_calculations', zone='footprint')
     def footprint_calculations(self, tree_flag):
         if tree_flag is True:
-            footprint = DSMCalc(self.tree_dsm, self.footprint)
+            footprint = self.dsm_calc(self.tree_dsm, self.footprint, raster_window=self.raster_windows['tree_dsm'])
             footprint.values["tree_masked_dsm"] = True
         else:
-            footprint = DSMCalc(self.dsm, self.footprint)
+            # the dsm footprint used for the null check is reused rather than masked a second time
+            footprint = self.dsm_footprint
         self.full_dsm_operations(footprint, test_dist=True)
         self.footprint_errors.update({'negative_elevation': footprint.errors['negative_elevation'],
                                       'comparison_factor_exceeded': footprint.errors['comparison_factor_exceeded']})
@@ -155,27 +284,36 @@ class DSMFootprint(Footprint):
             return self.dem
         return self.dsm
 
+    @timed('zone_calculations', zone='ground')
     def ground_calculations(self):
         height_model = self.set_height_model()
-        ground = DSMCalc(height_model, self.footprint_ground, height_max=self.footprint_calcs['height_max'])
+        raster_window = self.raster_windows['dem'] if height_model is self.dem else self.raster_windows['dsm']
+        ground = self.dsm_calc(height_model, self.footprint_ground, height_max=self.footprint_calcs['height_max'],
+                               raster_window=raster_window)
         self.full_dsm_operations(ground, test_dist=False)
         return ground.values
 
+    @timed('zone_calculations', zone='roof')
     def roof_calculations(self, tree_flag):
         if tree_flag:
-            roof = DSMCalc(self.tree_dsm, self.footprint_roof, height_max=self.footprint_calcs['height_max'])
+            roof = self.dsm_calc(self.tree_dsm, self.footprint_roof, height_max=self.footprint_calcs['height_max'],
+                                  raster_window=self.raster_windows['tree_dsm'])
             roof.values["tree_masked_dsm"] = True
         else:
-            roof = DSMCalc(self.dsm, self.footprint_roof, height_max=self.footprint_calcs['height_max'])
+            roof = self.dsm_calc(self.dsm, self.footprint_roof, height_max=self.footprint_calcs['height_max'],
+                                  raster_window=self.raster_windows['dsm'])
         self.full_dsm_operations(roof, test_dist=False)
         return roof.values
 
+    @timed('zone_calculations', zone='eave')
     def eave_calculations(self, tree_flag):
         if tree_flag:
-            eave = DSMCalc(self.tree_dsm, self.footprint_eave, height_max=self.footprint_calcs['height_max'])
+            eave = self.dsm_calc(self.tree_dsm, self.footprint_eave, height_max=self.footprint_calcs['height_max'],
+                                  raster_window=self.raster_windows['tree_dsm'])
             eave.values["tree_masked_dsm"] = True
         else:
-            eave = DSMCalc(self.dsm, self.footprint_eave, height_max=self.footprint_calcs['height_max'])
+            eave = self.dsm_calc(self.dsm, self.footprint_eave, height_max=self.footprint_calcs['height_max'],
+                                  raster_window=self.raster_windows['dsm'])
         self.full_dsm_operations(eave, test_dist=False)
         return eave.values
 
@@ -292,12 +430,13 @@ class DSMFootprint(Footprint):
         self.max_roof_height_error()
         self.min_roof_height_error()
 
+    @timed('output_geojson')
     def output_geojson(self):
         feature4326 = self.feature
         if self.fprint_crs != 'epsg:4326':
-            footprint_reproj = reproject(self.footprint, from_proj=self.fprint_crs, to_proj='epsg:4326')
+            footprint_reproj = reproject(self.footprint, from_proj=self.geometry_crs, to_proj='epsg:4326')
             feature4326['geometry'] = to_json(footprint_reproj)
-        # Remove stats we don't need to output
+        # Remove stats we don't need to output, zone stats and errors are only converted to dicts here
         self.ground_calcs.pop('std')
         self.roof_calcs.pop('std')
         self.eave_calcs.pop('std')
@@ -307,13 +446,13 @@ class DSMFootprint(Footprint):
             'properties': {
                 'original_properties': self.properties,
                 'calculated_properties': {
-                    'ground': self.ground_calcs,
-                    'eave': self.eave_calcs,
-                    'roof': self.roof_calcs,
+                    'ground': dict(self.ground_calcs),
+                    'eave': dict(self.eave_calcs),
+                    'roof': dict(self.roof_calcs),
                     'height_max': self.footprint_calcs['height_max']
                 },
                 'errors': {
-                    'footprint': self.footprint_errors,
-                    'calculated_properties': self.calculation_errors
+                    'footprint': self.footprint_errors.to_dict(),
+                    'calculated_properties': self.calculation_errors.to_dict()
                 }
             }}
@@ -1,5 +1,7 @@
 from shapely.geometry import shape as get_shape
 from vectorattributes.geojson_check import GeojsonCheck
+from vectorattributes.metrics import timed
+from vectorattributes.records import ErrorFlags, FOOTPRINT_ERRORS
 from .projection import *
 
 
@@ -31,18 +33,33 @@ class Footprint(object):
     """
     DEFAULT_PARAMS = DEFAULT_PARAMS
 
-    def __init__(self, feature, crs):
+    def __init__(self, feature, crs, projected=False, geometries=None):
         """
         :param feature: geojson feature
         :param crs: crs predefined by EPSG and input as a dict version of the proj4 string Ex. {'init': 'epsg:4326'}
+        :param projected: if True the footprint and every buffered geometry are kept in the projected working crs (the
+        UTM zone of the footprint for epsg:4326 input) instead of being projected back to crs.  Use
+        output_geometries to convert them when needed
+        :param geometries: optional dict of the footprint geometries and geometry errors already prepared for this
+        feature, as returned by geometry.FootprintGeometries.feature_geometries
         """
-        if GeojsonCheck(feature).is_geojson is not True:
+        feature_check = GeojsonCheck(feature)
+        if feature_check.is_geojson is not True or feature_check.type != 'Feature':
             raise TypeError('Input is not a geojson feature')
         self.feature = feature
         self.fprint_crs = self.crs_isvalid(crs)
-        self.footprint_errors = error_factory()
-        self.footprint = self.get_polygon()
+        self.error_flags = ErrorFlags()
+        self.footprint_errors = self.error_flags.view(FOOTPRINT_ERRORS)
         self.properties = self.feature['properties']
+        if geometries is not None:
+            self.set_geometries(geometries, projected)
+            return
+        self.footprint = self.get_polygon()
+        self.working_crs, self.working_footprint = self.get_working_footprint()
+        self.projected = projected
+        if projected:
+            self.footprint = self.working_footprint
+        self.geometry_crs = self.working_crs if projected else self.fprint_crs
         self.footprint_ground_full, self.footprint_ground = self.buffer_donut(DEFAULT_PARAMS['spatial_calcs']
                                                                               ['ground_buffer_inner'] +
                                                                               DEFAULT_PARAMS['spatial_calcs']
@@ -74,6 +91,7 @@ class Footprint(object):
             raise RuntimeError('Cannot handle epsg codes that are not WGS84 or UTM zones')
         return crs['init']
 
+    @timed('get_polygon')
     def get_polygon(self):
         """
         :return: valid shapely geometry for feature
@@ -82,19 +100,40 @@ class Footprint(object):
         polygon_validated = self.polygon_is_valid(polygon)
         return polygon_validated
 
+    def set_geometries(self, geometries, projected):
+        """
+        Take the footprint geometries from a collection prepared with geometry.FootprintGeometries instead of
+        calculating them
+        """
+        for name in ['footprint', 'footprint_ground_full', 'footprint_ground', 'footprint_roof', 'footprint_eave',
+                     'working_crs', 'working_footprint']:
+            setattr(self, name, geometries[name])
+        self.footprint_errors['geometry'].update(geometries['errors'])
+        self.projected = projected
+        self.geometry_crs = self.working_crs if projected else self.fprint_crs
+
+    @timed('reproject')
+    def get_working_footprint(self):
+        """
+        Project the footprint once into the crs the buffers are calculated in, the UTM zone of the footprint for
+        epsg:4326 input and the input crs otherwise
+        :return: tuple(working crs string, shapely geometry of the footprint in the working crs)
+        """
+        if self.fprint_crs == 'epsg:4326':
+            utm_code = get_utm_epsg(self.footprint.centroid.x, self.footprint.centroid.y)
+            return utm_code, reproject(self.footprint, from_proj='epsg:4326', to_proj=utm_code)
+        return self.fprint_crs, self.footprint
+
     # TODO not tested -- create subclass
+    @timed('buffer_donut')
     def buffer_donut(self, buffer_distance):
         """
         Creates the shapely geometries for the buffered area and for the "donut" of the buffered area minus the
-        original polygon.  Output polygons are given in crs of shape input into Footprint feature
+        original polygon.  Output polygons are given in crs of shape input into Footprint feature, or in the working
+        crs if the Footprint is projected
         :return: tuple(shapely geometry buffered area, shapely geometry "donut" area)
         """
-        utm_code = None
-        if self.fprint_crs == 'epsg:4326':
-            utm_polygon = convert_4326_to_utm(self.footprint)
-            utm_code = get_utm_epsg(self.footprint.centroid.x, self.footprint.centroid.y)
-        else:
-            utm_polygon = self.footprint
+        utm_polygon = self.working_footprint
         if buffer_distance > 0:
             buffered_poly = utm_polygon.buffer(buffer_distance)
             donut_poly = buffered_poly.difference(utm_polygon)
@@ -103,7 +142,19 @@ class Footprint(object):
             donut_poly = utm_polygon.difference(buffered_poly)
         else:
             raise ValueError('buffer distance cannot be equal to zero')
-        if utm_code:
-            buffered_poly = reproject(buffered_poly, from_proj=utm_code, to_proj=self.fprint_crs)
-            donut_poly = reproject(donut_poly, from_proj=utm_code, to_proj=self.fprint_crs)
+        if self.geometry_crs != self.working_crs:
+            buffered_poly, donut_poly = reproject_many([buffered_poly, donut_poly], from_proj=self.working_crs,
+                                                       to_proj=self.geometry_crs)
         return buffered_poly, donut_poly
+
+    def output_geometries(self, to_proj='epsg:4326'):
+        """
+        Convert the footprint and its buffered geometries to an output crs in one reprojection
+        :param to_proj: crs string of the output, Ex. 'epsg:4326'
+        :return: dict of shapely geometries in to_proj
+        """
+        names = ['footprint', 'footprint_ground_full', 'footprint_ground', 'footprint_roof', 'footprint_eave']
+        geometries = [getattr(self, name) for name in names]
+        if self.geometry_crs != to_proj:
+            geometries = reproject_many(geometries, from_proj=self.geometry_crs, to_proj=to_proj)
+        return dict(zip(names, geometries))
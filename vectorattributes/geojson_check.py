@@ -1,7 +1,8 @@
 class GeojsonCheck(object):
     """
-    Class to determine if an input object is a geojson or not and determine object type.  Currently only supports
-    geojson features.  Does not validate geometry coordinates
+    Class to determine if an input object is a geojson or not and determine object type.  Currently supports geojson
+    features and feature collections.  Does not validate geometry coordinates.  For a feature collection only the
+    collection structure is checked, the features are validated as they are used
     """
     def __init__(self, input_object):
         self.input = input_object
@@ -27,10 +28,9 @@ class GeojsonCheck(object):
     def validate_object(self):
         if self.type is False:
             return False
-        elif self.type is 'FeatureCollection':
-            print('FeatureCollection objects not yet supported')
-            return False
-        elif self.type is 'Feature':
+        elif self.type == 'FeatureCollection':
+            return self.validate_collection()
+        elif self.type == 'Feature':
             return self.validate_feature()
         else:
             print('Purely geometry objects not yet supported')
@@ -51,3 +51,8 @@ class GeojsonCheck(object):
             return False
         else:
             return True
+
+    def validate_collection(self):
+        if 'features' not in self.input.keys():
+            return False
+        return isinstance(self.input['features'], (list, tuple))
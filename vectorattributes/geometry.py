@@ -0,0 +1,157 @@
+from vectorattributes.footprint import DEFAULT_PARAMS, Footprint
+from vectorattributes.metrics import timed
+from vectorattributes.projection import get_utm_epsg_many, reproject_many
+import numpy as np
+import shapely
+from shapely.geometry import shape as get_shape
+
+
+# Default quad_segs of the buffer method of shapely geometries used by Footprint, shapely.buffer defaults to 8
+QUAD_SEGS = 16
+
+
+def to_geometry_array(geometries):
+    """
+    :param geometries: sequence of shapely geometry objects
+    :return: 1d numpy object array of the geometries
+    """
+    array = np.empty(len(geometries), dtype=object)
+    array[:] = list(geometries)
+    return array
+
+
+def validate_many(polygons):
+    """
+    Vectorized Footprint.polygon_is_valid, invalid polygons are fixed with a buffer of 0 and polygons still invalid
+    after that are replaced by their convex hull
+    :return: tuple(array of valid geometries, buffer0 flag array, convex_hull flag array)
+    """
+    polygons = polygons.copy()
+    buffer0 = ~shapely.is_valid(polygons)
+    polygons[buffer0] = shapely.buffer(polygons[buffer0], 0, quad_segs=QUAD_SEGS)
+    convex_hull = buffer0.copy()
+    convex_hull[buffer0] = ~shapely.is_valid(polygons[buffer0])
+    polygons[convex_hull] = shapely.convex_hull(polygons[convex_hull])
+    return polygons, buffer0, convex_hull
+
+
+def buffer_donut_many(polygons, buffer_distance):
+    """
+    Vectorized Footprint.buffer_donut for polygons in a projected crs
+    :return: tuple(array of buffered areas, array of "donut" areas)
+    """
+    buffered = shapely.buffer(polygons, buffer_distance, quad_segs=QUAD_SEGS)
+    if buffer_distance > 0:
+        donut = shapely.difference(buffered, polygons)
+    elif buffer_distance < 0:
+        donut = shapely.difference(polygons, buffered)
+    else:
+        raise ValueError('buffer distance cannot be equal to zero')
+    return buffered, donut
+
+
+def spatial_order(features):
+    """
+    Order the features along a z-order (Morton) curve through the centers of their bounds, so that consecutive
+    features are close together on the ground and a chunk of them covers a small, contiguous part of the rasters
+    :return: array of feature indices in spatial order
+    """
+    if not features:
+        return np.array([], dtype=np.int64)
+    bounds = np.array([get_shape(feature['geometry']).bounds for feature in features], dtype=np.float64)
+    centers = np.column_stack(((bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2))
+    low = centers.min(axis=0)
+    extent = (centers.max(axis=0) - low).max() or 1
+    cells = ((centers - low) / extent * 0xffff).astype(np.uint64)
+    codes = np.zeros(len(features), dtype=np.uint64)
+    for bit in range(16):
+        codes |= ((cells[:, 0] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        codes |= ((cells[:, 1] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    return np.argsort(codes, kind='stable')
+
+
+class FootprintGeometries(object):
+    """
+    This class prepares the geometries of a whole collection of footprints the way Footprint does for a single one:
+    validity checks and fixes, the ground buffer and donut and the roof and eave zones.  Every step runs as a shapely
+    array operation over the collection.  All outputs are numpy arrays aligned with the input geometries and equal to
+    the attributes of the same name of Footprint
+
+    :param geometries: sequence of shapely geometry objects
+    :param crs: crs predefined by EPSG and input as a dict version of the proj4 string Ex. {'init': 'epsg:4326'}
+    :param projected: if True the outputs are kept in the projected working crs, see Footprint
+    :param params: spatial_calcs parameters, defaults to DEFAULT_PARAMS['spatial_calcs'] of the footprint module
+    """
+    NAMES = ('footprint', 'footprint_ground_full', 'footprint_ground', 'footprint_roof', 'footprint_eave',
+             'working_crs', 'working_footprint')
+
+    @timed('prepare_geometries')
+    def __init__(self, geometries, crs, projected=False, params=None):
+        if params is None:
+            params = DEFAULT_PARAMS['spatial_calcs']
+        self.fprint_crs = Footprint.crs_isvalid(crs)
+        self.projected = projected
+        self.footprint, self.buffer0, self.convex_hull = validate_many(to_geometry_array(geometries))
+        self.working_crs, self.working_footprint = self.get_working_footprints()
+        self.geometry_crs = self.working_crs if projected else np.full(len(self), self.fprint_crs, dtype=object)
+        if projected:
+            self.footprint = self.working_footprint
+        self.footprint_ground_full, self.footprint_ground = self.buffer_donut(params['ground_buffer_inner'] +
+                                                                              params['ground_buffer_outer'])
+        self.footprint_roof, self.footprint_eave = self.buffer_donut(params['eave_buffer'])
+
+    def __len__(self):
+        return len(self.footprint)
+
+    def get_working_footprints(self):
+        """
+        Project epsg:4326 footprints into the UTM zone of each footprint, grouped by zone
+        :return: tuple(array of working crs strings, array of footprints in the working crs)
+        """
+        if self.fprint_crs != 'epsg:4326':
+            return np.full(len(self), self.fprint_crs, dtype=object), self.footprint
+        centroids = shapely.centroid(self.footprint)
+        working_crs = get_utm_epsg_many(shapely.get_x(centroids), shapely.get_y(centroids))
+        working_footprint = self.reproject_groups(self.footprint, 'epsg:4326', working_crs)
+        return working_crs, working_footprint
+
+    @staticmethod
+    def reproject_groups(geometries, from_crs, to_crs):
+        """
+        Reproject geometries where either crs can vary per geometry, with one reprojection per pair of crs
+        :param from_crs: crs string or array of crs strings aligned with geometries
+        :param to_crs: crs string or array of crs strings aligned with geometries
+        :return: array of reprojected geometries
+        """
+        from_crs = np.broadcast_to(np.asarray(from_crs, dtype=object), geometries.shape)
+        to_crs = np.broadcast_to(np.asarray(to_crs, dtype=object), geometries.shape)
+        reprojected = geometries.copy()
+        for from_proj, to_proj in set(zip(from_crs, to_crs)):
+            if from_proj == to_proj:
+                continue
+            selected = (from_crs == from_proj) & (to_crs == to_proj)
+            reprojected[selected] = reproject_many(geometries[selected], from_proj=from_proj, to_proj=to_proj)
+        return reprojected
+
+    def buffer_donut(self, buffer_distance):
+        """
+        :return: tuple(array of buffered areas, array of "donut" areas) in the crs of the outputs
+        """
+        buffered, donut = buffer_donut_many(self.working_footprint, buffer_distance)
+        return (self.reproject_groups(buffered, self.working_crs, self.geometry_crs),
+                self.reproject_groups(donut, self.working_crs, self.geometry_crs))
+
+    def geometry_errors(self, index):
+        """
+        :return: geometry errors of one footprint, in the form of footprint.error_factory()['geometry']
+        """
+        return {'buffer0': bool(self.buffer0[index]), 'convex_hull': bool(self.convex_hull[index])}
+
+    def feature_geometries(self, index):
+        """
+        :return: dict of the geometries, working crs and geometry errors of one footprint, the geometries input of
+        Footprint
+        """
+        geometries = {name: getattr(self, name)[index] for name in self.NAMES}
+        geometries['errors'] = self.geometry_errors(index)
+        return geometries
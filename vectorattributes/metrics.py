@@ -0,0 +1,144 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import time
+
+
+# StageMetrics the timed stages report to, None while metrics are disabled
+_active = None
+
+
+class StageMetrics(object):
+    """
+    Wall time and number of calls of the stages of Footprint, DSMCalc, DSMFootprint and DSMFootprintBatch, per stage
+    and zone ('null', 'footprint', 'ground', 'eave', 'roof' or None outside of a zone).  Stages are only timed while
+    the object is enabled with collect(), and results aggregate over everything run in that time.
+
+    The DSMCalc stages are nested in the zone of DSMFootprint that runs them, and the zone stages contain the DSMCalc
+    stages, so the times of different stages overlap and should not be summed
+
+    :param callback: optional function called with (stage, zone, seconds) after every timed call, to forward the
+    timings to monitoring
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.zone = None
+
+    def record(self, stage, seconds, zone=None):
+        self.seconds[stage, zone] += seconds
+        self.calls[stage, zone] += 1
+        if self.callback is not None:
+            self.callback(stage, zone, seconds)
+
+    def merge(self, rows):
+        """
+        Add the timings of another StageMetrics, e.g. of a worker process
+        :param rows: StageMetrics or its rows()
+        """
+        if isinstance(rows, StageMetrics):
+            rows = rows.rows()
+        for row in rows:
+            self.seconds[row['stage'], row['zone']] += row['seconds']
+            self.calls[row['stage'], row['zone']] += row['calls']
+
+    def reset(self):
+        self.seconds.clear()
+        self.calls.clear()
+
+    def rows(self):
+        """
+        :return: list of dicts of stage, zone, calls, seconds and mean seconds per call, sorted by stage and zone
+        """
+        return [{'stage': stage, 'zone': zone, 'calls': self.calls[stage, zone], 'seconds': self.seconds[stage, zone],
+                 'mean': self.seconds[stage, zone] / self.calls[stage, zone]}
+                for stage, zone in sorted(self.calls, key=lambda key: (key[0], key[1] or ''))]
+
+    def totals(self):
+        """
+        :return: dict of stage to dict of calls and seconds summed over the zones
+        """
+        totals = defaultdict(lambda: {'calls': 0, 'seconds': 0.})
+        for row in self.rows():
+            totals[row['stage']]['calls'] += row['calls']
+            totals[row['stage']]['seconds'] += row['seconds']
+        return dict(totals)
+
+    def report(self):
+        """
+        :return: text table of the rows
+        """
+        lines = ['{:<24} {:<10} {:>10} {:>12} {:>12}'.format('stage', 'zone', 'calls', 'seconds', 'mean')]
+        for row in self.rows():
+            lines.append('{stage:<24} {zone:<10} {calls:>10} {seconds:>12.6f} {mean:>12.6f}'.format(
+                **dict(row, zone=row['zone'] or '-')))
+        return '\n'.join(lines)
+
+
+def enable(metrics=None):
+    """
+    Start timing the stages
+    :param metrics: StageMetrics to report to, a new one if None
+    :return: the enabled StageMetrics
+    """
+    global _active
+    _active = metrics if metrics is not None else StageMetrics()
+    return _active
+
+
+def disable():
+    """
+    Stop timing the stages
+    :return: the StageMetrics that was enabled, or None
+    """
+    global _active
+    metrics, _active = _active, None
+    return metrics
+
+
+def active():
+    """
+    :return: the enabled StageMetrics, None if metrics are disabled
+    """
+    return _active
+
+
+@contextmanager
+def collect(metrics=None):
+    """
+    Time the stages run inside the with block, restoring the previously enabled StageMetrics afterwards
+    Ex. with collect() as metrics: ... print(metrics.report())
+    """
+    global _active
+    previous = _active
+    try:
+        yield enable(metrics)
+    finally:
+        _active = previous
+
+
+def timed(stage, zone=None):
+    """
+    Decorator timing a stage.  While metrics are disabled it costs a single global lookup per call
+    :param stage: name of the stage
+    :param zone: zone the stage calculates, the stages called inside it are recorded in this zone.  If None the stage
+    is recorded in the zone it is called from
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            metrics = _active
+            if metrics is None:
+                return function(*args, **kwargs)
+            outer_zone = metrics.zone
+            if zone is not None:
+                metrics.zone = zone
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.record(stage, time.perf_counter() - start, zone=metrics.zone)
+                metrics.zone = outer_zone
+        return wrapper
+    return decorator
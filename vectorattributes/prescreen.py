@@ -0,0 +1,155 @@
+from vectorattributes.dsmcalc import NULL_FRACTION, DSMCalc, get_bounds_window, mask_nodata
+from vectorattributes.metrics import timed
+import numpy as np
+import shapely
+import shapely.geometry
+
+
+# Default edge length of a cell of the NullGrid in pixels
+DEFAULT_CELL_SIZE = 8
+# Cell rows counted per read when the whole grid is filled
+FILL_ROWS = 128
+
+
+def cell_sizes(count, cell_size, size):
+    """
+    :return: int array of the number of pixels along one axis of each of count cells, the last cell is cut at the
+    raster edge
+    """
+    starts = np.arange(count, dtype=np.int64) * cell_size
+    return np.minimum(starts + cell_size, size) - starts
+
+
+class NullGrid(object):
+    """
+    Coarse grid of the pixel counts DSMCalc.null_data_error works from, per cell of cell_size by cell_size pixels of
+    the dsm: the valid pixels, which are not the raster nodata, and the null pixels among them, which are at the
+    dsm_nodata value.  Cells are counted the first time a footprint needs them, or all at once with fill, and are
+    shared by every footprint screened on the grid.
+
+    screen bounds the null fraction of a footprint from below with the cells it certainly covers and from above with
+    every cell of its window, and only decides dsm_null when both bounds are on the same side of NULL_FRACTION.  A
+    decision is therefore always the one DSMCalc makes, and footprints near the threshold are left to DSMCalc
+
+    :param raster: the dsm
+    :param cell_size: edge length of a cell in pixels
+    """
+    def __init__(self, raster, cell_size=DEFAULT_CELL_SIZE):
+        if cell_size < 1:
+            raise ValueError('cell_size must be at least 1')
+        self.raster = raster
+        self.cell_size = cell_size
+        self.nodata = DSMCalc.DEFAULT_PARAMS['dsm_calc']['dsm_nodata']
+        self.shape = (-(-raster.height // cell_size), -(-raster.width // cell_size))
+        self.row_sizes = cell_sizes(self.shape[0], cell_size, raster.height)
+        self.col_sizes = cell_sizes(self.shape[1], cell_size, raster.width)
+        dtype = np.min_scalar_type(cell_size * cell_size)
+        self.valid = np.zeros(self.shape, dtype=dtype)
+        self.nulls = np.zeros(self.shape, dtype=dtype)
+        self.counted = np.zeros(self.shape, dtype=bool)
+
+    def __repr__(self):
+        return '<NullGrid of {!r} cells {} of {} pixels>'.format(self.raster, self.shape, self.cell_size)
+
+    @timed('count_cells')
+    def count(self, cell_rows, cell_cols):
+        """
+        Count the cells in a block of the grid that are not counted yet, with a single read of the pixels of the
+        smallest block holding all of them
+        :param cell_rows: range of cell rows
+        :param cell_cols: range of cell columns
+        """
+        counted = self.counted[cell_rows.start:cell_rows.stop, cell_cols.start:cell_cols.stop]
+        if counted.all():
+            return
+        uncounted_rows = np.flatnonzero(~counted.all(axis=1))
+        uncounted_cols = np.flatnonzero(~counted.all(axis=0))
+        row_start, row_stop = cell_rows.start + uncounted_rows[0], cell_rows.start + uncounted_rows[-1] + 1
+        col_start, col_stop = cell_cols.start + uncounted_cols[0], cell_cols.start + uncounted_cols[-1] + 1
+        size = self.cell_size
+        window = ((row_start * size, min(row_stop * size, self.raster.height)),
+                  (col_start * size, min(col_stop * size, self.raster.width)))
+        data = mask_nodata(self.raster, self.raster.read(1, window=window))
+        valid = np.zeros(((row_stop - row_start) * size, (col_stop - col_start) * size), dtype=bool)
+        nulls = np.zeros_like(valid)
+        height, width = data.shape
+        valid[:height, :width] = ~np.ma.getmaskarray(data)
+        nulls[:height, :width] = valid[:height, :width] & (np.ma.getdata(data) == self.nodata)
+        cells = (row_stop - row_start, size, col_stop - col_start, size)
+        self.valid[row_start:row_stop, col_start:col_stop] = valid.reshape(cells).sum(axis=(1, 3))
+        self.nulls[row_start:row_stop, col_start:col_stop] = nulls.reshape(cells).sum(axis=(1, 3))
+        self.counted[row_start:row_stop, col_start:col_stop] = True
+
+    def fill(self):
+        """
+        Count every cell of the grid up front, reading the raster in strips of FILL_ROWS cell rows
+        """
+        for row in range(0, self.shape[0], FILL_ROWS):
+            self.count(range(row, min(row + FILL_ROWS, self.shape[0])), range(0, self.shape[1]))
+        return self
+
+    def covered_cells(self, footprint, cell_rows, cell_cols, rows, cols):
+        """
+        :param rows: range of the pixel rows of the footprint window
+        :param cols: range of the pixel columns of the footprint window
+        :return: boolean array over the cells of cell_rows and cell_cols, True for the cells inside the window that
+        the footprint covers, every pixel of which DSMCalc rasterizes into the footprint
+        """
+        size = self.cell_size
+        row_edges = np.minimum(np.arange(cell_rows.start, cell_rows.stop + 1) * size, self.raster.height)
+        col_edges = np.minimum(np.arange(cell_cols.start, cell_cols.stop + 1) * size, self.raster.width)
+        inside = ((row_edges[:-1] >= rows.start) & (row_edges[1:] <= rows.stop))[:, np.newaxis] & \
+                 ((col_edges[:-1] >= cols.start) & (col_edges[1:] <= cols.stop))[np.newaxis, :]
+        candidate_rows, candidate_cols = np.nonzero(inside)
+        if candidate_rows.size:
+            transform = self.raster.transform
+            x0, y0 = transform * (col_edges[candidate_cols].astype(np.float64),
+                                  row_edges[candidate_rows].astype(np.float64))
+            x1, y1 = transform * (col_edges[candidate_cols + 1].astype(np.float64),
+                                  row_edges[candidate_rows + 1].astype(np.float64))
+            boxes = shapely.box(np.minimum(x0, x1), np.minimum(y0, y1), np.maximum(x0, x1), np.maximum(y0, y1))
+            inside[candidate_rows, candidate_cols] = shapely.covers(footprint, boxes)
+        return inside
+
+    @timed('screen_null', zone='null')
+    def screen(self, footprint):
+        """
+        Decide the null check of a footprint from the cell counts
+        :param footprint: shapely geometry in the raster crs
+        :return: dsm_null of the footprint as DSMCalc would set it, None if the counts cannot decide it or DSMCalc
+        would raise for the footprint
+        """
+        if self.nodata != DSMCalc.DEFAULT_PARAMS['dsm_calc']['dsm_nodata']:
+            return None
+        if (footprint.is_empty or not footprint.is_valid or
+                not shapely.geometry.box(*self.raster.bounds).contains(footprint)):
+            return None
+        (row_start, row_stop), (col_start, col_stop) = get_bounds_window(self.raster, footprint.bounds)
+        rows = range(max(row_start, 0), min(row_stop, self.raster.height))
+        cols = range(max(col_start, 0), min(col_stop, self.raster.width))
+        if not rows or not cols:
+            return None
+        size = self.cell_size
+        cell_rows = range(rows.start // size, -(-rows.stop // size))
+        cell_cols = range(cols.start // size, -(-cols.stop // size))
+        self.count(cell_rows, cell_cols)
+        nulls = self.nulls[cell_rows.start:cell_rows.stop, cell_cols.start:cell_cols.stop].astype(np.int64)
+        goods = self.valid[cell_rows.start:cell_rows.stop, cell_cols.start:cell_cols.stop].astype(np.int64) - nulls
+        covered = self.covered_cells(footprint, cell_rows, cell_cols, rows, cols)
+        null_low, null_high = int(nulls[covered].sum()), int(nulls.sum())
+        good_low, good_high = int(goods[covered].sum()), int(goods.sum())
+        # the pixel under an interior point is always rasterized, a cell of it that is all null or all good holds at
+        # least one pixel of that kind
+        row, col = self.raster.index(*footprint.representative_point().coords[0])
+        if row in rows and col in cols:
+            cell = (row // size - cell_rows.start, col // size - cell_cols.start)
+            pixels = self.row_sizes[row // size] * self.col_sizes[col // size]
+            if nulls[cell] == pixels:
+                null_low = max(null_low, 1)
+            if goods[cell] == pixels:
+                good_low = max(good_low, 1)
+        if null_low > 0 and float(null_low) / (null_low + good_high) >= NULL_FRACTION:
+            return True
+        if good_low > 0 and float(null_high) / (null_high + good_low) < NULL_FRACTION:
+            return False
+        return None
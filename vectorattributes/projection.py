@@ -1,9 +1,12 @@
-import pyproj
-from shapely import ops
-from functools import partial
+import shapely
+import numpy as np
+from functools import lru_cache, partial
 import math
 
 
+TRANSFORMER_CACHE_SIZE = 32
+
+
 # TODO there really should be a check on these functions so they do not accept any shape that does not have EPSG 4326
 def get_utm_epsg(lon, lat):
     """
@@ -20,15 +23,69 @@ def get_utm_epsg(lon, lat):
     return epsg_code
 
 
+def get_utm_epsg_many(lon, lat):
+    """
+    Vectorized get_utm_epsg for arrays of lat lon in EPSG:4326
+    :return: numpy array of EPSG code strings in the form EPSG:32xxx
+    """
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    codes = (np.floor((lon + 180) / 6) % 60 + 1).astype(np.int64) + np.where(lat >= 0, 32600, 32700)
+    return np.array(['EPSG:{}'.format(code) for code in codes], dtype=object)
+
+
+@lru_cache(maxsize=TRANSFORMER_CACHE_SIZE)
+def _cached_transformer(from_proj, to_proj):
+    # pyproj is imported on first use, it loads the PROJ database and is not needed to import the package
+    import pyproj
+    return pyproj.Transformer.from_proj(pyproj.Proj(init=from_proj), pyproj.Proj(init=to_proj))
+
+
+def get_transformer(from_proj, to_proj):
+    """
+    Transformer between two crs, built once per pair of crs and then taken from an LRU cache.  The transformer is the
+    one the deprecated pyproj.transform builds from the same Proj objects, so coordinates are identical
+    :param from_proj: crs string in the form epsg:XXXX, case insensitive
+    :param to_proj: crs string in the form epsg:XXXX, case insensitive
+    :return: pyproj Transformer
+    """
+    return _cached_transformer(from_proj.lower(), to_proj.lower())
+
+
+def transform_coords(transformer, coords):
+    """
+    Transform a whole (N, 2) or (N, 3) coordinate array in one call
+    :return: transformed coordinate array of the same shape
+    """
+    return np.column_stack(transformer.transform(*coords.T))
+
+
+def reproject_many(geoms, from_proj=None, to_proj=None):
+    """
+    Reproject a collection of shapely geometries, transforming the coordinates of all of them in one call per
+    coordinate dimension
+    :param geoms: sequence or array of shapely geometry objects
+    :param from_proj: both proj should be strings in the form epsg:XXXX
+    :return: numpy object array of reprojected shapely geometries, aligned with geoms
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    transform = partial(transform_coords, get_transformer(from_proj, to_proj))
+    has_z = shapely.has_z(geoms)
+    reprojected = geoms.copy()
+    for include_z in (False, True):
+        selected = has_z == include_z
+        if selected.any():
+            reprojected[selected] = shapely.transform(geoms[selected], transform, include_z=include_z)
+    return reprojected
+
+
 def reproject(geom, from_proj=None, to_proj=None):
     """
-    Recommended function provided by shapely for projection transformations
+    Reproject a single shapely geometry
     :param geom: shapely geometry object
-    :param from_proj: both proj should be
+    :param from_proj: both proj should be strings in the form epsg:XXXX
     :return: reprojected shapely geometry
     """
-    tfm = partial(pyproj.transform, pyproj.Proj(init=from_proj), pyproj.Proj(init=to_proj))
-    return ops.transform(tfm, geom)
+    return reproject_many([geom], from_proj=from_proj, to_proj=to_proj)[0]
 
 
 def convert_4326_to_utm(polygon):
@@ -41,3 +98,17 @@ def convert_4326_to_utm(polygon):
     utm_code = get_utm_epsg(polygon.centroid.x, polygon.centroid.y)
     projected_poly = reproject(polygon, from_proj='epsg:4326', to_proj=utm_code)
     return projected_poly
+
+
+def crs_to_dict(crs):
+    """
+    Convert the crs of a fiona collection or rasterio dataset to the {'init': 'epsg:XXXX'} dict DSMFootprint expects
+    :param crs: dict, rasterio or fiona CRS object
+    :return: crs dict, None if crs is None
+    """
+    if crs is None or isinstance(crs, dict) and 'init' in crs:
+        return crs
+    epsg = crs.to_epsg() if hasattr(crs, 'to_epsg') else None
+    if epsg is None:
+        return dict(crs)
+    return {'init': 'epsg:{}'.format(epsg)}
@@ -0,0 +1,323 @@
+from rasterio.transform import TransformMethodsMixin
+from rasterio.windows import Window
+from collections import OrderedDict
+import numpy as np
+import rasterio
+
+
+# Default byte budget of a BlockCache
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def memmap_unsupported(src):
+    """
+    :param src: rasterio dataset
+    :return: reason the first band of the dataset cannot be memory mapped, None if it can
+    """
+    if src.driver != 'GTiff':
+        return 'driver is {}, not GTiff'.format(src.driver)
+    if src.compression is not None:
+        return 'band is compressed with {}'.format(src.compression.value)
+    if src.count > 1 and src.interleaving is not None and src.interleaving.value != 'BAND':
+        return 'bands are interleaved by {}'.format(src.interleaving.value.lower())
+    if 'NBITS' in src.tags(1, ns='IMAGE_STRUCTURE'):
+        return 'band is not stored in whole bytes'
+    if np.dtype(src.dtypes[0]).kind == 'c':
+        return 'band is complex'
+    return None
+
+
+def block_offsets(src):
+    """
+    Byte offsets of the strips or tiles of the first band of a GeoTIFF, read from the TIFF metadata domain of GDAL
+    :return: int64 array of shape (block rows, block cols)
+    """
+    block_rows, block_cols = src.block_shapes[0]
+    offsets = np.empty((-(-src.height // block_rows), -(-src.width // block_cols)), dtype=np.int64)
+    for row in range(offsets.shape[0]):
+        for col in range(offsets.shape[1]):
+            offset = src.get_tag_item('BLOCK_OFFSET_{}_{}'.format(col, row), 'TIFF', bidx=1)
+            offsets[row, col] = int(offset) if offset else 0
+    return offsets
+
+
+def window_ranges(window, height, width):
+    """
+    :param window: tuple((row start, row stop), (col start, col stop)) or rasterio Window, the whole raster if None
+    :return: tuple(range of rows, range of cols) of the window cut at the raster edges like a numpy slice
+    """
+    if window is None:
+        window = ((0, height), (0, width))
+    elif isinstance(window, Window):
+        window = window.toranges()
+    return range(*slice(*window[0]).indices(height)), range(*slice(*window[1]).indices(width))
+
+
+def assemble_window(rows, cols, block_shape, dtype, block):
+    """
+    Copy a window out of the blocks it touches
+    :param rows: range of rows of the window
+    :param cols: range of cols of the window
+    :param block_shape: tuple(block rows, block cols)
+    :param block: function of (block row, block col) returning the array of the block, edge blocks can be cut at the
+    raster edge or padded
+    :return: array of the window
+    """
+    block_rows, block_cols = block_shape
+    data = np.empty((len(rows), len(cols)), dtype=dtype)
+    if not len(rows) or not len(cols):
+        return data
+    for block_row in range(rows.start // block_rows, (rows.stop - 1) // block_rows + 1):
+        for block_col in range(cols.start // block_cols, (cols.stop - 1) // block_cols + 1):
+            top, left = block_row * block_rows, block_col * block_cols
+            row_start, row_stop = max(rows.start, top), min(rows.stop, top + block_rows)
+            col_start, col_stop = max(cols.start, left), min(cols.stop, left + block_cols)
+            data[row_start - rows.start:row_stop - rows.start, col_start - cols.start:col_stop - cols.start] = \
+                block(block_row, block_col)[row_start - top:row_stop - top, col_start - left:col_stop - left]
+    return data
+
+
+class MemmapRaster(TransformMethodsMixin):
+    """
+    Read-only raster backend that maps the first band of an uncompressed GeoTIFF straight into memory with
+    np.memmap, using the byte offsets of its strips or tiles.  It has the attributes and methods of a rasterio dataset
+    that DSMCalc, RasterWindow and the zonal calculations use, so it can be passed anywhere they take a rasterio
+    dataset.
+
+    If the strips of the band follow each other in the file, which is how GDAL writes uncompressed stripped GeoTIFFs,
+    the whole band is a single array and window reads are views of it without any copy.  Otherwise windows are
+    assembled from views of the blocks they touch.  Windows follow numpy slicing, so a window reaching past the
+    raster is cut at its edge like a rasterio read.  The returned arrays are read-only
+
+    :param path: path of an uncompressed GeoTIFF, raises ValueError if the band cannot be memory mapped
+    """
+    def __init__(self, path):
+        with rasterio.open(path, 'r') as src:
+            reason = memmap_unsupported(src)
+            if reason is not None:
+                raise ValueError('Cannot memory map {}: {}'.format(path, reason))
+            self.name = src.name
+            self.driver = src.driver
+            self.crs = src.crs
+            self.transform = src.transform
+            self.res = src.res
+            self.bounds = src.bounds
+            self.width, self.height = src.width, src.height
+            self.count = 1
+            self.dtypes = src.dtypes[:1]
+            self.nodata = src.nodata
+            self.meta = dict(src.meta, count=1)
+            self.block_shapes = src.block_shapes[:1]
+            offsets = block_offsets(src)
+        if not offsets.all():
+            raise ValueError('Cannot memory map {}: band has empty blocks'.format(path))
+        with open(path, 'rb') as file:
+            byte_order = file.read(2)
+        self.dtype = np.dtype(self.dtypes[0]).newbyteorder('<' if byte_order == b'II' else '>')
+        self.block_rows, self.block_cols = self.block_shapes[0]
+        self.offsets = offsets
+        self._file = np.memmap(path, dtype=np.uint8, mode='r')
+        block_bytes = self.block_rows * self.block_cols * self.dtype.itemsize
+        contiguous = offsets.ravel() == offsets[0, 0] + block_bytes * np.arange(offsets.size)
+        self.band = None
+        if self.block_cols == self.width and contiguous.all():
+            self.band = self.view(offsets[0, 0], (self.height, self.width))
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return "<{} MemmapRaster '{}'>".format('closed' if self.closed else 'open', self.name)
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def view(self, offset, shape):
+        """
+        :return: read-only array of the given shape starting at a byte offset of the file, without a copy
+        """
+        size = shape[0] * shape[1] * self.dtype.itemsize
+        return np.asarray(self._file[offset:offset + size]).view(self.dtype).reshape(shape)
+
+    def block(self, row, col):
+        """
+        :return: array view of one strip or tile, edge tiles include their padding
+        """
+        return self.view(self.offsets[row, col], (self.block_rows, self.block_cols))
+
+    def read(self, indexes=None, window=None):
+        """
+        Read the band like rasterio's read
+        :param indexes: 1, or None for a 3d array with a single band
+        :param window: tuple((row start, row stop), (col start, col stop)) or rasterio Window, the whole band if None
+        :return: read-only array of the window
+        """
+        if self.closed:
+            raise ValueError('Cannot read from a closed raster')
+        if indexes not in (None, 1):
+            raise ValueError('MemmapRaster only reads band 1')
+        rows, cols = window_ranges(window, self.height, self.width)
+        if self.band is not None:
+            data = self.band[rows.start:rows.stop, cols.start:cols.stop]
+        else:
+            data = assemble_window(rows, cols, self.block_shapes[0], self.dtype, self.block)
+        return data if indexes is not None else data[np.newaxis]
+
+    def close(self):
+        """
+        Drop the memory map, arrays already read keep it alive until they are released
+        """
+        self._file = None
+        self.band = None
+        self.closed = True
+
+
+class BlockCache(object):
+    """
+    Least recently used cache of decoded raster blocks, keyed by (dataset name, block row, block col) and limited to a
+    budget of bytes.  One cache is shared by the CachedRaster objects of the dsm, tree masked dsm and dem, so the
+    rasters compete for the same budget and every block is decoded once while it stays cached.  Blocks larger than
+    the whole budget are not cached.  The cache is not thread safe, the runner gives every worker process its own
+
+    :param max_bytes: byte budget of the cached blocks
+    """
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get(self, key, load):
+        """
+        :param key: tuple(dataset name, block row, block col)
+        :param load: function returning the block array if it is not cached
+        :return: read-only array of the block
+        """
+        block = self.blocks.get(key)
+        if block is not None:
+            self.hits += 1
+            self.blocks.move_to_end(key)
+            return block
+        self.misses += 1
+        block = load()
+        block.flags.writeable = False
+        if block.nbytes <= self.max_bytes:
+            self.blocks[key] = block
+            self.nbytes += block.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.blocks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+        return block
+
+    def stats(self):
+        """
+        :return: dict of the hit, miss and eviction counters, number of cached blocks and bytes
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'blocks': len(self.blocks),
+                'bytes': self.nbytes}
+
+    def clear(self):
+        """
+        Drop every cached block, the counters are kept
+        """
+        self.blocks.clear()
+        self.nbytes = 0
+
+
+class CachedRaster(object):
+    """
+    Wraps an open raster so the first band is read one block at a time through a BlockCache.  A window is assembled
+    from the cached blocks it touches, or is a view of the block if it lies within one.  Every other attribute is the
+    attribute of the wrapped raster, so it can be passed anywhere DSMCalc takes a rasterio dataset
+
+    :param raster: rasterio dataset or MemmapRaster
+    :param cache: BlockCache shared with the other rasters of the run
+    """
+    def __init__(self, raster, cache):
+        self.raster = raster
+        self.cache = cache
+        self.block_rows, self.block_cols = raster.block_shapes[0]
+
+    def __getattr__(self, name):
+        return getattr(self.raster, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.raster.close()
+
+    def __repr__(self):
+        return '<CachedRaster of {!r}>'.format(self.raster)
+
+    def block(self, block_row, block_col):
+        """
+        :return: read-only array of one block, cut at the raster edges
+        """
+        def load():
+            top, left = block_row * self.block_rows, block_col * self.block_cols
+            return self.raster.read(1, window=((top, min(top + self.block_rows, self.raster.height)),
+                                               (left, min(left + self.block_cols, self.raster.width))))
+        return self.cache.get((self.raster.name, block_row, block_col), load)
+
+    def read(self, indexes=None, window=None):
+        """
+        Read the first band like rasterio's read, from the block cache
+        :param indexes: 1, or None for a 3d array with a single band
+        :param window: tuple((row start, row stop), (col start, col stop)) or rasterio Window, the whole band if None
+        :return: array of the window
+        """
+        if indexes not in (None, 1):
+            raise ValueError('CachedRaster only reads band 1')
+        rows, cols = window_ranges(window, self.raster.height, self.raster.width)
+        first_row, first_col = rows.start // self.block_rows, cols.start // self.block_cols
+        if len(rows) and len(cols) and (rows.stop - 1) // self.block_rows == first_row and \
+                (cols.stop - 1) // self.block_cols == first_col:
+            top, left = first_row * self.block_rows, first_col * self.block_cols
+            block = self.block(first_row, first_col)
+            data = block[rows.start - top:rows.stop - top, cols.start - left:cols.stop - left]
+        else:
+            data = assemble_window(rows, cols, (self.block_rows, self.block_cols), self.raster.dtypes[0], self.block)
+        return data if indexes is not None else data[np.newaxis]
+
+
+def cached_rasters(rasters, max_bytes=DEFAULT_CACHE_BYTES, cache=None):
+    """
+    Wrap rasters in CachedRaster objects sharing one BlockCache.  None entries stay None and a raster passed more than
+    once is wrapped once, so rasters that are the same stay the same
+    :param rasters: list of open rasters
+    :param cache: BlockCache to share, a new one with a budget of max_bytes if None
+    :return: list of CachedRaster objects
+    """
+    cache = cache if cache is not None else BlockCache(max_bytes)
+    wrapped = {}
+    for raster in rasters:
+        if raster is not None and id(raster) not in wrapped:
+            wrapped[id(raster)] = CachedRaster(raster, cache)
+    return [wrapped[id(raster)] if raster is not None else None for raster in rasters]
+
+
+def open_raster(path, memmap=True):
+    """
+    Open a raster for DSMCalc, memory mapped if possible
+    :param path: path of the raster
+    :param memmap: if True uncompressed GeoTIFFs are opened as MemmapRaster, every other raster with rasterio
+    :return: MemmapRaster or rasterio dataset
+    """
+    if memmap:
+        try:
+            return MemmapRaster(path)
+        except ValueError:
+            pass
+    return rasterio.open(path, 'r')
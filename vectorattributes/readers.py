@@ -0,0 +1,286 @@
+from vectorattributes.geojson_check import GeojsonCheck
+from vectorattributes.projection import crs_to_dict
+import json
+import os
+
+
+SEQUENCE_EXTENSIONS = ['.geojsonl', '.geojsons', '.geojsonseq', '.ndjson', '.jsonl']
+COLLECTION_EXTENSIONS = ['.geojson', '.json']
+WHITESPACE = ' \t\n\r'
+RECORD_SEPARATOR = '\x1e'
+
+
+def crs_from_geojson(crs_member):
+    """
+    Convert the legacy crs member of a geojson FeatureCollection, Ex. {'type': 'name', 'properties': {'name':
+    'urn:ogc:def:crs:EPSG::32610'}}, to a crs dict
+    :return: crs dict, {'init': 'epsg:4326'} if there is no crs member as RFC 7946 geojson is always WGS84
+    """
+    if crs_member is None:
+        return {'init': 'epsg:4326'}
+    name = crs_member.get('properties', {}).get('name', '')
+    code = name.replace('::', ':').split(':')[-1]
+    if name.upper().endswith('CRS84') or code == '4326':
+        return {'init': 'epsg:4326'}
+    if not code.isdigit():
+        raise RuntimeError('Cannot read geojson crs {}'.format(name))
+    return {'init': 'epsg:{}'.format(code)}
+
+
+class JSONStream(object):
+    """
+    Incremental json decoder over a text file, reading chunk_size characters at a time so that only the value being
+    decoded is held in memory
+
+    :param file: text file object
+    :param chunk_size: number of characters read at a time
+    """
+    def __init__(self, file, chunk_size=65536):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=None):
+        """
+        Drop the decoded part of the buffer and read more of the file
+        :return: False if the file is exhausted
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(max(size or 0, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """
+        :return: next character that is not whitespace, '' at the end of the file
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self.fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters):
+        """
+        Consume the next character, which has to be one of characters
+        :return: the consumed character
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError('Invalid json, expected {} at {!r}'.format(' or '.join(characters), character))
+        self.position += 1
+        return character
+
+    def decode(self):
+        """
+        Decode the next json value, reading more of the file until the value is complete
+        :return: python object of the value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                # Read at least as much again as is buffered, so a large value is not decoded over and over
+                if not self.fill(len(self.buffer) - self.position):
+                    raise
+                continue
+            # A number at the end of the buffer might continue in the next chunk
+            if end < len(self.buffer) or not self.fill():
+                self.position = end
+                return value
+
+
+class FeatureReader(object):
+    """
+    This class reads the features of a footprint layer lazily, holding a single feature in memory at a time.  The
+    collection structure is validated once with GeojsonCheck, the features themselves are validated by Footprint.
+    Iterating the reader yields geojson feature dicts, and the reader has a crs attribute like a fiona collection, so
+    it can be passed to DSMFootprintBatch directly
+
+    :param source: path of a geojson FeatureCollection, GeoJSON Text Sequence / newline delimited geojson file or any
+    file fiona can read, an open text file of a FeatureCollection, an open fiona collection or any iterable of
+    features, or a FeatureCollection dict.  The crs of a FeatureCollection file is read from a legacy crs member
+    before the features, without one it is epsg:4326
+    :param source_format: 'featurecollection', 'geojsonseq' or 'fiona', detected from the source if None
+    :param chunk_size: number of characters read at a time from geojson files
+    """
+    def __init__(self, source, source_format=None, chunk_size=65536):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.source_format = source_format or self.detect_format()
+        self._crs = None
+
+    def detect_format(self):
+        """
+        :return: source format from the type of source and the file extension or first character of the file
+        """
+        if isinstance(self.source, dict):
+            return 'dict'
+        if not isinstance(self.source, str):
+            return 'featurecollection' if hasattr(self.source, 'read') else 'fiona'
+        extension = os.path.splitext(self.source)[1].lower()
+        if extension in SEQUENCE_EXTENSIONS:
+            return 'geojsonseq'
+        if extension in COLLECTION_EXTENSIONS:
+            with open(self.source, 'r') as src:
+                first = src.read(1024).lstrip(WHITESPACE)[:1]
+            return 'geojsonseq' if first == RECORD_SEPARATOR else 'featurecollection'
+        return 'fiona'
+
+    @property
+    def crs(self):
+        """
+        :return: crs dict of the features
+        """
+        if self._crs is None:
+            if self.source_format == 'fiona':
+                self._crs = crs_to_dict(self.fiona_crs())
+            elif self.source_format == 'geojsonseq':
+                self._crs = {'init': 'epsg:4326'}
+            elif self.source_format == 'dict':
+                self._crs = crs_from_geojson(self.source.get('crs'))
+            else:
+                with self.open() as src:
+                    # an open file is rewound so its features can still be read
+                    start = src.tell() if not isinstance(self.source, str) else None
+                    members = {}
+                    for key, value in self.collection_members(JSONStream(src, self.chunk_size), members):
+                        break
+                    if start is not None:
+                        src.seek(start)
+                self._crs = crs_from_geojson(members.get('crs'))
+        return self._crs
+
+    def fiona_crs(self):
+        if not isinstance(self.source, str):
+            return getattr(self.source, 'crs', None)
+        import fiona
+        with fiona.open(self.source, 'r') as src:
+            return src.crs
+
+    def open(self):
+        """
+        :return: context manager of the text file of the source, an open file is not closed afterwards
+        """
+        if isinstance(self.source, str):
+            return open(self.source, 'r')
+        return _Unclosed(self.source)
+
+    def __iter__(self):
+        return self.features()
+
+    def features(self):
+        """
+        Generator of the geojson features of the source
+        """
+        if self.source_format == 'dict':
+            self.check_collection(self.source)
+            yield from self.source['features']
+        elif self.source_format == 'fiona':
+            yield from self.fiona_features()
+        elif self.source_format == 'geojsonseq':
+            yield from self.sequence_features()
+        elif self.source_format == 'featurecollection':
+            yield from self.collection_features()
+        else:
+            raise ValueError('Unknown source format {}'.format(self.source_format))
+
+    @staticmethod
+    def check_collection(collection):
+        if GeojsonCheck(collection).type != 'FeatureCollection' or GeojsonCheck(collection).is_geojson is not True:
+            raise TypeError('Input is not a geojson FeatureCollection')
+
+    def fiona_features(self):
+        if isinstance(self.source, str):
+            import fiona
+            with fiona.open(self.source, 'r') as src:
+                for feature in src:
+                    yield feature.__geo_interface__ if not isinstance(feature, dict) else feature
+        else:
+            for feature in self.source:
+                yield feature.__geo_interface__ if not isinstance(feature, dict) else feature
+
+    def sequence_features(self):
+        """
+        Features of a GeoJSON Text Sequence (RFC 8142), where a record separator starts each feature, or of newline
+        delimited geojson, where each non-empty line is a feature
+        """
+        with self.open() as src:
+            record = None
+            for line in src:
+                if line.startswith(RECORD_SEPARATOR):
+                    if record is not None and ''.join(record).strip():
+                        yield json.loads(''.join(record))
+                    record = [line.lstrip(RECORD_SEPARATOR)]
+                elif record is not None:
+                    record.append(line)
+                elif line.strip():
+                    yield json.loads(line)
+            if record is not None and ''.join(record).strip():
+                yield json.loads(''.join(record))
+
+    def collection_features(self):
+        with self.open() as src:
+            members = {}
+            for key, value in self.collection_members(JSONStream(src, self.chunk_size), members):
+                yield value
+            if 'features' in members:
+                members['features'] = []
+            self.check_collection(members)
+
+    def collection_members(self, stream, members):
+        """
+        Decode the members of a FeatureCollection one at a time.  Every member except features is stored in members,
+        the features are yielded as ('features', feature) tuples as they are decoded.  If the type member comes
+        before the features the collection is checked before the first feature is yielded, otherwise at the end
+        """
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(':')
+            if key == 'features':
+                if 'type' in members:
+                    self.check_collection(dict(members, features=[]))
+                stream.expect('[')
+                if stream.peek() == ']':
+                    stream.expect(']')
+                else:
+                    while True:
+                        yield key, stream.decode()
+                        if stream.expect(',]') == ']':
+                            break
+                members[key] = None
+            else:
+                members[key] = stream.decode()
+            if stream.expect(',}') == '}':
+                return
+
+
+class _Unclosed(object):
+    """ Context manager of a file that was opened by the caller and stays open """
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def read_features(source, source_format=None):
+    """
+    :return: FeatureReader of the source, see FeatureReader
+    """
+    return FeatureReader(source, source_format=source_format)
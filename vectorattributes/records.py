@@ -0,0 +1,246 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+
+# Bits of the error bitmask of a building, one per error flag of footprint.error_factory and
+# dsmfootprint.error_factory
+BUFFER0 = 1 << 0
+CONVEX_HULL = 1 << 1
+DSM_NULL = 1 << 2
+NEGATIVE_ELEVATION = 1 << 3
+COMPARISON_FACTOR_EXCEEDED = 1 << 4
+ROOF_HEIGHT = 1 << 5
+EAVE_HEIGHT = 1 << 6
+EAVE_ABOVE_ROOF = 1 << 7
+RESET_EAVE_NORMAL_ROOF = 1 << 8
+RESET_EAVE_LOW_ROOF = 1 << 9
+MIN_EAVE = 1 << 10
+RESET_EAVE_TO_MIN = 1 << 11
+RESET_EAVE_RATIO = 1 << 12
+ROOF_ELEVATION = 1 << 13
+MAX_ROOF_HEIGHT = 1 << 14
+MIN_ROOF_HEIGHT = 1 << 15
+ROOF_EAVE_RATIO = 1 << 16
+
+# Layout of the footprint and calculated properties errors of DSMFootprint.output_geojson, key to bit or to the
+# layout of a nested group
+FOOTPRINT_ERRORS = {
+    'geometry': {
+        'buffer0': BUFFER0,
+        'convex_hull': CONVEX_HULL},
+    'dsm_null': DSM_NULL,
+    'negative_elevation': NEGATIVE_ELEVATION,
+    'comparison_factor_exceeded': COMPARISON_FACTOR_EXCEEDED
+}
+
+CALCULATION_ERRORS = {
+    'roof_height': ROOF_HEIGHT,
+    'eave_height': EAVE_HEIGHT,
+    'eave_above_roof': EAVE_ABOVE_ROOF,
+    'reset_eave_normal_roof': RESET_EAVE_NORMAL_ROOF,
+    'reset_eave_low_roof': RESET_EAVE_LOW_ROOF,
+    'min_eave': MIN_EAVE,
+    'reset_eave_to_min': RESET_EAVE_TO_MIN,
+    'reset_eave_ratio': RESET_EAVE_RATIO,
+    'roof_elevation': ROOF_ELEVATION,
+    'max_roof_height': MAX_ROOF_HEIGHT,
+    'min_roof_height': MIN_ROOF_HEIGHT,
+    'roof_eave_ratio': ROOF_EAVE_RATIO
+}
+
+
+def layout_mask(layout):
+    """
+    :return: bitmask of every flag of a layout
+    """
+    mask = 0
+    for entry in layout.values():
+        mask |= layout_mask(entry) if isinstance(entry, dict) else entry
+    return mask
+
+
+def error_bit_array(footprints):
+    """
+    :param footprints: iterable of Footprint or DSMFootprint objects
+    :return: numpy uint32 array of the error bitmask of each footprint, Ex. error_bit_array(footprints) & DSM_NULL
+    """
+    return np.array([footprint.error_flags.bits for footprint in footprints], dtype=np.uint32)
+
+
+class ErrorFlags(object):
+    """
+    The error flags of one building packed into a single integer.  present holds which flags have been set at least
+    once, as flags like negative_elevation only appear in the output after the zone that sets them was calculated.
+    The flags are read and written through ErrorView objects with the dict layout of the geojson output
+    """
+    __slots__ = ('bits', 'present')
+
+    def __init__(self):
+        self.bits = 0
+        self.present = BUFFER0 | CONVEX_HULL | DSM_NULL
+
+    def view(self, layout):
+        return ErrorView(self, layout)
+
+    def reset(self, layout):
+        """
+        Set every flag of a layout to False
+        :return: ErrorView of the layout
+        """
+        mask = layout_mask(layout)
+        self.bits &= ~mask
+        self.present |= mask
+        return ErrorView(self, layout)
+
+    def is_set(self, bit):
+        return bool(self.bits & bit)
+
+
+class ErrorView(MutableMapping):
+    """
+    Dict-like view of the flags of an ErrorFlags object, keyed like footprint.error_factory() or
+    dsmfootprint.error_factory().  Nested groups are views as well
+    """
+    __slots__ = ('flags', 'layout')
+
+    def __init__(self, flags, layout):
+        self.flags = flags
+        self.layout = layout
+
+    def __getitem__(self, key):
+        entry = self.layout[key]
+        if isinstance(entry, dict):
+            return ErrorView(self.flags, entry)
+        if not self.flags.present & entry:
+            raise KeyError(key)
+        return bool(self.flags.bits & entry)
+
+    def __setitem__(self, key, value):
+        entry = self.layout[key]
+        if isinstance(entry, dict):
+            ErrorView(self.flags, entry).update(value)
+            return
+        self.flags.present |= entry
+        if value:
+            self.flags.bits |= entry
+        else:
+            self.flags.bits &= ~entry
+
+    def __delitem__(self, key):
+        entry = self.layout[key]
+        mask = layout_mask(entry) if isinstance(entry, dict) else entry
+        if not self.flags.present & mask:
+            raise KeyError(key)
+        self.flags.present &= ~mask
+        self.flags.bits &= ~mask
+
+    def __iter__(self):
+        for key, entry in self.layout.items():
+            if self.flags.present & (layout_mask(entry) if isinstance(entry, dict) else entry):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    @property
+    def bits(self):
+        """
+        :return: bitmask of the flags of this view that are set
+        """
+        return self.flags.bits & layout_mask(self.layout)
+
+    def to_dict(self):
+        """
+        :return: flags in the nested dict layout of the geojson output
+        """
+        return {key: value.to_dict() if isinstance(value, ErrorView) else value for key, value in self.items()}
+
+
+# Keys of zone statistics in output order, every value is stored as a float64
+STAT_KEYS = ('tree_masked_dsm', 'pixel_count', 'height_max', 'comparison_factor', 'min', 'max', 'mean', 'sum', 'std',
+             'median', '10th_perc', '25th_perc', '75th_perc', '90th_perc', 'range', 'mode', 'minor', 'area',
+             'coverage', 'elevation', 'height')
+STAT_INDEX = {key: index for index, key in enumerate(STAT_KEYS)}
+
+
+class ZoneStats(MutableMapping):
+    """
+    Compact dict-like record of the statistics of one zone, used for DSMCalc.values and the zone calculations of
+    DSMFootprint.  Statistics are stored in a float64 array, with bitmasks of which keys are present and which values
+    were bools or ints, so to_dict gives back the values as they were set.  The roof pitch description is the only
+    text value
+    """
+    __slots__ = ('values', 'present', 'ints', 'bools', 'pitch')
+
+    def __init__(self, *args, **kwargs):
+        self.values = np.empty(len(STAT_KEYS), dtype=np.float64)
+        self.present = 0
+        self.ints = 0
+        self.bools = 0
+        self.pitch = None
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key == 'pitch':
+            if self.pitch is None:
+                raise KeyError(key)
+            return self.pitch
+        bit = 1 << STAT_INDEX[key]
+        if not self.present & bit:
+            raise KeyError(key)
+        value = self.values[STAT_INDEX[key]]
+        if self.bools & bit:
+            return bool(value)
+        if self.ints & bit:
+            return int(value)
+        if value != value:
+            # the np.NaN object itself, so equal records compare equal like dicts holding np.NaN do
+            return np.NaN
+        return float(value)
+
+    def __setitem__(self, key, value):
+        if key == 'pitch':
+            self.pitch = value
+            return
+        index = STAT_INDEX[key]
+        bit = 1 << index
+        self.values[index] = value
+        self.present |= bit
+        self.bools = self.bools | bit if isinstance(value, (bool, np.bool_)) else self.bools & ~bit
+        self.ints = self.ints | bit if isinstance(value, (int, np.integer)) and not isinstance(value, bool) \
+            else self.ints & ~bit
+
+    def __delitem__(self, key):
+        if key == 'pitch':
+            if self.pitch is None:
+                raise KeyError(key)
+            self.pitch = None
+            return
+        bit = 1 << STAT_INDEX[key]
+        if not self.present & bit:
+            raise KeyError(key)
+        self.present &= ~bit
+
+    def __iter__(self):
+        for index, key in enumerate(STAT_KEYS):
+            if key == 'height' and self.pitch is not None:
+                yield 'pitch'
+            if self.present & (1 << index):
+                yield key
+        if self.pitch is not None and not self.present & (1 << STAT_INDEX['height']):
+            yield 'pitch'
+
+    def __len__(self):
+        return bin(self.present).count('1') + (self.pitch is not None)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        """
+        :return: statistics as a plain dict, in the layout of the geojson output
+        """
+        return dict(self.items())
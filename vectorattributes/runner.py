@@ -0,0 +1,151 @@
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes import metrics as stage_metrics
+from vectorattributes.geometry import spatial_order
+from vectorattributes.projection import crs_to_dict
+from vectorattributes.rasters import open_raster
+from vectorattributes.readers import FeatureReader
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+import os
+
+
+# Raster handles and batch setup of a worker process, filled in once by init_worker
+_worker = {}
+# Number of features read and spatially ordered at a time when a scene is streamed, see stream_chunks
+STREAM_WINDOW = 16384
+
+
+def spatial_chunks(features, chunk_size):
+    """
+    Generator of spatially contiguous chunks of features
+    :return: list of (input index, feature) tuples per chunk
+    """
+    order = spatial_order(features)
+    for start in range(0, len(order), chunk_size):
+        yield [(int(index), features[index]) for index in order[start:start + chunk_size]]
+
+
+def stream_chunks(features, chunk_size, window=STREAM_WINDOW):
+    """
+    Generator of spatially contiguous chunks of any iterable of features, read window features at a time so only one
+    window of features is held in memory.  The features are ordered within their window, see spatial_chunks
+    :return: list of (input index, feature) tuples per chunk
+    """
+    features = iter(features)
+    start = 0
+    block = list(islice(features, window))
+    while block:
+        for chunk in spatial_chunks(block, chunk_size):
+            yield [(start + index, feature) for index, feature in chunk]
+        start += len(block)
+        block = list(islice(features, window))
+
+
+def init_worker(feature_crs, dsm_path, tree_dsm_path, dtm_path, zonal, chunk_size, memmap=False, cache_bytes=None,
+                result_cache=None, metrics=False, prescreen=False):
+    """
+    Open the rasters and set up the DSMFootprintBatch of a worker process, once for the life of the process
+    :param metrics: time the stages of the worker, see process_chunk
+    :param prescreen: decide the null check from a prescreen.NullGrid of the dsm, see DSMFootprintBatch
+    """
+    if metrics:
+        stage_metrics.enable()
+    rasters = [open_raster(path, memmap=memmap) if path is not None else None
+               for path in (dsm_path, tree_dsm_path, dtm_path)]
+    dsm, tree_dsm, dtm = rasters
+    _worker['rasters'] = rasters
+    _worker['batch'] = DSMFootprintBatch([], feature_crs, dsm, crs_to_dict(dsm.crs), tree_dsm=tree_dsm,
+                                         tree_dsm_crs=crs_to_dict(tree_dsm.crs) if tree_dsm is not None else None,
+                                         dem=dtm, dem_crs=crs_to_dict(dtm.crs) if dtm is not None else None,
+                                         zonal=zonal, chunk_size=chunk_size, cache_bytes=cache_bytes,
+                                         result_cache=result_cache, prescreen=prescreen)
+
+
+def process_chunk(chunk):
+    """
+    Worker function, process one chunk of (input index, feature) tuples
+    :return: tuple(list of (input index, DSMFootprint.output_geojson()) tuples, StageMetrics.rows() of the chunk or
+    None if the worker does not time its stages)
+    """
+    indices = [index for index, _ in chunk]
+    processed = _worker['batch'].process_features([feature for _, feature in chunk])
+    results = [(index, footprint.output_geojson()) for index, footprint in zip(indices, processed)]
+    metrics = stage_metrics.active()
+    if metrics is None:
+        return results, None
+    rows = metrics.rows()
+    metrics.reset()
+    return results, rows
+
+
+def run_scene(footprint_path, dsm_path, tree_dsm_path=None, dtm_path=None, workers=None, chunk_size=64,
+              ordered=True, zonal=False, features=None, feature_crs=None, memmap=False, cache_bytes=None,
+              result_cache=None, metrics=None, prescreen=False, window=STREAM_WINDOW):
+    """
+    Process every footprint of a scene in a pool of worker processes.  Each worker opens its own raster handles
+    once, and the features are sent to the workers in spatially contiguous chunks so each worker reads a compact
+    part of the rasters.  The features are streamed from the footprint file a window at a time, so memory does not
+    grow with the size of the scene.  An exception raised for any feature is raised here and stops the run
+
+    :param footprint_path: path of the footprint file, any format readers.FeatureReader can read
+    :param dsm_path: path of the dsm raster
+    :param tree_dsm_path: path of the tree masked dsm raster
+    :param dtm_path: path of the dtm raster
+    :param workers: number of worker processes, defaults to the number of cpus
+    :param chunk_size: number of features sent to a worker at a time
+    :param ordered: if True results are yielded in the order of the footprint file, else as soon as their chunk is
+    done.  Ordered output holds finished results back until every earlier feature is done
+    :param zonal: calculate the zones of a chunk together, see DSMFootprintBatch
+    :param features: iterable of geojson features to process instead of reading footprint_path, read lazily
+    :param feature_crs: crs dict of features
+    :param memmap: open uncompressed GeoTIFFs as rasters.MemmapRaster instead of with rasterio
+    :param cache_bytes: byte budget of the raster block cache of each worker, see DSMFootprintBatch
+    :param result_cache: directory of a cache.ResultCache shared by the workers
+    :param metrics: metrics.StageMetrics the stage timings of the workers are merged into as their chunks finish
+    :param prescreen: decide the null check from a prescreen.NullGrid of the dsm in each worker, see DSMFootprintBatch
+    :param window: number of features read and spatially ordered at a time, see stream_chunks
+    :return: generator of (input index, DSMFootprint.output_geojson()) tuples
+    """
+    if features is None:
+        features = FeatureReader(footprint_path)
+        feature_crs = features.crs
+    workers = workers or os.cpu_count() or 1
+    chunks = stream_chunks(features, chunk_size, window)
+    initargs = (feature_crs, dsm_path, tree_dsm_path, dtm_path, zonal, chunk_size, memmap, cache_bytes, result_cache,
+                metrics is not None, prescreen)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+        # Keep a couple of chunks queued per worker, so no worker waits and the features are not all pickled at once
+        pending = {executor.submit(process_chunk, chunk) for chunk in islice(chunks, 2 * workers)}
+        finished = {}
+        next_index = 0
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, rows = future.result()
+                if metrics is not None:
+                    metrics.merge(rows)
+                if not ordered:
+                    for result in results:
+                        yield result
+                else:
+                    finished.update(results)
+            pending |= {executor.submit(process_chunk, chunk) for chunk in islice(chunks, len(done))}
+            while next_index in finished:
+                yield next_index, finished.pop(next_index)
+                next_index += 1
+
+
+def process_scene(footprint_path, dsm_path, tree_dsm_path=None, dtm_path=None, workers=None, chunk_size=64,
+                  zonal=False, memmap=False, cache_bytes=None, result_cache=None, metrics=None, prescreen=False):
+    """
+    Process every footprint of a scene in parallel
+    :return: geojson FeatureCollection with one DSMFootprint.output_geojson() feature per input feature
+    """
+    return {
+        'type': 'FeatureCollection',
+        'features': [output for _, output in run_scene(footprint_path, dsm_path, tree_dsm_path=tree_dsm_path,
+                                                         dtm_path=dtm_path, workers=workers, chunk_size=chunk_size,
+                                                         zonal=zonal, memmap=memmap,
+                                                         cache_bytes=cache_bytes, result_cache=result_cache,
+                                                         metrics=metrics, prescreen=prescreen)]
+    }
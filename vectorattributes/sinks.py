@@ -0,0 +1,147 @@
+import json
+import math
+import numpy as np
+
+
+def to_serializable(obj):
+    """
+    Convert a DSMFootprint output to plain python types that json can write.  numpy scalars become python scalars and
+    NaN, which is not valid json, becomes None
+    :return: converted copy of obj
+    """
+    if isinstance(obj, dict):
+        return {key: to_serializable(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_serializable(value) for value in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and math.isnan(obj):
+        return None
+    return obj
+
+
+def encode_feature(result):
+    """
+    :param result: DSMFootprint or the geojson feature dict of DSMFootprint.output_geojson()
+    :return: json string of the feature on a single line
+    """
+    if hasattr(result, 'output_geojson'):
+        result = result.output_geojson()
+    return json.dumps(to_serializable(result), separators=(',', ':'))
+
+
+class GeojsonSink(object):
+    """
+    This class writes processed footprints to a file one at a time as they are produced, so memory use does not grow
+    with the number of features.  Use it as a context manager or call close() to finish the file
+
+    :param destination: path of the output file or an open text file object, which is not closed by the sink
+    """
+    header = ''
+    separator = ''
+    footer = ''
+
+    def __init__(self, destination):
+        if hasattr(destination, 'write'):
+            self.file = destination
+            self.owns_file = False
+        else:
+            self.file = open(destination, 'w')
+            self.owns_file = True
+        self.count = 0
+        self.closed = False
+        self.file.write(self.header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, result):
+        """
+        Write a single feature
+        :param result: DSMFootprint or the geojson feature dict of DSMFootprint.output_geojson()
+        """
+        if self.closed:
+            raise RuntimeError('Cannot write to a closed sink')
+        self.file.write(self.record(encode_feature(result)))
+        self.count += 1
+
+    def write_many(self, results):
+        """
+        Write every feature of an iterable, e.g. the DSMFootprintBatch.process() generator
+        :return: number of features written
+        """
+        start = self.count
+        for result in results:
+            self.write(result)
+        return self.count - start
+
+    def record(self, text):
+        """
+        :return: text of a single feature as written to the file
+        """
+        return (self.separator if self.count else '') + text
+
+    def close(self):
+        if self.closed:
+            return
+        self.file.write(self.footer)
+        self.closed = True
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class NDJSONSink(GeojsonSink):
+    """
+    Newline delimited GeoJSON, one feature per line
+    """
+    def record(self, text):
+        return text + '\n'
+
+
+class GeojsonSequenceSink(GeojsonSink):
+    """
+    GeoJSON Text Sequence (RFC 8142), every feature starts with a record separator and ends with a newline
+    """
+    def record(self, text):
+        return '\x1e' + text + '\n'
+
+
+class FeatureCollectionSink(GeojsonSink):
+    """
+    A single GeoJSON FeatureCollection written incrementally, the file is valid json once the sink is closed
+    """
+    header = '{"type":"FeatureCollection","features":[\n'
+    separator = ',\n'
+    footer = '\n]}\n'
+
+
+SINKS = {
+    'ndjson': NDJSONSink,
+    'geojsonseq': GeojsonSequenceSink,
+    'featurecollection': FeatureCollectionSink
+}
+
+
+def open_sink(destination, output_format='ndjson'):
+    """
+    :param destination: path of the output file or an open text file object
+    :param output_format: 'ndjson', 'geojsonseq' or 'featurecollection'
+    :return: GeojsonSink of the format
+    """
+    if output_format not in SINKS:
+        raise ValueError('Output format must be one of {}'.format(', '.join(sorted(SINKS))))
+    return SINKS[output_format](destination)
+
+
+def write_results(results, destination, output_format='ndjson'):
+    """
+    Stream an iterable of DSMFootprint results or output_geojson() dicts to a file
+    :return: number of features written
+    """
+    with open_sink(destination, output_format) as sink:
+        return sink.write_many(results)
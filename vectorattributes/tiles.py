@@ -0,0 +1,191 @@
+from vectorattributes.batch import DSMFootprintBatch
+from vectorattributes.dsmcalc import get_bounds_window
+from vectorattributes.footprint import DEFAULT_PARAMS, Footprint
+from vectorattributes.metrics import timed
+from vectorattributes.projection import reproject_many
+from vectorattributes.rasters import window_ranges
+from collections import defaultdict
+from shapely.geometry import shape as get_shape
+import numpy as np
+import shapely
+
+
+# Default edge length of a processing tile in pixels, rounded up to whole blocks of the dsm
+DEFAULT_TILE_SIZE = 2048
+# Default width of the halo beyond the ground buffer in crs units, room for the footprints reaching out of their tile
+DEFAULT_HALO_MARGIN = 50
+
+
+def ground_buffer():
+    """
+    :return: outer distance of the ground zone from the footprint, in metres
+    """
+    params = DEFAULT_PARAMS['spatial_calcs']
+    return params['ground_buffer_inner'] + params['ground_buffer_outer']
+
+
+def snap_range(start, stop, block, size):
+    """
+    :return: tuple(start, stop) of a pixel range cut at the raster edges and grown outwards to whole blocks
+    """
+    start, stop = max(start, 0), min(stop, size)
+    return start // block * block, min(-(-stop // block) * block, size)
+
+
+class TileGrid(object):
+    """
+    Grid of processing tiles over the dsm, aligned to its GeoTIFF blocks so every tile reads whole blocks
+    :param raster: the dsm
+    :param tile_size: edge length of a tile in pixels, rounded up to whole blocks
+    :param halo: width of the halo read around each tile in crs units, at least the ground buffer.  The ground buffer
+    plus DEFAULT_HALO_MARGIN if None
+    """
+    def __init__(self, raster, tile_size=DEFAULT_TILE_SIZE, halo=None):
+        if halo is None:
+            halo = ground_buffer() + DEFAULT_HALO_MARGIN
+        if halo < ground_buffer():
+            raise ValueError('The halo must be at least as wide as the ground buffer, {}'.format(ground_buffer()))
+        self.raster = raster
+        self.halo = halo
+        block_rows, block_cols = raster.block_shapes[0]
+        self.tile_rows = -(-tile_size // block_rows) * block_rows
+        self.tile_cols = -(-tile_size // block_cols) * block_cols
+        self.shape = (-(-raster.height // self.tile_rows), -(-raster.width // self.tile_cols))
+
+    def __len__(self):
+        return self.shape[0] * self.shape[1]
+
+    def tile_of(self, x, y):
+        """
+        Tile of points in the raster crs, points outside the raster are assigned to the closest tile
+        :param x: array of x coordinates
+        :param y: array of y coordinates
+        :return: int array of the row major tile index of each point
+        """
+        cols, rows = ~self.raster.transform * (np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        tile_rows = np.clip(np.floor(rows / self.tile_rows), 0, self.shape[0] - 1).astype(np.int64)
+        tile_cols = np.clip(np.floor(cols / self.tile_cols), 0, self.shape[1] - 1).astype(np.int64)
+        return tile_rows * self.shape[1] + tile_cols
+
+    def bounds(self, tile):
+        """
+        :return: tuple(minx, miny, maxx, maxy) of a tile and its halo in the raster crs
+        """
+        tile_row, tile_col = divmod(tile, self.shape[1])
+        transform = self.raster.transform
+        row_start, row_stop = tile_row * self.tile_rows, min((tile_row + 1) * self.tile_rows, self.raster.height)
+        col_start, col_stop = tile_col * self.tile_cols, min((tile_col + 1) * self.tile_cols, self.raster.width)
+        xs, ys = zip(*[transform * (col, row) for col, row in ((col_start, row_start), (col_stop, row_stop))])
+        return (min(xs) - self.halo, min(ys) - self.halo, max(xs) + self.halo, max(ys) + self.halo)
+
+
+class TileRaster(object):
+    """
+    Wraps an open raster with the first band of one tile and its halo read into memory, so the footprints of the tile
+    are sliced out of a single sequential read.  The read window is grown to whole blocks of the raster, and windows
+    that are not inside it are read from the raster.  Every other attribute is the attribute of the wrapped raster, so
+    it can be passed anywhere DSMCalc takes a rasterio dataset
+
+    :param raster: rasterio dataset or any raster with the same attributes
+    :param bounds: tuple(minx, miny, maxx, maxy) to read in the raster crs
+    """
+    def __init__(self, raster, bounds):
+        self.raster = raster
+        (row_start, row_stop), (col_start, col_stop) = get_bounds_window(raster, bounds)
+        block_rows, block_cols = raster.block_shapes[0]
+        self.rows = range(*snap_range(row_start, row_stop, block_rows, raster.height))
+        self.cols = range(*snap_range(col_start, col_stop, block_cols, raster.width))
+        self.data = self.read_tile()
+
+    def __getattr__(self, name):
+        return getattr(self.raster, name)
+
+    def __repr__(self):
+        return '<TileRaster of {!r} rows {} cols {}>'.format(self.raster, self.rows, self.cols)
+
+    @timed('read_tile')
+    def read_tile(self):
+        data = self.raster.read(1, window=((self.rows.start, self.rows.stop), (self.cols.start, self.cols.stop)))
+        data.flags.writeable = False
+        return data
+
+    def contains(self, rows, cols):
+        return (self.rows.start <= rows.start and rows.stop <= self.rows.stop and
+                self.cols.start <= cols.start and cols.stop <= self.cols.stop)
+
+    def read(self, indexes=None, window=None):
+        """
+        Read the first band like rasterio's read, a view of the tile if the window is inside it
+        :param indexes: 1, or None for a 3d array with a single band
+        :param window: tuple((row start, row stop), (col start, col stop)) or rasterio Window, the whole band if None
+        :return: array of the window
+        """
+        if indexes not in (None, 1):
+            raise ValueError('TileRaster only reads band 1')
+        rows, cols = window_ranges(window, self.raster.height, self.raster.width)
+        if self.contains(rows, cols):
+            data = self.data[rows.start - self.rows.start:rows.stop - self.rows.start,
+                             cols.start - self.cols.start:cols.stop - self.cols.start]
+        else:
+            data = self.raster.read(1, window=((rows.start, rows.stop), (cols.start, cols.stop)))
+        return data if indexes is not None else data[np.newaxis]
+
+
+def tile_rasters(rasters, bounds):
+    """
+    Wrap rasters in TileRaster objects of the same bounds.  None entries stay None and a raster passed more than once
+    is read once
+    :return: list of TileRaster objects
+    """
+    wrapped = {}
+    for raster in rasters:
+        if raster is not None and id(raster) not in wrapped:
+            wrapped[id(raster)] = TileRaster(raster, bounds)
+    return [wrapped[id(raster)] if raster is not None else None for raster in rasters]
+
+
+@timed('assign_tiles')
+def assign_tiles(grid, features, feature_crs, dsm_crs):
+    """
+    Assign every feature to the one tile that contains the centroid of its geometry
+    :param feature_crs: validated crs string of the features, Ex. 'epsg:4326'
+    :param dsm_crs: validated crs string of the dsm
+    :return: dict of tile index to the list of the indices of its features, tiles in row major order
+    """
+    if not features:
+        return {}
+    centroids = shapely.centroid(np.array([get_shape(feature['geometry']) for feature in features], dtype=object))
+    if feature_crs != dsm_crs:
+        centroids = reproject_many(centroids, from_proj=feature_crs, to_proj=dsm_crs)
+    tiles = grid.tile_of(shapely.get_x(centroids), shapely.get_y(centroids))
+    assigned = defaultdict(list)
+    for index in np.argsort(tiles, kind='stable'):
+        assigned[int(tiles[index])].append(int(index))
+    return dict(assigned)
+
+
+def process_tiles(features, feature_crs, dsm, dsm_crs, tree_dsm=None, tree_dsm_crs=None, dem=None, dem_crs=None,
+                  tile_size=DEFAULT_TILE_SIZE, halo=None, **batch_options):
+    """
+    Process a collection tile by tile.  The dsm is split into tiles aligned to its blocks, every feature belongs to the
+    tile of its centroid, and the features of a tile are processed together against one in-memory read of the tile and
+    its halo from each raster.  Tiles are visited in row major order, so the rasters are read sequentially, and memory
+    is bounded by the size of a tile
+    :param tile_size: edge length of a tile in dsm pixels, see TileGrid
+    :param halo: width of the halo in crs units, see TileGrid
+    :param batch_options: zonal, chunk_size, masked or result_cache options of DSMFootprintBatch
+    :return: generator of (input index, DSMFootprint) tuples, in tile order
+    """
+    collection = DSMFootprintBatch.get_features(features)
+    features = list(collection)
+    if feature_crs is None:
+        feature_crs = getattr(collection, 'crs', None)
+    grid = TileGrid(dsm, tile_size=tile_size, halo=halo)
+    assigned = assign_tiles(grid, features, Footprint.crs_isvalid(feature_crs), Footprint.crs_isvalid(dsm_crs))
+    for tile, indices in assigned.items():
+        tile_dsm, tile_tree_dsm, tile_dem = tile_rasters([dsm, tree_dsm, dem], grid.bounds(tile))
+        batch = DSMFootprintBatch([features[index] for index in indices], feature_crs, tile_dsm, dsm_crs,
+                                  tree_dsm=tile_tree_dsm, tree_dsm_crs=tree_dsm_crs, dem=tile_dem, dem_crs=dem_crs,
+                                  **batch_options)
+        for index, footprint in zip(indices, batch.process()):
+            yield index, footprint
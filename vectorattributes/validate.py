@@ -0,0 +1,288 @@
+"""
+Validation of DSMFootprint outputs against a reference layer of attributed buildings, Ex. a GeoDataFrame of the
+height_attributed_buildings shapefiles:
+
+    validation = validate(outputs, geopandas.read_file(reference_path), id_property='u_id')
+    print(validation.report())
+"""
+import numpy as np
+
+
+# Nodata value of the reference layer, it matches a NaN output
+REFERENCE_NODATA = -9999.0
+DEFAULT_RTOL = 0.03
+
+# Reference column to the path of the output value in the properties of DSMFootprint.output_geojson
+REFERENCE_ATTRIBUTES = {
+    'rf_max': ('calculated_properties', 'roof', 'max'),
+    'rf_min': ('calculated_properties', 'roof', 'min'),
+    'rf_med': ('calculated_properties', 'roof', 'median'),
+    'rf_std': ('calculated_properties', 'roof', 'std'),
+    'rf_count': ('calculated_properties', 'roof', 'pixel_count'),
+    'rf_minor': ('calculated_properties', 'roof', 'minor'),
+    'rf_sum': ('calculated_properties', 'roof', 'sum'),
+    'rf_range': ('calculated_properties', 'roof', 'range'),
+    'rf_mean': ('calculated_properties', 'roof', 'mean'),
+    'rf_area': ('calculated_properties', 'roof', 'area'),
+    'rf_cov': ('calculated_properties', 'roof', 'coverage'),
+    'rf_elev': ('calculated_properties', 'roof', 'elevation'),
+    'rf_mod': ('calculated_properties', 'roof', 'mode'),
+    'rf_height': ('calculated_properties', 'roof', 'height'),
+    'ev_max': ('calculated_properties', 'eave', 'max'),
+    'ev_min': ('calculated_properties', 'eave', 'min'),
+    'ev_med': ('calculated_properties', 'eave', 'median'),
+    'ev_std': ('calculated_properties', 'eave', 'std'),
+    'ev_count': ('calculated_properties', 'eave', 'pixel_count'),
+    'ev_minor': ('calculated_properties', 'eave', 'minor'),
+    'ev_sum': ('calculated_properties', 'eave', 'sum'),
+    'ev_range': ('calculated_properties', 'eave', 'range'),
+    'ev_mean': ('calculated_properties', 'eave', 'mean'),
+    'ev_area': ('calculated_properties', 'eave', 'area'),
+    'ev_cov': ('calculated_properties', 'eave', 'coverage'),
+    'ev_elev': ('calculated_properties', 'eave', 'elevation'),
+    'ev_mod': ('calculated_properties', 'eave', 'mode'),
+    'ev_height': ('calculated_properties', 'eave', 'height'),
+    'gnd_max': ('calculated_properties', 'ground', 'max'),
+    'gnd_min': ('calculated_properties', 'ground', 'min'),
+    'gnd_med': ('calculated_properties', 'ground', 'median'),
+    'gnd_std': ('calculated_properties', 'ground', 'std'),
+    'gnd_count': ('calculated_properties', 'ground', 'pixel_count'),
+    'gnd_minor': ('calculated_properties', 'ground', 'minor'),
+    'gnd_sum': ('calculated_properties', 'ground', 'sum'),
+    'gnd_range': ('calculated_properties', 'ground', 'range'),
+    'gnd_mean': ('calculated_properties', 'ground', 'mean'),
+    'gnd_area': ('calculated_properties', 'ground', 'area'),
+    'gnd_cov': ('calculated_properties', 'ground', 'coverage'),
+    'gnd_elev': ('calculated_properties', 'ground', 'elevation'),
+    'gnd_mod': ('calculated_properties', 'ground', 'mode'),
+    'clip_val': ('calculated_properties', 'height_max')
+}
+
+REFERENCE_ERRORS = {
+    'min_ev_er': ('errors', 'calculated_properties', 'min_eave'),
+    'min_rf_er': ('errors', 'calculated_properties', 'min_roof_height'),
+    'ev_gtr_er': ('errors', 'calculated_properties', 'eave_above_roof'),
+    'e_to_p_er': ('errors', 'calculated_properties', 'roof_eave_ratio'),
+    'elt_z_er': ('errors', 'footprint', 'negative_elevation'),
+    'gd_gtr_er': ('errors', 'calculated_properties', 'roof_height'),
+    'gd_gte_er': ('errors', 'calculated_properties', 'eave_height'),
+    'evtolrf_er': ('errors', 'calculated_properties', 'reset_eave_low_roof'),
+    'evtorf_er': ('errors', 'calculated_properties', 'reset_eave_normal_roof'),
+    'evtomn_er': ('errors', 'calculated_properties', 'reset_eave_to_min'),
+    'rf_elev_er': ('errors', 'calculated_properties', 'roof_elevation'),
+    'rf_hgt_er': ('errors', 'calculated_properties', 'max_roof_height'),
+    'q4_rng_er': ('errors', 'footprint', 'comparison_factor_exceeded'),
+    'dsm_null': ('errors', 'footprint', 'dsm_null')
+}
+
+# Reference column to the path of the output value and the output value of each reference code
+REFERENCE_CATEGORIES = {
+    'rf_shp': (('calculated_properties', 'roof', 'pitch'), {2: 'steep or high complexity', 1: 'moderate', 0: 'flat'})
+}
+
+# Marks a value missing from an output
+MISSING = object()
+
+# Relative tolerance of the attributes that differ from DEFAULT_RTOL
+TOLERANCES = {
+    'rf_std': 0.15,
+    'ev_std': 0.15,
+    'gnd_std': 0.15,
+    'clip_val': 0.05
+}
+
+
+def get_path(properties, path, default=None):
+    """
+    :return: value of a nested key path of a dict, default if it is missing
+    """
+    for key in path:
+        if not isinstance(properties, dict) or key not in properties:
+            return default
+        properties = properties[key]
+    return properties
+
+
+def result_column_name(path):
+    """
+    :return: name of the columns.ResultColumns column of an output path
+    """
+    if path[0] == 'errors':
+        return 'error_' + path[-1]
+    return '_'.join(path[1:])
+
+
+class OutputTable(object):
+    """
+    Columns of the outputs to validate, read once per path
+    :param outputs: DSMFootprint.output_geojson() features, a FeatureCollection of them or a columns.ResultColumns
+    :param id_property: original property that identifies a building
+    """
+    def __init__(self, outputs, id_property):
+        if hasattr(outputs, 'columns'):
+            self.columns = outputs.columns()
+            self.properties = None
+            self.ids = self.columns[id_property]
+        else:
+            if isinstance(outputs, dict):
+                outputs = outputs['features']
+            self.columns = {}
+            self.properties = [feature['properties'] for feature in outputs]
+            self.ids = np.array([properties['original_properties'].get(id_property)
+                                 for properties in self.properties], dtype=object)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, path, dtype):
+        """
+        :return: numpy array of the output value of every building, NaN or None where it is missing.  None if no
+        output has the value, Ex. a statistic DSMFootprint does not calculate
+        """
+        if self.properties is None:
+            column = self.columns.get(result_column_name(path))
+            return np.asarray(column, dtype=dtype) if column is not None else None
+        if path not in self.columns:
+            values = [get_path(properties, path, MISSING) for properties in self.properties]
+            if values and all(value is MISSING for value in values):
+                self.columns[path] = None
+            else:
+                self.columns[path] = np.array([None if value is MISSING else value for value in values], dtype=dtype)
+        return self.columns[path]
+
+
+class Validation(object):
+    """
+    Comparison of the outputs with the reference, one row per reference building
+    :param ids: ids of the reference buildings
+    :param missing: mask of the reference buildings without an output
+    :param mismatches: dict of reference column to the mask of the buildings whose output does not match
+    :param unreferenced: number of outputs whose id is not in the reference
+    """
+    def __init__(self, ids, missing, mismatches, unreferenced):
+        self.ids = ids
+        self.missing = missing
+        self.mismatches = mismatches
+        self.unreferenced = unreferenced
+
+    def __len__(self):
+        return len(self.ids)
+
+    def any_mismatch(self):
+        """
+        :return: mask of the reference buildings with a mismatch in any column
+        """
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for mismatch in self.mismatches.values():
+            mask |= mismatch
+        return mask
+
+    def summary(self):
+        """
+        :return: list of dicts of column, count of mismatches and their percentage of the compared buildings, for
+        the columns with mismatches, most mismatches first
+        """
+        compared = int((~self.missing).sum())
+        rows = [{'column': column, 'count': int(mismatch.sum()),
+                 'percentage': mismatch.sum() * 100. / compared if compared else np.NaN}
+                for column, mismatch in self.mismatches.items() if mismatch.any()]
+        return sorted(rows, key=lambda row: (-row['count'], row['column']))
+
+    def report(self):
+        """
+        :return: text table of the summary and the counts of missing and unreferenced buildings
+        """
+        lines = ['{:<12} {:>8} {:>12}'.format('column', 'count', 'percentage')]
+        for row in self.summary():
+            lines.append('{column:<12} {count:>8} {percentage:>12.2f}'.format(**row))
+        lines.append('{} of {} reference buildings mismatched, {} without an output, {} outputs not in the '
+                     'reference'.format(int(self.any_mismatch().sum()), len(self), int(self.missing.sum()),
+                                        self.unreferenced))
+        return '\n'.join(lines)
+
+
+def join_ids(reference_ids, output_ids):
+    """
+    Hash join of the reference buildings to the outputs by id, the last output of a repeated id is used
+    :return: numpy array of the output index of each reference building, -1 if it has no output
+    """
+    index = {output_id: position for position, output_id in enumerate(output_ids)}
+    return np.fromiter((index.get(reference_id, -1) for reference_id in reference_ids), dtype=np.int64,
+                       count=len(reference_ids))
+
+
+def attribute_mismatches(reference, output, rtol):
+    """
+    A NaN output matches a nodata reference value, any other value matches within the relative tolerance
+    :return: mask of the mismatched values
+    """
+    reference_nodata = np.isnan(reference) | (reference == REFERENCE_NODATA)
+    output_nan = np.isnan(output)
+    with np.errstate(invalid='ignore'):
+        close = np.isclose(reference, output, rtol=rtol)
+    return np.where(output_nan, ~reference_nodata, ~close)
+
+
+def reference_columns(reference):
+    """
+    :return: set of the column names of a reference table
+    """
+    if getattr(reference, 'dtype', None) is not None and reference.dtype.names is not None:
+        return set(reference.dtype.names)
+    return set(reference.keys())
+
+
+def validate(outputs, reference, id_property='u_id', reference_id=None, attributes=REFERENCE_ATTRIBUTES,
+             errors=REFERENCE_ERRORS, categories=REFERENCE_CATEGORIES, tolerances=TOLERANCES, rtol=DEFAULT_RTOL):
+    """
+    Join the outputs to a reference layer by building id and compare their attributes, errors and categories.  The
+    columns are compared with vectorized numpy operations, columns missing from the reference or from every output are
+    skipped
+    :param outputs: DSMFootprint.output_geojson() features, a FeatureCollection of them or a columns.ResultColumns
+    with the id property kept
+    :param reference: table of the reference buildings indexable by column name, Ex. a DataFrame, a dict of arrays or
+    a numpy structured array
+    :param id_property: original property of the outputs that identifies a building
+    :param reference_id: id column of the reference, id_property if None
+    :param attributes: dict of reference column to output path compared within a relative tolerance
+    :param errors: dict of reference column to output path of error flags compared exactly
+    :param categories: dict of reference column to tuple(output path, dict of reference code to output value)
+    :param tolerances: dict of reference column to relative tolerance, rtol for the other attributes
+    :return: Validation
+    """
+    table = OutputTable(outputs, id_property)
+    reference_ids = np.asarray(reference[reference_id or id_property], dtype=object)
+    positions = join_ids(reference_ids, table.ids)
+    missing = positions < 0
+    referenced = np.zeros(len(table), dtype=bool)
+    referenced[positions[~missing]] = True
+    columns = reference_columns(reference)
+
+    def joined(path, dtype):
+        # output values aligned with the reference rows, missing outputs are NaN or None.  None if no output has the
+        # value, the reference column is then skipped
+        column = table.column(path, dtype)
+        if column is None:
+            return None
+        output = np.full(len(positions), np.NaN if dtype is np.float64 else None, dtype=dtype)
+        output[~missing] = column[positions[~missing]]
+        return output
+
+    mismatches = {}
+    for column, path in attributes.items():
+        output = joined(path, np.float64) if column in columns else None
+        if output is not None:
+            mismatches[column] = attribute_mismatches(np.asarray(reference[column], dtype=np.float64), output,
+                                                      tolerances.get(column, rtol))
+    for column, path in errors.items():
+        output = joined(path, object) if column in columns else None
+        if output is not None:
+            mismatches[column] = np.asarray(reference[column]).astype(bool) != output.astype(bool)
+    for column, (path, values) in categories.items():
+        output = joined(path, object) if column in columns else None
+        if output is not None:
+            expected = np.array([values.get(code) for code in np.asarray(reference[column]).tolist()], dtype=object)
+            mismatches[column] = expected != output
+    for column in mismatches:
+        mismatches[column] &= ~missing
+    return Validation(reference_ids, missing, mismatches, int((~referenced).sum()))
@@ -0,0 +1,439 @@
+from vectorattributes.dsmcalc import DEFAULT_PARAMS, PERCENTILES, RasterWindow, factory, get_bounds_window
+from vectorattributes.metrics import timed
+from vectorattributes.records import ZoneStats
+from shapely.geometry.base import BaseGeometry, BaseMultipartGeometry
+from affine import Affine
+import rasterio.features
+import shapely.geometry
+import numpy as np
+
+
+ZONES = ('null', 'footprint', 'ground', 'eave', 'roof')
+
+
+class ZoneResult(object):
+    """
+    Values and errors of a single zone calculated with the zonal statistics.  values and errors have the same layout as
+    DSMCalc.values and DSMCalc.errors, so a ZoneResult can be used wherever the DSMCalc of the zone would be.  If the
+    DSMCalc of the zone would have raised, the exception is kept and values and errors are None
+    """
+    def __init__(self, values=None, errors=None, exception=None):
+        self.values = values
+        self.errors = errors
+        self.exception = exception
+
+
+class GroupedValues(object):
+    """
+    Pixel values of many zones held in one array sorted by zone label and then by value.  Each zone is a contiguous run
+    of the array, so grouped reductions are single numpy calls and order statistics are read straight from the array
+    """
+    def __init__(self, labels, values, zone_count, presorted=False):
+        """
+        :param labels: integer zone label of each pixel, from 0 to zone_count - 1
+        :param values: value of each pixel, kept in the raster dtype so percentiles and medians match numpy on the
+        raster
+        :param zone_count: number of zones, zones without pixels are allowed
+        :param presorted: True if labels and values are already sorted by label and value
+        """
+        if not presorted:
+            order = np.lexsort((values, labels))
+            labels, values = labels[order], values[order]
+        self.labels = labels
+        self.values = values
+        self.zone_count = zone_count
+        self.counts = np.bincount(labels, minlength=zone_count)
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    def select(self, keep):
+        """
+        :param keep: boolean array, True for the pixels to keep
+        :return: GroupedValues of the kept pixels, removing pixels keeps the sort order
+        """
+        return GroupedValues(self.labels[keep], self.values[keep], self.zone_count, presorted=True)
+
+    def subset(self, start, stop):
+        """
+        :return: GroupedValues of the zones with labels start to stop - 1, relabelled from 0
+        """
+        first, last = np.searchsorted(self.labels, [start, stop])
+        return GroupedValues(self.labels[first:last] - start, self.values[first:last], stop - start, presorted=True)
+
+    def count(self, condition):
+        """
+        :return: number of pixels of each zone where condition is True
+        """
+        return np.bincount(self.labels, weights=condition, minlength=self.zone_count).astype(int)
+
+    def sum(self):
+        return np.bincount(self.labels, weights=self.values, minlength=self.zone_count)
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum() / self.counts
+
+    def std(self):
+        """
+        Population standard deviation of each zone from the squared deviations to the zone mean
+        """
+        deviation = self.values - self.mean()[self.labels]
+        squares = np.bincount(self.labels, weights=deviation * deviation, minlength=self.zone_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(squares / self.counts)
+
+    def reduce(self, ufunc):
+        """
+        :param ufunc: numpy ufunc such as np.minimum or np.maximum
+        :return: reduction of each zone with ufunc.reduceat, NaN for zones without pixels
+        """
+        reduced = np.full(self.zone_count, np.NaN)
+        filled = self.counts > 0
+        if filled.any():
+            reduced[filled] = ufunc.reduceat(self.values, self.starts[filled])
+        return reduced
+
+    def percentile(self, q):
+        """
+        Percentile of each zone using the same linear interpolation as np.percentile
+        :return: percentile of each zone, NaN for zones without pixels
+        """
+        percentiles = np.full(self.zone_count, np.NaN)
+        filled = self.counts > 0
+        counts, starts = self.counts[filled], self.starts[filled]
+        virtual_index = (q / 100.) * (counts - 1)
+        below = np.floor(virtual_index).astype(int)
+        fraction = virtual_index - below
+        lower = self.values[starts + below]
+        upper = self.values[starts + np.minimum(below + 1, counts - 1)]
+        difference = upper - lower
+        percentiles[filled] = np.where(fraction >= 0.5, upper - difference * (1 - fraction),
+                                       lower + difference * fraction)
+        return percentiles
+
+    def median(self):
+        """
+        :return: median of each zone, NaN for zones without pixels
+        """
+        medians = np.full(self.zone_count, np.NaN)
+        filled = self.counts > 0
+        counts, starts = self.counts[filled], self.starts[filled]
+        medians[filled] = (self.values[starts + (counts - 1) // 2] + self.values[starts + counts // 2]) / 2
+        return medians
+
+    def modes(self):
+        """
+        Most and least common value of each zone from the runs of equal values in the sorted array, ties go to the
+        lowest value
+        :return: tuple(mode, minority) of each zone, NaN for zones without pixels
+        """
+        modes = np.full(self.zone_count, np.NaN)
+        minorities = np.full(self.zone_count, np.NaN)
+        if self.values.size == 0:
+            return modes, minorities
+        run_starts = np.flatnonzero(np.concatenate(([True], (self.labels[1:] != self.labels[:-1]) |
+                                                    (self.values[1:] != self.values[:-1]))))
+        run_lengths = np.diff(np.append(run_starts, self.values.size))
+        run_labels = self.labels[run_starts]
+        run_values = self.values[run_starts]
+        for out, length_key in ((modes, -run_lengths), (minorities, run_lengths)):
+            order = np.lexsort((run_values, length_key, run_labels))
+            ordered_labels = run_labels[order]
+            first = np.concatenate(([True], ordered_labels[1:] != ordered_labels[:-1]))
+            out[ordered_labels[first]] = run_values[order][first]
+        return modes, minorities
+
+
+class ZoneSet(object):
+    """
+    The grouped pixel values of a range of zones of a ZoneLabels together with the per zone information
+    calculate_zones needs
+    """
+    def __init__(self, grouped, exceptions, nonpositive, zone_pixels, pixel_area):
+        """
+        :param grouped: GroupedValues of the zones
+        :param exceptions: exception per zone from ZoneLabels.check_geometry
+        :param nonpositive: boolean per zone, True if the pixel window of the zone holds values of zero or below
+        :param zone_pixels: number of pixels touching each zone, masked or not
+        :param pixel_area: number of pixels per m^2, as DSMCalc.get_pixel_area
+        """
+        self.grouped = grouped
+        self.exceptions = exceptions
+        self.nonpositive = nonpositive
+        self.zone_pixels = zone_pixels
+        self.pixel_area = pixel_area
+
+
+class ZoneLabels(object):
+    """
+    Burns many zones into label rasters over one shared read of the raster and groups the unmasked pixel values of
+    every zone.  The zones are spread over as few label layers as possible, such that the pixel windows of the zones
+    in one layer never overlap, so each layer takes a single rasterize call however many zones it holds.  Pixels are
+    selected the same way as in DSMCalc.mask_dsm (all touched pixels within the pixel window of the zone).
+    """
+    def __init__(self, raster, geometries):
+        """
+        :param raster: src object of raster already opened by rasterio or another i/o library
+        :param geometries: list of shapely geometries, the zone label of a geometry is its index in the list
+        """
+        self.raster = raster
+        self.geometries = geometries
+        self.exceptions = [self.check_geometry(geom) for geom in geometries]
+        covered = [geom for geom, exception in zip(geometries, self.exceptions) if exception is None]
+        self.raster_window = RasterWindow(raster, covered)
+        self.windows = [get_bounds_window(raster, geom.bounds) if exception is None else None
+                        for geom, exception in zip(geometries, self.exceptions)]
+        self.grouped, self.zone_pixels = self.group_values()
+        # DSMCalc.mask_low_elevations looks at the whole pixel window of the zone, masked pixels included
+        self.nonpositive = self.window_count(lambda data: data.data <= 0) > 0
+
+    def check_geometry(self, geometry):
+        """
+        Run the input checks of DSMCalc on a geometry
+        :return: the exception DSMCalc would raise for the geometry, None if the geometry can be processed
+        """
+        if not isinstance(geometry, (BaseGeometry, BaseMultipartGeometry)):
+            return TypeError('DSMCalc input geometry is not a shapely geometry based object')
+        if geometry.is_valid is False:
+            return ValueError('Input vector is not valid')
+        if geometry.is_empty or not shapely.geometry.box(*self.raster.bounds).contains(geometry):
+            return ValueError('Footprint not contained in dsm area')
+        return None
+
+    def zone_set(self, start=0, stop=None):
+        """
+        :return: ZoneSet of the zones with labels start to stop - 1
+        """
+        if stop is None:
+            stop = len(self.geometries)
+        pixel_size_x, pixel_size_y = self.raster.res
+        return ZoneSet(self.grouped.subset(start, stop), self.exceptions[start:stop], self.nonpositive[start:stop],
+                       self.zone_pixels[start:stop], 1 / (pixel_size_x * pixel_size_y))
+
+    def local_window(self, window):
+        """
+        :return: tuple(row slice, col slice) of a raster window in the shared read
+        """
+        row_offset, col_offset = self.raster_window.window[0][0], self.raster_window.window[1][0]
+        return (slice(window[0][0] - row_offset, window[0][1] - row_offset),
+                slice(window[1][0] - col_offset, window[1][1] - col_offset))
+
+    def window_count(self, condition):
+        """
+        Count the pixels of each zone window where a condition holds from a summed area table of the shared read
+        :param condition: function of the masked array of the shared read returning a boolean array
+        :return: count per zone, 0 for zones that are not covered
+        """
+        counts = np.zeros(len(self.windows), dtype=np.int64)
+        if self.raster_window.data is None:
+            return counts
+        table = np.zeros((self.raster_window.data.shape[0] + 1, self.raster_window.data.shape[1] + 1), dtype=np.int64)
+        table[1:, 1:] = np.cumsum(np.cumsum(condition(self.raster_window.data), axis=0), axis=1)
+        for label, window in enumerate(self.windows):
+            if window is not None:
+                rows, cols = self.local_window(window)
+                counts[label] = (table[rows.stop, cols.stop] - table[rows.start, cols.stop] -
+                                 table[rows.stop, cols.start] + table[rows.start, cols.start])
+        return counts
+
+    def assign_layers(self):
+        """
+        Greedily place every zone in the first layer where its pixel window, grown by one pixel, does not overlap
+        another zone.  The margin keeps all touched pixels just outside a window from overwriting a neighbouring zone
+        :return: list of layers, each a list of zone labels
+        """
+        layers = []
+        occupancy = []
+        for label, window in enumerate(self.windows):
+            if window is None:
+                continue
+            rows, cols = self.local_window(window)
+            rows, cols = slice(max(rows.start - 1, 0), rows.stop + 1), slice(max(cols.start - 1, 0), cols.stop + 1)
+            free = [index for index, occupied in enumerate(occupancy) if not occupied[rows, cols].any()]
+            if free:
+                index = free[0]
+            else:
+                index = len(layers)
+                layers.append([])
+                occupancy.append(np.zeros(self.raster_window.data.shape, dtype=bool))
+            layers[index].append(label)
+            occupancy[index][rows, cols] = True
+        return layers
+
+    def group_values(self):
+        """
+        Rasterize each label layer and collect the unmasked pixels inside the window of their zone
+        :return: tuple(GroupedValues of all zones, number of pixels touching each zone)
+        """
+        zone_pixels = np.zeros(len(self.geometries), dtype=np.int64)
+        labels = [np.zeros(0, dtype=np.int64)]
+        values = [np.zeros(0, dtype=np.float64)]
+        if self.raster_window.data is not None:
+            data = self.raster_window.data
+            values = [np.zeros(0, dtype=data.dtype)]
+            valid = ~np.ma.getmaskarray(data)
+            t = self.raster.transform
+            row_offset, col_offset = self.raster_window.window[0][0], self.raster_window.window[1][0]
+            shifted_affine = Affine(t.a, t.b, t.c + col_offset * t.a, t.d, t.e, t.f + row_offset * t.e)
+            limits = np.zeros((len(self.windows), 4), dtype=np.int64)
+            for label, window in enumerate(self.windows):
+                if window is not None:
+                    rows, cols = self.local_window(window)
+                    limits[label] = rows.start, rows.stop, cols.start, cols.stop
+            for layer in self.assign_layers():
+                burned = rasterio.features.rasterize(
+                    [(self.geometries[label], label + 1) for label in layer],
+                    out_shape=data.shape,
+                    transform=shifted_affine,
+                    fill=0,
+                    all_touched=True,
+                    dtype=np.int32)
+                rows, cols = np.nonzero(burned)
+                layer_labels = burned[rows, cols].astype(np.int64) - 1
+                zone_limits = limits[layer_labels]
+                inside = ((rows >= zone_limits[:, 0]) & (rows < zone_limits[:, 1]) &
+                          (cols >= zone_limits[:, 2]) & (cols < zone_limits[:, 3]))
+                zone_pixels += np.bincount(layer_labels[inside], minlength=len(self.geometries))
+                inside &= valid[rows, cols]
+                labels.append(layer_labels[inside])
+                values.append(data.data[rows[inside], cols[inside]])
+        return GroupedValues(np.concatenate(labels), np.concatenate(values), len(self.geometries)), zone_pixels
+
+
+def round_or_nan(value):
+    if np.isnan(value):
+        return np.NaN
+    return round(float(value), 5)
+
+
+def calculate_zones(zone_set, find_nulls_only=False, test_dist=False, height_max=None, tree_masked_dsm=False):
+    """
+    Vectorized version of DSMCalc and DSMFootprint.full_dsm_operations for many zones at once: the null check, masking
+    of low elevations, comparison factor (if test_dist), clipping to the maximum height and the zone statistics.
+    Sums are accumulated in float64, so values can differ from DSMCalc in the last digits of float32 rasters
+    :param zone_set: ZoneSet of the zones
+    :param height_max: maximum height of each zone, for clipping
+    :return: list of ZoneResult, one per zone
+    """
+    params = DEFAULT_PARAMS['dsm_calc']
+    grouped = zone_set.grouped
+    nonpositive = zone_set.nonpositive
+    if height_max is None:
+        height_max = np.full(grouped.zone_count, np.NaN)
+    height_max = np.array(height_max, dtype=np.float64)
+    exceptions = list(zone_set.exceptions)
+
+    # null_data_error
+    pixel_count = grouped.counts
+    count_nodata = grouped.count(grouped.values == params['dsm_nodata'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dsm_null = (pixel_count > 0) & (count_nodata / pixel_count >= 0.05)
+    for label, exception in enumerate(exceptions):
+        if exception is None and pixel_count[label] < 1:
+            exceptions[label] = ValueError('Footprint area was found to be fully masked')
+    errors = [factory()['find_nulls_only' if find_nulls_only else 'all'] for _ in exceptions]
+    for label, error in enumerate(errors):
+        error['dsm_null'] = bool(dsm_null[label])
+    if find_nulls_only:
+        return [ZoneResult(ZoneStats({"tree_masked_dsm": tree_masked_dsm, "pixel_count": int(pixel_count[label]),
+                                      "height_max": height_max[label]}), errors[label]) if exception is None
+                else ZoneResult(exception=exception) for label, exception in enumerate(exceptions)]
+
+    # mask_low_elevations
+    grouped = grouped.select(~(nonpositive[grouped.labels] & (grouped.values < params['min_elevation'])))
+
+    # comparison_factor
+    comparison_factors = [None] * grouped.zone_count
+    exceeded = np.zeros(grouped.zone_count, dtype=bool)
+    if test_dist:
+        p_100, p_75, p_25 = grouped.percentile(100), grouped.percentile(75), grouped.percentile(25)
+        q4r = p_100 - p_75
+        iqr = p_75 - p_25
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.where((q4r > 0) & (iqr > 0), q4r / iqr, np.NaN)
+        for label in np.nonzero(grouped.counts > 1)[0]:
+            comparison_factors[label] = round_or_nan(ratio[label]) if np.isfinite(ratio[label]) else np.NaN
+            exceeded[label] = comparison_factors[label] >= params['max_comparison_factor']
+        if exceeded.any():
+            labels = grouped.labels
+            top_quartile = exceeded[labels] & (grouped.values <= p_100[labels]) & (grouped.values >= p_75[labels])
+            medians = grouped.select(top_quartile).median()
+            height_max[exceeded] = [round_or_nan(median) for median in medians[exceeded]]
+
+    # clip_max_heights
+    grouped = grouped.select(~(grouped.values > height_max[grouped.labels]))
+
+    # calculate_stats
+    stats = {'min': grouped.reduce(np.minimum), 'max': grouped.reduce(np.maximum), 'mean': grouped.mean(),
+             'sum': grouped.sum(), 'std': grouped.std(), 'median': grouped.median()}
+    percentiles = {name: grouped.percentile(q) for name, q in PERCENTILES}
+    modes, minorities = grouped.modes()
+    results = []
+    for label, exception in enumerate(exceptions):
+        if exception is not None:
+            results.append(ZoneResult(exception=exception))
+            continue
+        count = int(grouped.counts[label])
+        values = ZoneStats({"tree_masked_dsm": tree_masked_dsm, "pixel_count": count, "height_max": height_max[label]})
+        if comparison_factors[label] is not None:
+            values['comparison_factor'] = comparison_factors[label]
+        if count == 0:
+            values.update({'min': np.NaN, 'max': np.NaN, 'mean': np.NaN, 'sum': np.NaN, 'median': np.NaN,
+                           '10th_perc': np.NaN, '25th_perc': np.NaN, '75th_perc': np.NaN, '90th_perc': np.NaN,
+                           'std': np.NaN, 'range': np.NaN, 'mode': np.NaN, 'minor': np.NaN})
+        else:
+            values.update({name: round_or_nan(stat[label]) for name, stat in stats.items()})
+            if count == 1:
+                values['std'] = 0
+            values.update({name: percentile[label] if count > 1 else np.NaN
+                           for name, percentile in percentiles.items()})
+            values['range'] = round_or_nan(stats['max'][label] - stats['min'][label]) if count > 1 else 0
+            values['mode'] = round_or_nan(modes[label])
+            values['minor'] = round_or_nan(minorities[label])
+        values['area'] = round(count / zone_set.pixel_area, 5)
+        values['coverage'] = round(count / int(zone_set.zone_pixels[label]), 5)
+        errors[label]['negative_elevation'] = bool(nonpositive[label])
+        errors[label]['comparison_factor_exceeded'] = bool(exceeded[label])
+        results.append(ZoneResult(values, errors[label]))
+    return results
+
+
+@timed('zonal_stats')
+def footprint_zone_calcs(footprints, dsm, tree_dsm=None, dem=None):
+    """
+    Calculate the zones of many DSMFootprint objects (created with calculate=False) together.  Every raster is read
+    once and rasterized into label layers once for all zones calculated from it, instead of once per zone and footprint
+    :param footprints: list of DSMFootprint objects
+    :return: list of dicts of zone name to ZoneResult, one per footprint, to pass to DSMFootprint.calculate
+    """
+    surface_model = tree_dsm if tree_dsm else dsm
+    height_model = dem if dem else dsm
+    zone_rasters = {'null': dsm, 'footprint': surface_model, 'ground': height_model, 'eave': surface_model,
+                    'roof': surface_model}
+    zone_geometries = {'null': [footprint.footprint for footprint in footprints],
+                       'footprint': [footprint.footprint for footprint in footprints],
+                       'ground': [footprint.footprint_ground for footprint in footprints],
+                       'eave': [footprint.footprint_eave for footprint in footprints],
+                       'roof': [footprint.footprint_roof for footprint in footprints]}
+    # the null check reads the same pixels as the footprint when both come from the dsm
+    shared_null = zone_rasters['null'] is zone_rasters['footprint']
+
+    # one ZoneLabels per raster holding every zone calculated from it
+    zone_sets = {}
+    for raster in {id(raster): raster for raster in zone_rasters.values()}.values():
+        zones = [zone for zone in ZONES if zone_rasters[zone] is raster and not (zone == 'null' and shared_null)]
+        zone_labels = ZoneLabels(raster, [geom for zone in zones for geom in zone_geometries[zone]])
+        for index, zone in enumerate(zones):
+            zone_sets[zone] = zone_labels.zone_set(index * len(footprints), (index + 1) * len(footprints))
+    if shared_null:
+        zone_sets['null'] = zone_sets['footprint']
+
+    results = {'null': calculate_zones(zone_sets['null'], find_nulls_only=True),
+               'footprint': calculate_zones(zone_sets['footprint'], test_dist=True,
+                                            tree_masked_dsm=surface_model is tree_dsm)}
+    height_max = [result.values['height_max'] if result.exception is None else np.NaN
+                  for result in results['footprint']]
+    results['ground'] = calculate_zones(zone_sets['ground'], height_max=height_max)
+    for zone in ('eave', 'roof'):
+        results[zone] = calculate_zones(zone_sets[zone], height_max=height_max,
+                                        tree_masked_dsm=surface_model is tree_dsm)
+    return [{zone: results[zone][index] for zone in ZONES} for index in range(len(footprints))]